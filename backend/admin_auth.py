@@ -0,0 +1,19 @@
+"""
+Admin token check shared by the /api/admin endpoints and the per-request
+profiler, so both accept exactly the same X-Admin-Token.
+"""
+
+import hmac
+import os
+from typing import Optional
+
+# Environment variables
+# Unset disables every admin endpoint
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+
+
+def is_admin_token(token: Optional[str]) -> bool:
+    """Whether `token` is the configured admin token (constant-time comparison)"""
+    if not ADMIN_TOKEN or not token:
+        return False
+    return hmac.compare_digest(token, ADMIN_TOKEN)
@@ -0,0 +1,189 @@
+"""
+Fee and revenue analytics for a gym
+Member fields are pulled with a projected, large-batch cursor straight into
+DataFrame columns, and expected revenue, mid-month proration and overdue
+aging are computed with vectorized pandas/NumPy operations instead of
+per-member Python loops. Results are cached per gym per day.
+"""
+
+import asyncio
+from datetime import date, datetime
+from typing import Dict, Optional
+from zoneinfo import ZoneInfo
+
+import numpy as np
+import pandas as pd
+
+from billing import BILLING_TIMEZONE, current_period, members_collection_name
+from cache import cache, gym_key
+
+ANALYTICS_BATCH_SIZE = 10000
+ANALYTICS_CACHE_TTL = 24 * 3600
+
+MEMBER_COLUMNS = [
+    "id",
+    "joining_date",
+    "is_active",
+    "fee_status",
+    "current_month_fee",
+    "billing_period",
+    "paid_period",
+    "unpaid_since",
+]
+MEMBER_PROJECTION = {"_id": 0, **{column: 1 for column in MEMBER_COLUMNS}}
+
+# Overdue aging buckets: days since the first unpaid month started
+AGING_BUCKETS = [("0-30", 30), ("31-60", 60), ("61-90", 90), ("90+", None)]
+
+
+async def load_members_frame(db, gym_id: str) -> pd.DataFrame:
+    """Projected member columns for a gym, one cursor batch at a time"""
+    cursor = db[members_collection_name(gym_id)].find(
+        {}, MEMBER_PROJECTION, batch_size=ANALYTICS_BATCH_SIZE
+    )
+    frames = []
+    while True:
+        batch = await cursor.to_list(length=ANALYTICS_BATCH_SIZE)
+        if not batch:
+            break
+        frames.append(pd.DataFrame.from_records(batch, columns=MEMBER_COLUMNS))
+
+    if not frames:
+        return pd.DataFrame(columns=MEMBER_COLUMNS)
+    return pd.concat(frames, ignore_index=True)
+
+
+def period_index(periods: pd.Series) -> np.ndarray:
+    """Months since year 0 for "YYYY-MM" strings (NaN where missing)"""
+    # Only a handful of distinct periods: parse each once, then broadcast
+    codes, uniques = pd.factorize(periods)
+    parsed = np.array(
+        [int(period[:4]) * 12 + int(period[5:7]) - 1 for period in uniques] + [np.nan], dtype=float
+    )
+    return parsed[codes]
+
+
+def parse_dates(values: pd.Series) -> np.ndarray:
+    """ISO date strings to datetime64[D] (NaT where missing), parsing each distinct date once"""
+    codes, uniques = pd.factorize(values)
+    parsed = pd.to_datetime(pd.Index(uniques, dtype=object), format="%Y-%m-%d", errors="coerce")
+    # code -1 (missing) picks the trailing NaT
+    parsed = np.append(parsed.to_numpy(dtype="datetime64[D]"), np.datetime64("NaT", "D"))
+    return parsed[codes]
+
+
+def month_index(dates: np.ndarray) -> np.ndarray:
+    """Months since year 0 for datetime64 dates (NaN where NaT)"""
+    months = dates.astype("datetime64[M]").astype(float) + 1970 * 12
+    return np.where(np.isnat(dates), np.nan, months)
+
+
+def month_start(indexes: np.ndarray) -> np.ndarray:
+    """First day (datetime64[D]) of each month index"""
+    return (indexes.astype(np.int64) - 1970 * 12).astype("datetime64[M]").astype("datetime64[D]")
+
+
+def prorated_fees(monthly_fee: float, joining_dates: np.ndarray) -> np.ndarray:
+    """Vectorized calculate_prorated_fee for datetime64[D] joining dates"""
+    months = joining_dates.astype("datetime64[M]")
+    day = (joining_dates - months.astype("datetime64[D]")).astype(float) + 1
+    days_in_month = ((months + 1).astype("datetime64[D]") - months.astype("datetime64[D]")).astype(float)
+    amounts = np.round(monthly_fee / days_in_month * (days_in_month - day + 1), 2)
+    return np.where(day == 1, 0.0, amounts)
+
+
+def compute_gym_analytics(frame: pd.DataFrame, monthly_fee: float, period: str, today: date) -> Dict:
+    """Expected revenue, proration and overdue aging for one gym's members"""
+    current_index = int(period[:4]) * 12 + int(period[5:7]) - 1
+
+    active = frame["is_active"].to_numpy() == True  # noqa: E712 (missing counts as inactive)
+    joining = parse_dates(frame["joining_date"])
+    joining_index = month_index(joining)
+    billing_index = period_index(frame["billing_period"])
+    paid_index = period_index(frame["paid_period"])
+    current_fee = pd.to_numeric(frame["current_month_fee"], errors="coerce").fillna(monthly_fee).to_numpy()
+
+    # Members not rolled over yet owe the full monthly fee for this period
+    fee_due = np.where(billing_index == current_index, current_fee, monthly_fee)
+    # Members written before billing periods existed only have fee_status
+    legacy = np.isnan(billing_index)
+    paid = paid_index == current_index
+    if legacy.any():
+        paid = np.where(legacy, frame["fee_status"].to_numpy() == "paid", paid)
+
+    expected = fee_due[active].sum()
+    collected = fee_due[active & paid].sum()
+
+    # Mid-month joiners this period
+    joined_now = active & (joining_index == current_index)
+    joiner_fees = prorated_fees(monthly_fee, joining[joined_now])
+    mid_month = joiner_fees > 0
+
+    # Overdue aging for active unpaid members: the first unpaid month is the one
+    # after their last paid period. Without a paid period it is their joining
+    # month, or for members migrated while unpaid the unpaid_since month
+    # recorded at migration (never before they joined).
+    unpaid = active & ~paid
+    unpaid_since_index = period_index(frame["unpaid_since"])
+    never_paid_from = np.fmax(np.where(np.isnan(unpaid_since_index), joining_index, unpaid_since_index), joining_index)
+    first_unpaid = np.where(np.isnan(paid_index), never_paid_from, paid_index + 1)
+    first_unpaid = np.where(legacy | np.isnan(first_unpaid), current_index, first_unpaid)
+    first_unpaid = np.minimum(first_unpaid, current_index)[unpaid].astype(int)
+
+    days_overdue = (np.datetime64(today, "D") - month_start(first_unpaid)).astype(np.int64)
+    months_unpaid = current_index - first_unpaid + 1
+    outstanding = fee_due[unpaid] + (months_unpaid - 1) * monthly_fee
+
+    bucket_edges = [limit for _, limit in AGING_BUCKETS if limit is not None]
+    bucket_of = np.digitize(days_overdue, bucket_edges, right=True)
+    counts = np.bincount(bucket_of, minlength=len(AGING_BUCKETS))
+    amounts = np.bincount(bucket_of, weights=outstanding, minlength=len(AGING_BUCKETS))
+
+    active_count = int(active.sum())
+    paid_count = int((active & paid).sum())
+    return {
+        "period": period,
+        "as_of": today.isoformat(),
+        "members": {
+            "total": len(frame),
+            "active": active_count,
+            "paid": paid_count,
+            "unpaid": active_count - paid_count,
+        },
+        "revenue": {
+            "expected": round(float(expected), 2),
+            "collected": round(float(collected), 2),
+            "outstanding": round(float(expected - collected), 2),
+            "collection_rate": round(paid_count / active_count, 4) if active_count else 0.0,
+            "next_period_expected": round(active_count * monthly_fee, 2),
+        },
+        "proration": {
+            "mid_month_joiners": int(mid_month.sum()),
+            "prorated_amount": round(float(joiner_fees[mid_month].sum()), 2),
+            "full_fee_amount": round(float(mid_month.sum() * monthly_fee), 2),
+        },
+        "overdue_aging": [
+            {"bucket": name, "members": int(counts[i]), "amount": round(float(amounts[i]), 2)}
+            for i, (name, _) in enumerate(AGING_BUCKETS)
+        ],
+    }
+
+
+async def gym_analytics(db, gym_owner: Dict, today: Optional[date] = None) -> Dict:
+    """Analytics for a gym, computed at most once per gym per day"""
+    today = today or datetime.now(ZoneInfo(BILLING_TIMEZONE)).date()
+    gym_id = gym_owner["id"]
+
+    async def load():
+        frame = await load_members_frame(db, gym_id)
+        # Keep the event loop free while pandas crunches large gyms
+        result = await asyncio.to_thread(
+            compute_gym_analytics, frame, gym_owner["monthly_fee"], current_period(), today
+        )
+        result["gym_id"] = gym_id
+        return result
+
+    # Not invalidated by member writes: a day's figures may lag them by design
+    return await cache.get_or_load(
+        gym_key(gym_id, "analytics", today.isoformat()), load, ttl=ANALYTICS_CACHE_TTL, invalidated=False
+    )
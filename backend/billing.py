@@ -0,0 +1,183 @@
+"""
+Billing periods for member fees
+Each member records the period (YYYY-MM) it last paid for, and a member is
+unpaid when that is not the current period, so nothing has to be rewritten
+when a month starts. The stored fee fields (fee_status, payment_method,
+current_month_fee) are derived for the current period when a member is read
+(member_for_period) and written back with that member's next update; the
+monthly job rolls whole gyms over in the background (roll_over_gym).
+"""
+
+import os
+from calendar import monthrange
+from datetime import date, datetime, timezone
+from typing import Dict, Optional
+from zoneinfo import ZoneInfo
+
+# Environment variables
+BILLING_TIMEZONE = os.environ.get("BILLING_TIMEZONE", os.environ.get("SCHEDULER_TIMEZONE", "Asia/Kolkata"))
+
+
+def current_period(now: Optional[datetime] = None) -> str:
+    """Billing month (YYYY-MM) in the billing timezone, now or at naive UTC `now`"""
+    moment = now.replace(tzinfo=timezone.utc) if now else datetime.now(timezone.utc)
+    return moment.astimezone(ZoneInfo(BILLING_TIMEZONE)).strftime("%Y-%m")
+
+
+def shift_period(period: str, months: int) -> str:
+    """Period `months` after (or before, if negative) `period`"""
+    year, month = map(int, period.split("-"))
+    index = year * 12 + month - 1 + months
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+
+def calculate_prorated_fee(monthly_fee: float, joining_date: date) -> float:
+    """Calculate prorated fee based on joining date"""
+    # If joined on 1st, no proration needed
+    if joining_date.day == 1:
+        return 0.0
+
+    # Calculate days remaining in current month
+    days_in_month = monthrange(joining_date.year, joining_date.month)[1]
+    days_remaining = days_in_month - joining_date.day + 1
+
+    # Calculate prorated amount
+    daily_rate = monthly_fee / days_in_month
+    prorated_amount = daily_rate * days_remaining
+
+    return round(prorated_amount, 2)
+
+
+def members_collection_name(gym_id: str) -> str:
+    return f"gym_{gym_id.replace('-', '_')}_members"
+
+
+def unpaid_filter(period: Optional[str] = None) -> Dict:
+    """Active members that have not paid for `period` (default: the current one)"""
+    period = period or current_period()
+    return {
+        "is_active": True,
+        "$or": [
+            {"billing_period": {"$exists": True}, "paid_period": {"$ne": period}},
+            # Written before billing periods existed and not rolled over yet
+            {"billing_period": {"$exists": False}, "fee_status": "unpaid"},
+        ],
+    }
+
+
+def fee_due(member: Dict, gym_owner: Dict, period: Optional[str] = None) -> float:
+    """Amount due for `period`, whether or not the member has been rolled over yet"""
+    period = period or current_period()
+    if member.get("billing_period", period) != period:
+        return gym_owner["monthly_fee"]
+    return member["current_month_fee"]
+
+
+def paid_fields(payment_method: str, period: Optional[str] = None) -> Dict:
+    """$set fields marking a member paid for `period`"""
+    period = period or current_period()
+    return {
+        "fee_status": "paid",
+        "payment_method": payment_method,
+        "paid_period": period,
+        "billing_period": period,
+        "payment_updated_at": datetime.utcnow(),
+    }
+
+
+def legacy_period_of(member: Dict) -> Optional[str]:
+    """Period the fee fields of a member written before billing periods existed belong to"""
+    when = member.get("month_reset_at") or member.get("created_at")
+    if not when:
+        return None
+    return when.replace(tzinfo=timezone.utc).astimezone(ZoneInfo(BILLING_TIMEZONE)).strftime("%Y-%m")
+
+
+def rollover_fields(member: Dict, monthly_fee: float, period: Optional[str] = None) -> Dict:
+    """$set fields bringing a single member into `period` (empty if already there)"""
+    period = period or current_period()
+    fields = {}
+    if "billing_period" not in member:
+        # Written before billing periods existed: the fee fields belong to the
+        # month of the last mass reset. Unpaid ones keep the month their
+        # arrears start (as roll_over_gym does).
+        legacy = legacy_period_of(member) or period
+        paid = member.get("fee_status") == "paid"
+        fields = {"billing_period": legacy, "paid_period": legacy if paid else None}
+        if not paid:
+            fields["unpaid_since"] = legacy
+        member = {**member, **fields}
+    if member.get("billing_period") == period:
+        return fields
+    if member.get("paid_period") == period:
+        return {**fields, "billing_period": period}
+    return {
+        **fields,
+        "fee_status": "unpaid",
+        "payment_method": None,
+        "current_month_fee": monthly_fee,
+        "billing_period": period,
+        "month_reset_at": datetime.utcnow(),
+    }
+
+
+def member_for_period(member: Dict, monthly_fee: float, period: Optional[str] = None) -> Dict:
+    """A member document as it reads in `period`, whether or not it has been rolled over yet"""
+    return {**member, **rollover_fields(member, monthly_fee, period)}
+
+
+async def roll_over_gym(db, gym_owner: Dict, period: Optional[str] = None) -> Optional[int]:
+    """
+    Bring a gym's active members into `period` unless the gym already is.
+
+    Returns the number of members rolled over, or None when the gym was
+    already current or another caller claimed the rollover first (the gym's
+    billing_period is advanced with a conditional update before any member
+    is touched). Readers do not depend on it: member_for_period derives the
+    same fields.
+    """
+    period = period or current_period()
+    if gym_owner.get("billing_period") == period:
+        return None
+    claimed = await db.gym_owners.update_one(
+        {"id": gym_owner["id"], "billing_period": {"$ne": period}}, {"$set": {"billing_period": period}}
+    )
+    if claimed.modified_count == 0:
+        return None
+
+    members_collection = db[members_collection_name(gym_owner["id"])]
+
+    # Members written before billing periods existed: their fee fields belong
+    # to the month of their last mass reset (or joining, if never reset).
+    # Those unpaid at migration get unpaid_since, the month their arrears
+    # start, since billing_period moves on at every rollover
+    legacy_period = {
+        "$dateToString": {
+            "format": "%Y-%m",
+            "date": {"$ifNull": ["$month_reset_at", "$created_at"]},
+            "timezone": BILLING_TIMEZONE,
+        }
+    }
+    await members_collection.update_many(
+        {"billing_period": {"$exists": False}},
+        [{"$set": {
+            "billing_period": legacy_period,
+            "paid_period": {"$cond": [{"$eq": ["$fee_status", "paid"]}, legacy_period, None]},
+            "unpaid_since": {"$cond": [{"$eq": ["$fee_status", "paid"]}, "$$REMOVE", legacy_period]},
+        }}]
+    )
+
+    update_result = await members_collection.update_many(
+        {"is_active": True, "billing_period": {"$ne": period}, "paid_period": {"$ne": period}},
+        {
+            "$set": {
+                "fee_status": "unpaid",
+                "payment_method": None,
+                "current_month_fee": gym_owner["monthly_fee"],
+                "billing_period": period,
+                "month_reset_at": datetime.utcnow(),
+            }
+        }
+    )
+
+    return update_result.modified_count
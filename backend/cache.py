@@ -0,0 +1,378 @@
+"""
+Shared cache for hot lookups (gym owners, stats, sessions, rate-limit counters)
+Every worker keeps a small in-process LRU. With CACHE_BACKEND=redis a Redis
+(or any RESP-compatible server) tier sits behind it so all uvicorn workers
+share entries, and invalidations are broadcast over pub/sub so each worker
+drops its local copy. Without it an invalidation reaches only the worker
+that made the write, so local-only entries kept fresh by invalidation are
+capped at CACHE_LOCAL_TTL. Concurrent misses for the same key run the loader
+once.
+"""
+
+import asyncio
+import os
+import time
+import uuid
+from collections import OrderedDict
+from datetime import date, datetime
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import orjson
+
+from metrics import REGISTRY, Counter
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # local backend only
+    aioredis = None
+
+# Setting REDIS_URL alone is enough to share the cache between workers
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "redis" if os.environ.get("REDIS_URL") else "local")
+REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
+CACHE_PREFIX = os.environ.get("CACHE_PREFIX", "gym_saas")
+CACHE_DEFAULT_TTL = int(os.environ.get("CACHE_DEFAULT_TTL", "300"))
+CACHE_LOCAL_MAX_ENTRIES = int(os.environ.get("CACHE_LOCAL_MAX_ENTRIES", "10000"))
+# Local copies expire quickly: with a shared tier in case an invalidation is
+# missed, without one because other workers never see the invalidation
+CACHE_LOCAL_TTL = int(os.environ.get("CACHE_LOCAL_TTL", "30"))
+# Cross-worker stampede lock: how long a loader may hold it, how long others wait
+LOAD_LOCK_TTL_MS = 5000
+LOAD_LOCK_WAIT_SECONDS = 2.0
+LOAD_LOCK_POLL_SECONDS = 0.05
+
+cache_requests = REGISTRY.register(Counter(
+    "cache_requests_total", "Cache lookups by tier and result", ["tier", "result"]
+))
+
+_MISSING = object()
+
+
+def _encode_default(value):
+    if isinstance(value, datetime):
+        return {"$datetime": value.isoformat()}
+    if isinstance(value, date):
+        return {"$date": value.isoformat()}
+    raise TypeError(f"Cannot cache {type(value).__name__}")
+
+
+def _revive(value):
+    if isinstance(value, dict):
+        if len(value) == 1 and "$datetime" in value:
+            return datetime.fromisoformat(value["$datetime"])
+        if len(value) == 1 and "$date" in value:
+            return date.fromisoformat(value["$date"])
+        return {key: _revive(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_revive(item) for item in value]
+    return value
+
+
+def encode(value: Any) -> bytes:
+    """JSON for the shared tier (datetimes tagged so they come back as datetimes)"""
+    return orjson.dumps(value, default=_encode_default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+
+
+def decode(raw: bytes) -> Any:
+    """Inverse of encode; plain JSON, so a tampered entry cannot run code"""
+    return _revive(orjson.loads(raw))
+
+
+def gym_key(gym_id: str, *parts: str) -> str:
+    """Key namespaced under a gym, e.g. gym_key(gym_id, "owner") -> gym:<id>:owner"""
+    return ":".join(("gym", gym_id, *parts))
+
+
+class LocalCache:
+    """In-process LRU with per-entry expiry"""
+
+    def __init__(self, max_entries: int = CACHE_LOCAL_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def get(self, key: str, default=_MISSING):
+        entry = self._entries.get(key)
+        if entry is None:
+            return default
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return default
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any, ttl: float):
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def delete(self, key: str):
+        self._entries.pop(key, None)
+
+    def delete_prefix(self, prefix: str):
+        for key in [key for key in self._entries if key.startswith(prefix)]:
+            del self._entries[key]
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RedisCache:
+    """Shared tier on a Redis-protocol server; values are stored as JSON"""
+
+    # Delete the lock only if we still own it
+    RELEASE_SCRIPT = """
+    if redis.call("get", KEYS[1]) == ARGV[1] then
+        return redis.call("del", KEYS[1])
+    end
+    return 0
+    """
+
+    def __init__(self, client, prefix: str = CACHE_PREFIX):
+        self.client = client
+        self.prefix = prefix
+        self.channel = f"{prefix}:invalidate"
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}:{key}"
+
+    async def get(self, key: str, default=_MISSING):
+        raw = await self.client.get(self._key(key))
+        return default if raw is None else decode(raw)
+
+    async def set(self, key: str, value: Any, ttl: float):
+        await self.client.set(self._key(key), encode(value), px=int(ttl * 1000))
+
+    async def delete(self, *keys: str):
+        await self.client.delete(*(self._key(key) for key in keys))
+
+    async def delete_prefix(self, prefix: str):
+        keys = [key async for key in self.client.scan_iter(match=f"{self._key(prefix)}*", count=500)]
+        if keys:
+            await self.client.delete(*keys)
+
+    async def acquire_lock(self, key: str) -> Optional[str]:
+        token = uuid.uuid4().hex
+        acquired = await self.client.set(self._key(f"lock:{key}"), token, nx=True, px=LOAD_LOCK_TTL_MS)
+        return token if acquired else None
+
+    async def release_lock(self, key: str, token: str):
+        await self.client.eval(self.RELEASE_SCRIPT, 1, self._key(f"lock:{key}"), token)
+
+    async def publish(self, message: str):
+        await self.client.publish(self.channel, message)
+
+
+class Cache:
+    """
+    Two-tier cache facade used by the API.
+
+    Values must be JSON-like (dicts, lists, scalars, dates and datetimes;
+    tuples come back as lists) and treated as read-only by callers. Loader
+    results of None are not cached, so a missing record is looked up again.
+    Entries that no write invalidates (invalidated=False, e.g. a daily
+    report) keep their full TTL in the local tier.
+    """
+
+    def __init__(
+        self,
+        backend: str = CACHE_BACKEND,
+        redis_url: str = REDIS_URL,
+        default_ttl: float = CACHE_DEFAULT_TTL,
+        local_ttl: float = CACHE_LOCAL_TTL,
+    ):
+        self.backend = backend
+        self.redis_url = redis_url
+        self.default_ttl = default_ttl
+        self.local_ttl = local_ttl
+        self.local = LocalCache()
+        self.remote: Optional[RedisCache] = None
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._listener: Optional[asyncio.Task] = None
+
+    async def start(self, client=None):
+        """Connect the shared tier (when configured) and subscribe to invalidations"""
+        if self.backend != "redis":
+            return
+        if client is None:
+            if aioredis is None:
+                raise RuntimeError("CACHE_BACKEND=redis requires the redis package")
+            client = aioredis.from_url(self.redis_url)
+        self.remote = RedisCache(client)
+        ready = asyncio.Event()
+        self._listener = asyncio.create_task(self._listen(ready))
+        await ready.wait()
+
+    async def close(self):
+        if self._listener:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+        if self.remote:
+            await self.remote.client.aclose()
+            self.remote = None
+        self.local.clear()
+
+    def _local_ttl(self, ttl: float, invalidated: bool = True) -> float:
+        return min(ttl, self.local_ttl) if self.remote or invalidated else ttl
+
+    async def get(self, key: str, default=None):
+        value = self.local.get(key)
+        if value is not _MISSING:
+            cache_requests.inc(tier="local", result="hit")
+            return value
+        cache_requests.inc(tier="local", result="miss")
+
+        if self.remote:
+            try:
+                value = await self.remote.get(key)
+            except Exception as e:
+                print(f"Cache read failed for {key}: {e}")
+                return default
+            cache_requests.inc(tier="redis", result="miss" if value is _MISSING else "hit")
+            if value is not _MISSING:
+                self.local.set(key, value, self.local_ttl)
+                return value
+        return default
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None, invalidated: bool = True):
+        ttl = ttl or self.default_ttl
+        self.local.set(key, value, self._local_ttl(ttl, invalidated))
+        if self.remote:
+            try:
+                await self.remote.set(key, value, ttl)
+            except Exception as e:
+                print(f"Cache write failed for {key}: {e}")
+
+    async def invalidate(self, *keys: str):
+        """Drop keys here, in the shared tier and in every other worker"""
+        for key in keys:
+            self.local.delete(key)
+        if self.remote and keys:
+            try:
+                await self.remote.delete(*keys)
+                for key in keys:
+                    await self.remote.publish(f"key:{key}")
+            except Exception as e:
+                print(f"Cache invalidation failed for {keys}: {e}")
+
+    async def invalidate_gym(self, gym_id: str):
+        """Drop every key namespaced under a gym"""
+        prefix = gym_key(gym_id, "")
+        self.local.delete_prefix(prefix)
+        if self.remote:
+            try:
+                await self.remote.delete_prefix(prefix)
+                await self.remote.publish(f"prefix:{prefix}")
+            except Exception as e:
+                print(f"Cache invalidation failed for gym {gym_id}: {e}")
+
+    async def get_or_load(
+        self, key: str, loader: Callable[[], Awaitable[Any]], ttl: Optional[float] = None, invalidated: bool = True
+    ):
+        """
+        Return the cached value, or run `loader` once and cache its result.
+
+        Concurrent misses in this worker await the same load; across workers
+        a short Redis lock lets one worker load while the others poll for it.
+        """
+        value = await self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        # Nobody may be waiting; don't warn about an unretrieved exception
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._inflight[key] = future
+        try:
+            value = await self._load(key, loader, ttl, invalidated)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(value)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+    async def _load(self, key: str, loader, ttl: Optional[float], invalidated: bool):
+        token = None
+        if self.remote:
+            try:
+                token = await self.remote.acquire_lock(key)
+                if token is None:
+                    value = await self._wait_for_remote(key)
+                    if value is not _MISSING:
+                        return value
+            except Exception as e:
+                print(f"Cache lock failed for {key}: {e}")
+
+        try:
+            value = await loader()
+            if value is not None:
+                await self.set(key, value, ttl, invalidated)
+            return value
+        finally:
+            if token:
+                try:
+                    await self.remote.release_lock(key, token)
+                except Exception as e:
+                    print(f"Cache lock release failed for {key}: {e}")
+
+    async def _wait_for_remote(self, key: str):
+        """Another worker holds the load lock; poll for its result for a while"""
+        deadline = time.monotonic() + LOAD_LOCK_WAIT_SECONDS
+        while time.monotonic() < deadline:
+            await asyncio.sleep(LOAD_LOCK_POLL_SECONDS)
+            value = await self.remote.get(key)
+            if value is not _MISSING:
+                self.local.set(key, value, self.local_ttl)
+                return value
+        return _MISSING
+
+    async def _listen(self, ready: asyncio.Event):
+        """Apply invalidations published by other workers to the local tier"""
+        while True:
+            pubsub = self.remote.client.pubsub()
+            try:
+                await pubsub.subscribe(self.remote.channel)
+                ready.set()
+                async for message in pubsub.listen():
+                    if message["type"] != "message":
+                        continue
+                    data = message["data"]
+                    kind, _, target = (data.decode() if isinstance(data, bytes) else data).partition(":")
+                    if kind == "key":
+                        self.local.delete(target)
+                    elif kind == "prefix":
+                        self.local.delete_prefix(target)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Cache invalidation listener error: {e}")
+                # Invalidations may have been missed while disconnected
+                self.local.clear()
+                ready.set()
+                await asyncio.sleep(1)
+            finally:
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
+
+
+# Global instance
+cache = Cache()
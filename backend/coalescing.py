@@ -0,0 +1,166 @@
+"""
+Coalescing of redundant queued notifications
+Each message a sender number sends counts against its hourly and daily
+limit, so pending notifications that would tell a member the same thing
+twice are merged before dispatch: a notification with the same content as
+one already pending for the same gym and phone within COALESCE_WINDOW_HOURS
+is dropped, and so is the generic "manual" reminder when the member's
+monthly reminder is already pending. Dropped notifications keep their queue
+entry with status "coalesced" and a pointer to the one that is sent instead.
+"""
+
+import hashlib
+import json
+import os
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from pymongo import ASCENDING, UpdateOne
+
+from notification_archive import archive_collection_names
+
+# Environment variables
+COALESCE_WINDOW_HOURS = float(os.environ.get("COALESCE_WINDOW_HOURS", "24"))
+
+COALESCE_FIELDS = {"phone": 1, "type": 1, "template": 1, "params": 1, "month": 1, "message": 1}
+
+
+def content_key(notification: Dict) -> str:
+    """What the member would read: template and parameters, or the custom text"""
+    if notification.get("template"):
+        params = json.dumps(notification.get("params") or {}, sort_keys=True)
+        return f"{notification['template']}:{notification.get('month') or ''}:{params}"
+    return "message:" + hashlib.sha1((notification.get("message") or "").encode()).hexdigest()
+
+
+def covered_by(notification: Dict, other: Dict) -> Optional[str]:
+    """Reason `notification` is redundant next to the pending `other`, if it is"""
+    if content_key(notification) == content_key(other):
+        return "duplicate"
+    if notification.get("template") == "manual" and other.get("type") == "monthly_reminder":
+        return "covered_by_reminder"
+    return None
+
+
+def coalesce(
+    notifications: Iterable[Dict], window: Optional[timedelta] = None
+) -> Tuple[List[Dict], Dict[str, int]]:
+    """
+    Redundant notifications among pending ones.
+
+    Returns (merges, priorities): a {id, into, reason} entry per dropped
+    notification, and the raised priority of kept notifications that absorbed
+    a more urgent one. Monthly reminders are kept before other notifications,
+    then the oldest; each kept one absorbs later ones created within `window`.
+    """
+    window = window or timedelta(hours=COALESCE_WINDOW_HOURS)
+    by_recipient = defaultdict(list)
+    for notification in notifications:
+        if notification.get("phone"):
+            by_recipient[(notification["gym_id"], notification["phone"])].append(notification)
+
+    merges = []
+    priorities = {}
+    for queued in by_recipient.values():
+        if len(queued) < 2:
+            continue
+        queued.sort(key=lambda n: (n.get("type") != "monthly_reminder", n.get("created_at") or datetime.min))
+        kept = []
+        for notification in queued:
+            created_at = notification.get("created_at") or datetime.min
+            for other in kept:
+                reason = covered_by(notification, other)
+                if reason and abs(created_at - (other.get("created_at") or datetime.min)) <= window:
+                    merges.append({"id": notification["id"], "into": other["id"], "reason": reason})
+                    priority = notification.get("priority", 0)
+                    if priority > priorities.get(other["id"], other.get("priority", 0)):
+                        priorities[other["id"]] = priority
+                    break
+            else:
+                kept.append(notification)
+    return merges, priorities
+
+
+def coalesce_report(notifications: List[Dict], merges: List[Dict]) -> Dict:
+    """Sends saved by the merges, overall, per reason and per gym"""
+    gyms = {notification["id"]: notification["gym_id"] for notification in notifications}
+    return {
+        "budget_saved": len(merges),
+        "by_reason": dict(Counter(merge["reason"] for merge in merges)),
+        "gyms": dict(Counter(gyms[merge["id"]] for merge in merges)),
+    }
+
+
+async def phones_in_several_gyms(db) -> int:
+    """
+    Phones with pending notifications from more than one gym. These are not
+    merged (each gym sends from its own numbers), only reported.
+    """
+    rows = await db.notification_queue.aggregate([
+        {"$match": {"status": "pending", "phone": {"$ne": None}}},
+        {"$group": {"_id": "$phone", "gyms": {"$addToSet": "$gym_id"}}},
+        {"$match": {"gyms.1": {"$exists": True}}},
+        {"$count": "phones"},
+    ]).to_list(length=None)
+    return rows[0]["phones"] if rows else 0
+
+
+async def ensure_indexes(db):
+    """Pending notifications by recipient (idempotent)"""
+    await db.notification_queue.create_index([("phone", ASCENDING), ("status", ASCENDING)])
+
+
+async def apply_merges(db, merges: List[Dict], priorities: Dict[str, int], now: Optional[datetime] = None):
+    now = now or datetime.utcnow()
+    operations = [
+        UpdateOne(
+            {"id": merge["id"], "status": "pending"},
+            {"$set": {
+                "status": "coalesced",
+                "coalesced_into": merge["into"],
+                "coalesced_reason": merge["reason"],
+                "coalesced_at": now,
+            }}
+        )
+        for merge in merges
+    ]
+    operations += [
+        UpdateOne({"id": notification_id, "status": "pending"}, {"$set": {"priority": priority}})
+        for notification_id, priority in priorities.items()
+    ]
+    if operations:
+        await db.notification_queue.bulk_write(operations, ordered=False)
+
+
+async def find_covering(db, notification: Dict, now: Optional[datetime] = None) -> Optional[Dict]:
+    """A pending notification that makes `notification` redundant, checked before queueing it"""
+    since = (now or datetime.utcnow()) - timedelta(hours=COALESCE_WINDOW_HOURS)
+    cursor = db.notification_queue.find(
+        {"phone": notification["phone"], "status": "pending", "gym_id": notification["gym_id"], "created_at": {"$gte": since}},
+        {"_id": 0, "id": 1, "created_at": 1, **COALESCE_FIELDS}
+    )
+    async for pending in cursor:
+        if covered_by(notification, pending):
+            return pending
+    return None
+
+
+async def coalescing_stats(db, since: datetime) -> Dict:
+    """Sends saved by coalescing since `since`, per reason and per gym (archived months included)"""
+    match = {"$match": {"status": "coalesced", "coalesced_at": {"$gte": since}}}
+    saved = Counter()
+    gyms = Counter()
+    async for row in db.notification_queue.aggregate([
+        match,
+        *({"$unionWith": {"coll": name, "pipeline": [match]}} for name in archive_collection_names(since, datetime.utcnow())),
+        {"$group": {"_id": {"gym_id": "$gym_id", "reason": "$coalesced_reason"}, "count": {"$sum": 1}}},
+    ]):
+        saved[row["_id"]["reason"]] += row["count"]
+        gyms[row["_id"]["gym_id"]] += row["count"]
+    return {
+        "since": since.isoformat(),
+        "budget_saved": sum(saved.values()),
+        "by_reason": dict(saved),
+        "gyms": dict(gyms),
+    }
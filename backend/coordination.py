@@ -0,0 +1,173 @@
+"""
+Coordination for background jobs across API replicas
+Lease documents in MongoDB make sure a job runs on one replica at a time
+"""
+
+import asyncio
+import os
+import socket
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+LEASE_TTL_SECONDS = int(os.environ.get("LEASE_TTL_SECONDS", "60"))
+
+# Identifies this process in lease documents
+INSTANCE_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class LeaseLost(Exception):
+    """A lease expired or was taken over while its holder was still working"""
+
+
+class LeaseLock:
+    """Expiring lock stored as a single document in the `leases` collection"""
+
+    def __init__(self, db, name: str, ttl_seconds: int = LEASE_TTL_SECONDS, owner: Optional[str] = None):
+        self.db = db
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        # One owner per lock, so two holders in the same process exclude each other too
+        self.owner = owner or f"{INSTANCE_ID}:{uuid.uuid4().hex}"
+        self.held = False
+        # Fencing token: incremented by every acquire, so a stale holder cannot renew
+        self.token = None
+
+    async def acquire(self) -> bool:
+        """Acquire the lease if free or expired (a lease already held is extended with renew())"""
+        now = datetime.utcnow()
+        try:
+            lease = await self.db.leases.find_one_and_update(
+                {"_id": self.name, "expires_at": {"$lt": now}},
+                {
+                    "$set": {
+                        "owner": self.owner,
+                        "expires_at": now + timedelta(seconds=self.ttl_seconds),
+                        "renewed_at": now,
+                    },
+                    "$inc": {"token": 1},
+                },
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
+            # Another owner holds a valid lease; the upsert collided with its document
+            lease = None
+
+        self.held = lease is not None and lease["owner"] == self.owner
+        self.token = lease["token"] if self.held else None
+        return self.held
+
+    async def renew(self) -> bool:
+        """Extend a lease we hold; False if it was lost to another owner"""
+        now = datetime.utcnow()
+        result = await self.db.leases.update_one(
+            {"_id": self.name, "owner": self.owner, "token": self.token, "expires_at": {"$gte": now}},
+            {"$set": {"expires_at": now + timedelta(seconds=self.ttl_seconds), "renewed_at": now}},
+        )
+        self.held = result.matched_count == 1
+        return self.held
+
+    async def release(self):
+        """Give up the lease so another replica can take it immediately"""
+        await self.db.leases.delete_one({"_id": self.name, "owner": self.owner, "token": self.token})
+        self.held = False
+
+    async def is_held(self) -> bool:
+        """Whether the lease is still ours under the token we acquired it with"""
+        lease = await self.db.leases.find_one(
+            {"_id": self.name, "owner": self.owner, "token": self.token, "expires_at": {"$gte": datetime.utcnow()}}
+        )
+        self.held = lease is not None
+        return self.held
+
+    async def keep_alive(self, on_lost: Optional[Callable[[], Any]] = None):
+        """Renew every third of the TTL until cancelled; call `on_lost` and stop if a renewal fails"""
+        while True:
+            await asyncio.sleep(self.ttl_seconds / 3)
+            if not await self.renew():
+                print(f"Lease {self.name} lost by {self.owner}")
+                if on_lost:
+                    on_lost()
+                return
+
+    @asynccontextmanager
+    async def hold(self):
+        """
+        Keep an acquired lease renewed while the block runs.
+
+        If a renewal fails the block is cancelled and LeaseLost is raised, so
+        the work stops instead of overlapping with the next holder.
+        """
+        task = asyncio.current_task()
+        lost = False
+
+        def cancel():
+            nonlocal lost
+            lost = True
+            task.cancel()
+
+        renewer = asyncio.create_task(self.keep_alive(cancel))
+        try:
+            yield self
+        except asyncio.CancelledError:
+            if not lost:
+                raise
+            task.uncancel()
+            raise LeaseLost(f"Lease {self.name} lost by {self.owner}")
+        finally:
+            renewer.cancel()
+
+
+async def run_exclusive(
+    db,
+    name: str,
+    func: Callable[[], Awaitable[Any]],
+    run_key: Optional[str] = None,
+    ttl_seconds: int = LEASE_TTL_SECONDS,
+) -> Any:
+    """
+    Run `func` on at most one replica at a time.
+
+    With a `run_key` (e.g. the month for a monthly job) the run is also
+    recorded in `job_runs`, so later calls with the same key are skipped.
+    Returns the function result, or a skipped status dict. Raises LeaseLost
+    (after cancelling `func`) if the lease cannot be renewed.
+    """
+    lock = LeaseLock(db, name, ttl_seconds)
+    if not await lock.acquire():
+        return {"status": "skipped", "reason": "lease_held", "job": name}
+
+    run_id = f"{name}:{run_key}" if run_key else None
+    try:
+        async with lock.hold():
+            if run_id and await db.job_runs.find_one({"_id": run_id}):
+                return {"status": "skipped", "reason": "already_completed", "job": name, "run_key": run_key}
+
+            result = await func()
+
+            if run_id:
+                # Fencing: a holder whose lease lapsed while func ran must not mark the run done
+                if not await lock.is_held():
+                    raise LeaseLost(f"Lease {name} lost by {lock.owner}")
+                await db.job_runs.insert_one({
+                    "_id": run_id,
+                    "job": name,
+                    "run_key": run_key,
+                    "owner": lock.owner,
+                    "token": lock.token,
+                    "completed_at": datetime.utcnow(),
+                })
+            return result
+    finally:
+        await lock.release()
+
+
+async def get_leases(db) -> Dict[str, Dict]:
+    """Current lease holders keyed by lease name"""
+    leases = await db.leases.find({}).to_list(length=None)
+    return {lease.pop("_id"): lease for lease in leases}
@@ -0,0 +1,195 @@
+"""
+Shared MongoDB client for Gym Management SaaS
+One connection pool per process, opened on API startup and closed on shutdown
+"""
+
+import os
+import threading
+from collections import defaultdict
+from typing import Dict, Optional
+
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from pymongo import monitoring
+from pymongo.read_preferences import Primary, SecondaryPreferred
+
+from metrics import METRICS_ENABLED, MongoCommandMetrics
+
+# Environment variables
+MONGO_URL = os.environ.get("MONGO_URL", "mongodb://localhost:27017")
+DB_NAME = os.environ.get("DB_NAME", "gym_saas")
+MONGO_MAX_POOL_SIZE = int(os.environ.get("MONGO_MAX_POOL_SIZE", "50"))
+MONGO_MIN_POOL_SIZE = int(os.environ.get("MONGO_MIN_POOL_SIZE", "5"))
+MONGO_MAX_IDLE_TIME_MS = int(os.environ.get("MONGO_MAX_IDLE_TIME_MS", "60000"))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get("MONGO_WAIT_QUEUE_TIMEOUT_MS", "5000"))
+
+# Read preference per operation class:
+# - default: request handlers and anything that reads its own writes
+# - background: scheduler/automation scans that tolerate slightly stale data
+# - reporting: aggregations and analytics that should stay off the primary
+READ_PREFERENCES = {
+    "default": Primary(),
+    "background": SecondaryPreferred(max_staleness=120),
+    "reporting": SecondaryPreferred(),
+}
+
+
+class PoolStats(monitoring.ConnectionPoolListener):
+    """Connection pool counters fed by pymongo's CMAP events"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.open_connections: Dict[str, int] = defaultdict(int)
+        self.checked_out: Dict[str, int] = defaultdict(int)
+        self.waiting: Dict[str, int] = defaultdict(int)
+        self.connections_created = 0
+        self.connections_closed = 0
+        self.checkouts = 0
+        self.checkout_failures = 0
+        self.pool_clears = 0
+
+    def _address(self, event) -> str:
+        host, port = event.address
+        return f"{host}:{port}"
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pool_clears += 1
+
+    def pool_closed(self, event):
+        with self._lock:
+            address = self._address(event)
+            self.open_connections.pop(address, None)
+            self.checked_out.pop(address, None)
+            self.waiting.pop(address, None)
+
+    def connection_created(self, event):
+        with self._lock:
+            self.open_connections[self._address(event)] += 1
+            self.connections_created += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            address = self._address(event)
+            self.open_connections[address] = max(self.open_connections[address] - 1, 0)
+            self.connections_closed += 1
+
+    def connection_check_out_started(self, event):
+        with self._lock:
+            self.waiting[self._address(event)] += 1
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            address = self._address(event)
+            self.waiting[address] = max(self.waiting[address] - 1, 0)
+            self.checkout_failures += 1
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            address = self._address(event)
+            self.waiting[address] = max(self.waiting[address] - 1, 0)
+            self.checked_out[address] += 1
+            self.checkouts += 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            address = self._address(event)
+            self.checked_out[address] = max(self.checked_out[address] - 1, 0)
+
+    def snapshot(self, max_pool_size: int) -> Dict:
+        with self._lock:
+            servers = {
+                address: {
+                    "open_connections": self.open_connections[address],
+                    "checked_out": self.checked_out[address],
+                    "waiting": self.waiting[address],
+                    "utilization": round(self.checked_out[address] / max_pool_size, 3),
+                }
+                for address in set(self.open_connections) | set(self.checked_out)
+            }
+            return {
+                "max_pool_size": max_pool_size,
+                "servers": servers,
+                "connections_created": self.connections_created,
+                "connections_closed": self.connections_closed,
+                "checkouts": self.checkouts,
+                "checkout_failures": self.checkout_failures,
+                "pool_clears": self.pool_clears,
+            }
+
+
+class Database:
+    """Owns the process-wide AsyncIOMotorClient"""
+
+    def __init__(self):
+        self.client: Optional[AsyncIOMotorClient] = None
+        self.pool_stats = PoolStats()
+        self._databases: Dict[str, AsyncIOMotorDatabase] = {}
+
+    def connect(self) -> AsyncIOMotorClient:
+        """Create the client on first use (inside the running event loop)"""
+        if self.client is None:
+            listeners = [self.pool_stats]
+            if METRICS_ENABLED:
+                listeners.append(MongoCommandMetrics())
+            self.client = AsyncIOMotorClient(
+                MONGO_URL,
+                maxPoolSize=MONGO_MAX_POOL_SIZE,
+                minPoolSize=MONGO_MIN_POOL_SIZE,
+                maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+                waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+                event_listeners=listeners,
+            )
+        return self.client
+
+    def close(self):
+        if self.client is not None:
+            self.client.close()
+            self.client = None
+            self._databases.clear()
+
+    def get_db(self, operation: str = "default") -> AsyncIOMotorDatabase:
+        """Database handle using the read preference for an operation class"""
+        if operation not in self._databases:
+            self._databases[operation] = self.connect().get_database(
+                DB_NAME, read_preference=READ_PREFERENCES[operation]
+            )
+        return self._databases[operation]
+
+    def pool_metrics(self) -> Dict:
+        return {"connected": self.client is not None, **self.pool_stats.snapshot(MONGO_MAX_POOL_SIZE)}
+
+
+class DatabaseProxy:
+    """
+    Module-level stand-in for a database handle.
+
+    Modules can hold `db = get_db()` at import time without opening a
+    connection; the shared client is created on first attribute access.
+    """
+
+    def __init__(self, provider: Database, operation: str):
+        self._provider = provider
+        self._operation = operation
+
+    def __getattr__(self, name):
+        return getattr(self._provider.get_db(self._operation), name)
+
+    def __getitem__(self, name):
+        return self._provider.get_db(self._operation)[name]
+
+
+# Global instance
+database = Database()
+
+
+def get_db(operation: str = "default") -> DatabaseProxy:
+    return DatabaseProxy(database, operation)
@@ -0,0 +1,150 @@
+"""
+Event-loop blocking detector
+A heartbeat coroutine measures loop lag continuously; a watchdog thread
+notices when the heartbeat stalls and captures the stack of whatever is
+blocking the loop (bcrypt, QR rendering, the Razorpay SDK, large json.loads...)
+together with the route being served.
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from metrics import REGISTRY, Counter, Histogram
+
+LOOP_WATCHDOG_ENABLED = os.environ.get("LOOP_WATCHDOG_ENABLED", "true").lower() == "true"
+LOOP_BLOCK_THRESHOLD_MS = float(os.environ.get("LOOP_BLOCK_THRESHOLD_MS", "100"))
+LOOP_HEARTBEAT_INTERVAL_MS = 50
+MAX_RECORDED_BLOCKS = 100
+
+event_loop_lag = REGISTRY.register(Histogram(
+    "event_loop_lag_seconds", "Delay between a scheduled heartbeat and when the event loop ran it",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+))
+event_loop_blocks = REGISTRY.register(Counter(
+    "event_loop_blocks_total", "Callbacks that blocked the event loop longer than the threshold", ["route"]
+))
+
+# Scope of the request each task is serving, for attributing blocks to routes
+_active_requests: Dict[asyncio.Task, Dict] = {}
+
+
+class ActiveRequestMiddleware:
+    """ASGI middleware remembering which request each task is handling"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        task = asyncio.current_task()
+        _active_requests[task] = scope
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _active_requests.pop(task, None)
+
+
+def _describe_request(task: Optional[asyncio.Task]) -> str:
+    scope = _active_requests.get(task) if task else None
+    if not scope:
+        return "background"
+    # The router stores the matched route on the scope; fall back to the raw path
+    route = scope.get("route")
+    return f"{scope['method']} {getattr(route, 'path', scope['path'])}"
+
+
+class LoopWatchdog:
+    def __init__(
+        self,
+        threshold_ms: float = LOOP_BLOCK_THRESHOLD_MS,
+        interval_ms: float = LOOP_HEARTBEAT_INTERVAL_MS,
+    ):
+        self.threshold = threshold_ms / 1000
+        self.interval = interval_ms / 1000
+        self.blocks: deque = deque(maxlen=MAX_RECORDED_BLOCKS)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._last_beat = time.monotonic()
+        self._stall: Optional[Dict] = None
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+
+    def start(self):
+        """Start monitoring the running loop (call from inside it)"""
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stop_event.clear()
+        self._heartbeat_task = asyncio.create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    async def stop(self):
+        self._stop_event.set()
+        if self._heartbeat_task:
+            self._heartbeat_task.cancel()
+            try:
+                await self._heartbeat_task
+            except asyncio.CancelledError:
+                pass
+        if self._thread:
+            self._thread.join()
+
+    async def _heartbeat(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(now - expected, 0.0)
+            self._last_beat = now
+            event_loop_lag.observe(lag)
+
+            stall, self._stall = self._stall, None
+            if stall and lag >= self.threshold:
+                self._report(stall, lag)
+
+    def _watch(self):
+        """Watchdog thread: capture the loop thread's stack while it is stalled"""
+        poll = self.threshold / 2
+        while not self._stop_event.wait(poll):
+            stalled_for = time.monotonic() - self._last_beat - self.interval
+            if stalled_for < self.threshold or self._stall is not None:
+                continue
+
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            task = asyncio.current_task(self._loop)
+            self._stall = {
+                "detected_at": datetime.utcnow(),
+                "route": _describe_request(task),
+                "task": task.get_name() if task else None,
+                "stack": "".join(traceback.format_stack(frame)),
+            }
+
+    def _report(self, stall: Dict, lag: float):
+        stall["blocked_ms"] = round(lag * 1000, 1)
+        self.blocks.append(stall)
+        event_loop_blocks.inc(route=stall["route"])
+        print(
+            f"Event loop blocked for {stall['blocked_ms']}ms while serving {stall['route']} "
+            f"(task {stall['task']}):\n{stall['stack']}"
+        )
+
+    def recent_blocks(self) -> List[Dict]:
+        return list(self.blocks)
+
+
+# Global instance
+loop_watchdog = LoopWatchdog()
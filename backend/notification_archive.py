@@ -0,0 +1,155 @@
+"""
+Archival of completed notifications
+The live `notification_queue` only needs in-flight work. Sent, suppressed,
+coalesced, dead-lettered (and legacy failed) notifications are moved in small
+batches into one archive collection per month of creation
+(`notification_archive_YYYY_MM`), with a pause between batches and no
+archiving during the send windows, so the moves never compete with peak
+sending. Old months are dropped as a whole
+collection instead of being deleted document by document.
+"""
+
+import asyncio
+import os
+import re
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+from zoneinfo import ZoneInfo
+
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import BulkWriteError
+
+from billing import BILLING_TIMEZONE, current_period
+
+# Environment variables
+# Completed notifications stay in the queue this long (sender health and pacing read the last day)
+NOTIFICATION_ARCHIVE_AFTER_HOURS = float(os.environ.get("NOTIFICATION_ARCHIVE_AFTER_HOURS", "48"))
+NOTIFICATION_ARCHIVE_MONTHS = int(os.environ.get("NOTIFICATION_ARCHIVE_MONTHS", "12"))
+NOTIFICATION_ARCHIVE_BATCH = int(os.environ.get("NOTIFICATION_ARCHIVE_BATCH", "500"))
+NOTIFICATION_ARCHIVE_PAUSE_SECONDS = float(os.environ.get("NOTIFICATION_ARCHIVE_PAUSE_SECONDS", "0.5"))
+NOTIFICATION_ARCHIVE_MAX_PER_RUN = int(os.environ.get("NOTIFICATION_ARCHIVE_MAX_PER_RUN", "50000"))
+
+COMPLETED_STATUSES = ["sent", "failed", "dead_lettered", "suppressed", "coalesced"]
+ARCHIVE_PREFIX = "notification_archive_"
+ARCHIVE_NAME = re.compile(r"^notification_archive_(\d{4})_(\d{2})$")
+
+
+def archive_collection_name(when: datetime) -> str:
+    return f"{ARCHIVE_PREFIX}{when:%Y_%m}"
+
+
+def archive_collection_names(since: datetime, until: datetime) -> List[str]:
+    """Archive partitions covering notifications created between `since` and `until`"""
+    names = []
+    month = since.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    while month <= until:
+        names.append(archive_collection_name(month))
+        month = (month + timedelta(days=32)).replace(day=1)
+    return names
+
+
+def archivable_filter(cutoff: datetime, period: Optional[str] = None) -> Dict:
+    """Completed notifications created before `cutoff`"""
+    return {
+        "status": {"$in": COMPLETED_STATUSES},
+        "created_at": {"$lt": cutoff},
+        # This month's reminders stay: their queue _id keeps generation from queueing them again
+        "$nor": [{"type": "monthly_reminder", "month": period or current_period()}],
+    }
+
+
+def in_send_window(now: datetime, windows=None, tz_name: str = BILLING_TIMEZONE) -> bool:
+    """Whether naive UTC `now` falls in a send window in local time"""
+    # Imported here: send_pacing -> coalescing -> notification_archive
+    from send_pacing import SEND_WINDOWS, parse_windows
+
+    local = now.replace(tzinfo=timezone.utc).astimezone(ZoneInfo(tz_name)).time()
+    return any(start <= local < end for start, end in windows or parse_windows(SEND_WINDOWS))
+
+
+async def ensure_indexes(db):
+    """Archival scan: status equality, created_at range (idempotent)"""
+    await db.notification_queue.create_index([("status", ASCENDING), ("created_at", ASCENDING)])
+
+
+async def copy_to_archive(db, notifications: List[Dict], when: datetime) -> Dict[str, int]:
+    """Insert notifications into their month's archive; returns the count per partition"""
+    partitions = defaultdict(list)
+    for notification in notifications:
+        partitions[archive_collection_name(notification.get("created_at") or when)].append(
+            {**notification, "archived_at": when}
+        )
+    for name, documents in partitions.items():
+        try:
+            # Same _id as in the queue, so a batch copied before an interrupted delete is not duplicated
+            await db[name].insert_many(documents, ordered=False)
+        except BulkWriteError as e:
+            if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+                raise
+        await db[name].create_index([("gym_id", ASCENDING), ("created_at", DESCENDING)])
+    return {name: len(documents) for name, documents in partitions.items()}
+
+
+async def drop_expired_archives(db, now: datetime, months: int = NOTIFICATION_ARCHIVE_MONTHS) -> List[str]:
+    """Drop archive partitions older than `months` months"""
+    oldest = now.year * 12 + now.month - 1 - months
+    dropped = []
+    for name in await db.list_collection_names():
+        match = ARCHIVE_NAME.match(name)
+        if match and int(match.group(1)) * 12 + int(match.group(2)) - 1 < oldest:
+            await db.drop_collection(name)
+            dropped.append(name)
+    return sorted(dropped)
+
+
+async def archive_notifications(
+    db,
+    now: Optional[datetime] = None,
+    batch_size: int = NOTIFICATION_ARCHIVE_BATCH,
+    max_documents: int = NOTIFICATION_ARCHIVE_MAX_PER_RUN,
+    pause_seconds: float = NOTIFICATION_ARCHIVE_PAUSE_SECONDS,
+    windows=None,
+) -> Dict:
+    """
+    Move completed notifications older than NOTIFICATION_ARCHIVE_AFTER_HOURS
+    to the monthly archives, oldest first.
+
+    Each batch is one find, one insert per partition and one delete by _id.
+    The run stops after `max_documents`, and stops early once a send window
+    opens; the next run continues where it left off.
+    """
+    started = now or datetime.utcnow()
+    query = archivable_filter(started - timedelta(hours=NOTIFICATION_ARCHIVE_AFTER_HOURS), current_period(started))
+    archived = Counter()
+    batches = 0
+    stopped = None
+
+    while sum(archived.values()) < max_documents:
+        moment = now or datetime.utcnow()
+        if in_send_window(moment, windows):
+            stopped = "send_window"
+            break
+        limit = min(batch_size, max_documents - sum(archived.values()))
+        batch = await db.notification_queue.find(query).sort("created_at", ASCENDING).limit(limit).to_list(length=None)
+        if not batch:
+            break
+
+        archived.update(await copy_to_archive(db, batch, moment))
+        await db.notification_queue.delete_many({
+            "_id": {"$in": [notification["_id"] for notification in batch]},
+            "status": {"$in": COMPLETED_STATUSES},
+        })
+        batches += 1
+        if pause_seconds:
+            await asyncio.sleep(pause_seconds)
+    else:
+        stopped = "max_documents"
+
+    return {
+        "archived": sum(archived.values()),
+        "batches": batches,
+        "partitions": dict(archived),
+        "stopped": stopped,
+        "dropped_partitions": await drop_expired_archives(db, started),
+    }
@@ -0,0 +1,318 @@
+"""
+WhatsApp notification queue bookkeeping
+Sent messages are counted in per-hour and per-day counter documents
+(`notification_rate_counters`), so rate limiting reads two small documents
+instead of counting the queue. Senders acknowledge results in batches that
+are applied with a single bulk_write.
+
+A failed notification goes back to pending with a `next_attempt_at` after an
+exponential, jittered backoff; senders only claim notifications whose time
+has come. New campaign notifications (monthly reminders) are claimed only
+once send pacing has given them a slot (see send_pacing.py); one-off sends
+such as manual notifications are claimable as soon as they are queued. After NOTIFICATION_MAX_ATTEMPTS failures it is copied to
+`notification_dead_letters` and left in the queue as a "dead_lettered"
+tombstone, so its _id still keeps reminder generation from queueing it again.
+"""
+
+import os
+import random
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+from pymongo.errors import BulkWriteError
+
+# Environment variables
+NOTIFICATION_MAX_ATTEMPTS = int(os.environ.get("NOTIFICATION_MAX_ATTEMPTS", "5"))
+NOTIFICATION_RETRY_BASE_SECONDS = float(os.environ.get("NOTIFICATION_RETRY_BASE_SECONDS", "60"))
+NOTIFICATION_RETRY_MAX_SECONDS = float(os.environ.get("NOTIFICATION_RETRY_MAX_SECONDS", str(6 * 3600)))
+
+ACK_STATUSES = ("sent", "failed")
+# Queue statuses no ack changes
+FINAL_STATUSES = ("sent", "dead_lettered")
+ACK_MAX_BATCH = 500
+
+# Rate limits for WhatsApp Web sending
+MAX_PER_HOUR_RANGE = (40, 50)
+MAX_PER_DAY = 250
+
+
+# Notification types sent in bulk, which wait for a paced send slot
+CAMPAIGN_TYPES = ["monthly_reminder"]
+
+# Due notifications scanned per claimed one, so senders at their limit can be skipped
+CLAIM_SCAN_FACTOR = 5
+
+
+def rate_counter_ids(when: datetime, sender: Optional[str] = None) -> Tuple[str, str]:
+    """Hour and day counter ids, across all senders or for one sender number"""
+    suffix = f":{sender}" if sender else ""
+    return f"hour:{when:%Y-%m-%dT%H}{suffix}", f"day:{when:%Y-%m-%d}{suffix}"
+
+
+def retry_delay(attempt: int) -> timedelta:
+    """Backoff before retry `attempt` (1-based): doubling, capped, jittered to 50-100%"""
+    delay = min(NOTIFICATION_RETRY_BASE_SECONDS * 2 ** (attempt - 1), NOTIFICATION_RETRY_MAX_SECONDS)
+    return timedelta(seconds=delay * random.uniform(0.5, 1.0))
+
+
+def sends_immediately(notification: Dict) -> bool:
+    """A one-off notification on its first attempt, which needs no send slot"""
+    return notification.get("type") not in CAMPAIGN_TYPES and not notification.get("retry_at")
+
+
+def claimable_filter(now: Optional[datetime] = None) -> Dict:
+    """Pending notifications whose send slot (or retry time) has come"""
+    return {
+        "status": "pending",
+        "$or": [
+            {"next_attempt_at": {"$lte": now or datetime.utcnow()}},
+            # Campaign notifications without a next_attempt_at wait for send pacing to give them a slot
+            {"next_attempt_at": {"$exists": False}, "type": {"$nin": CAMPAIGN_TYPES}},
+        ],
+    }
+
+
+async def ensure_indexes(db):
+    """Queue, counter and dead-letter indexes (idempotent)"""
+    # Counter documents expire a day after their window
+    await db.notification_rate_counters.create_index("expires_at", expireAfterSeconds=0)
+    await db.notification_queue.create_index("id")
+    # Claim query: status equality, priority sort, next_attempt_at range
+    await db.notification_queue.create_index(
+        [("status", ASCENDING), ("priority", DESCENDING), ("next_attempt_at", ASCENDING)]
+    )
+    await db.notification_dead_letters.create_index([("gym_id", ASCENDING), ("dead_lettered_at", DESCENDING)])
+
+
+async def record_sent(db, sent: Dict[Optional[str], int], when: Optional[datetime] = None):
+    """Add sent messages (count per sender number) to the hour and day counters"""
+    sent = {sender: count for sender, count in sent.items() if count > 0}
+    if not sent:
+        return
+    when = when or datetime.utcnow()
+    hour_start = when.replace(minute=0, second=0, microsecond=0)
+    day_start = hour_start.replace(hour=0)
+    operations = []
+    # The unsuffixed counters total every sender
+    for sender, count in [(None, sum(sent.values())), *((sender, count) for sender, count in sent.items() if sender)]:
+        hour_id, day_id = rate_counter_ids(when, sender)
+        operations += [
+            UpdateOne(
+                {"_id": hour_id},
+                {"$inc": {"sent": count}, "$setOnInsert": {"expires_at": hour_start + timedelta(days=1, hours=1)}},
+                upsert=True
+            ),
+            UpdateOne(
+                {"_id": day_id},
+                {"$inc": {"sent": count}, "$setOnInsert": {"expires_at": day_start + timedelta(days=2)}},
+                upsert=True
+            ),
+        ]
+    await db.notification_rate_counters.bulk_write(operations, ordered=False)
+
+
+async def sent_counts(db, when: Optional[datetime] = None) -> Tuple[int, int]:
+    """(sent this hour, sent today) across all senders"""
+    hour_id, day_id = rate_counter_ids(when or datetime.utcnow())
+    counters = {
+        counter["_id"]: counter.get("sent", 0)
+        async for counter in db.notification_rate_counters.find({"_id": {"$in": [hour_id, day_id]}})
+    }
+    return counters.get(hour_id, 0), counters.get(day_id, 0)
+
+
+async def sender_sent_counts(db, senders: Iterable[str], when: Optional[datetime] = None) -> Dict[str, Tuple[int, int]]:
+    """(sent this hour, sent today) per sender number"""
+    when = when or datetime.utcnow()
+    ids = {sender: rate_counter_ids(when, sender) for sender in set(senders) if sender}
+    counters = {
+        counter["_id"]: counter.get("sent", 0)
+        async for counter in db.notification_rate_counters.find(
+            {"_id": {"$in": [counter_id for pair in ids.values() for counter_id in pair]}}
+        )
+    }
+    return {sender: (counters.get(hour_id, 0), counters.get(day_id, 0)) for sender, (hour_id, day_id) in ids.items()}
+
+
+async def claim_notifications(
+    db, limit: int, max_per_hour: int, max_per_day: int = MAX_PER_DAY, now: Optional[datetime] = None
+) -> Tuple[List[Dict], bool]:
+    """
+    Up to `limit` due notifications, highest priority first, skipping those
+    whose sender number has reached its hourly or daily limit. Also returns
+    whether any due notification was held back by a limit.
+    """
+    now = now or datetime.utcnow()
+    candidates = await db.notification_queue.find(claimable_filter(now)).sort("priority", -1).limit(
+        limit * CLAIM_SCAN_FACTOR
+    ).to_list(length=None)
+    counts = await sender_sent_counts(db, (candidate.get("sender_number") for candidate in candidates), now)
+    remaining = {
+        sender: min(max_per_hour - hour_count, max_per_day - day_count)
+        for sender, (hour_count, day_count) in counts.items()
+    }
+
+    claimed = []
+    held_back = False
+    for candidate in candidates:
+        sender = candidate.get("sender_number")
+        if sender in remaining:
+            if remaining[sender] <= 0:
+                held_back = True
+                continue
+            remaining[sender] -= 1
+        claimed.append(candidate)
+        if len(claimed) == limit:
+            break
+    return claimed, held_back
+
+
+def sent_fields(when: Optional[datetime] = None) -> Dict:
+    return {"status": "sent", "sent_at": when or datetime.utcnow()}
+
+
+def retry_fields(attempts: int, error: Optional[str], when: Optional[datetime] = None) -> Dict:
+    """$set fields putting a notification that failed `attempts` times back in the queue"""
+    when = when or datetime.utcnow()
+    retry_at = when + retry_delay(attempts)
+    return {
+        "status": "pending",
+        "attempts": attempts,
+        "error": error,
+        "failed_at": when,
+        # retry_at is the earliest retry; send pacing may push next_attempt_at later
+        "retry_at": retry_at,
+        "next_attempt_at": retry_at,
+    }
+
+
+async def dead_letter(db, notifications: List[Dict], when: datetime) -> List:
+    """Copy notifications into the dead-letter collection; returns their queue _ids"""
+    if not notifications:
+        return []
+    try:
+        # Same _id as in the queue, so a repeated move does not duplicate
+        await db.notification_dead_letters.insert_many(
+            [{**notification, "status": "failed", "dead_lettered_at": when} for notification in notifications],
+            ordered=False
+        )
+    except BulkWriteError as e:
+        if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+            raise
+    return [notification["_id"] for notification in notifications]
+
+
+async def ack_notifications(db, acks: List[Dict]) -> Dict:
+    """
+    Apply a batch of {id, status, error, sent_at} results from a sender.
+
+    Current statuses are read with one query and the changes written with one
+    unordered bulk_write; the rate counters are bumped once for the batch.
+    Each ack gets a result: sent, retrying, dead_lettered, unchanged (already
+    sent or dead-lettered, or superseded by a later ack in the batch),
+    not_found or invalid.
+    """
+    ids = list({ack["id"] for ack in acks})
+    current = {
+        notification["id"]: notification
+        async for notification in db.notification_queue.find(
+            {"id": {"$in": ids}}, {"_id": 1, "id": 1, "status": 1, "attempts": 1, "sender_number": 1}
+        )
+    }
+
+    now = datetime.utcnow()
+    results = []
+    operations = []
+    exhausted = []
+    latest = {}
+    for ack in acks:
+        # The last ack for an id in the batch wins
+        latest[ack["id"]] = ack
+    for ack in acks:
+        notification_id, status = ack["id"], ack["status"]
+        notification = current.get(notification_id)
+        if status not in ACK_STATUSES:
+            results.append({"id": notification_id, "result": "invalid"})
+        elif notification is None:
+            results.append({"id": notification_id, "result": "not_found"})
+        elif latest[notification_id] is not ack or notification["status"] in FINAL_STATUSES:
+            results.append({"id": notification_id, "result": "unchanged"})
+        elif status == "sent":
+            # A sent_at from the client is kept unless it is in the future
+            when = ack.get("sent_at") or now
+            if when.tzinfo:
+                when = when.astimezone(timezone.utc).replace(tzinfo=None)
+            operations.append(UpdateOne(
+                {"_id": notification["_id"], "status": notification["status"]},
+                {"$set": sent_fields(min(when, now))}
+            ))
+            results.append({"id": notification_id, "result": "sent"})
+        else:
+            attempts = notification.get("attempts", 0) + 1
+            if attempts >= NOTIFICATION_MAX_ATTEMPTS:
+                exhausted.append((notification["_id"], attempts, ack.get("error")))
+                results.append({"id": notification_id, "result": "dead_lettered", "attempts": attempts})
+            else:
+                operations.append(UpdateOne(
+                    {"_id": notification["_id"], "status": notification["status"]},
+                    {"$set": retry_fields(attempts, ack.get("error"), now)}
+                ))
+                results.append({"id": notification_id, "result": "retrying", "attempts": attempts})
+
+    if exhausted:
+        final = {queue_id: (attempts, error) for queue_id, attempts, error in exhausted}
+        documents = await db.notification_queue.find({"_id": {"$in": list(final)}}).to_list(length=None)
+        for document in documents:
+            document["attempts"], document["error"] = final[document["_id"]]
+            document["failed_at"] = now
+        # The tombstone is never claimed again (claimable_filter only takes pending)
+        operations.extend(
+            UpdateOne(
+                {"_id": queue_id},
+                {"$set": {
+                    "status": "dead_lettered",
+                    "attempts": final[queue_id][0],
+                    "error": final[queue_id][1],
+                    "failed_at": now,
+                    "dead_lettered_at": now,
+                }}
+            )
+            for queue_id in await dead_letter(db, documents, now)
+        )
+
+    if operations:
+        await db.notification_queue.bulk_write(operations, ordered=False)
+    await record_sent(db, Counter(
+        current[result["id"]].get("sender_number") for result in results if result["result"] == "sent"
+    ), now)
+
+    return {
+        "results": results,
+        "summary": dict(Counter(result["result"] for result in results)),
+    }
+
+
+async def retry_stats(db, now: Optional[datetime] = None) -> Dict:
+    """Depth of the retry schedule and the dead-letter collection"""
+    now = now or datetime.utcnow()
+    retrying = {"status": "pending", "attempts": {"$gte": 1}}
+    waiting = {**retrying, "next_attempt_at": {"$gt": now}}
+    next_retry = await db.notification_queue.find_one(waiting, {"next_attempt_at": 1}, sort=[("next_attempt_at", ASCENDING)])
+    by_attempt = {
+        str(row["_id"]): row["count"]
+        async for row in db.notification_queue.aggregate([
+            {"$match": retrying},
+            {"$group": {"_id": "$attempts", "count": {"$sum": 1}}},
+            {"$sort": {"_id": 1}},
+        ])
+    }
+    return {
+        "max_attempts": NOTIFICATION_MAX_ATTEMPTS,
+        "retrying": sum(by_attempt.values()),
+        "waiting": await db.notification_queue.count_documents(waiting),
+        "retrying_by_attempt": by_attempt,
+        "next_retry_at": next_retry["next_attempt_at"].isoformat() if next_retry else None,
+        "dead_letters": await db.notification_dead_letters.estimated_document_count(),
+    }
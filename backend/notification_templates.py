@@ -0,0 +1,147 @@
+"""
+Notification templates
+Queued notifications store a template id and a few parameters instead of the
+rendered text. The text is rendered when a sender pulls the notification,
+from the gym's latest saved version of the template or the built-in default,
+so a template fix also reaches notifications that are already queued.
+Template bodies are cached per gym and compiled once per process.
+"""
+
+from datetime import datetime
+from functools import lru_cache
+from string import Formatter
+from typing import Dict, List, Optional, Tuple
+
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import DuplicateKeyError
+
+from cache import cache, gym_key
+
+TEMPLATE_CACHE_TTL = 3600
+TEMPLATE_MAX_LENGTH = 2000
+
+DEFAULT_TEMPLATES = {
+    "monthly_reminder": """🏋️ *{gym_name}*
+
+Hi {member_name}! 👋
+
+This is a friendly reminder that your gym membership fee for {month} is due.
+
+💰 *Amount Due:* ₹{amount}
+
+*Payment Options:*
+💵 Cash Payment: Visit the gym and pay directly
+💳 Online Payment: Use our secure payment portal
+
+📞 *Contact:* {phone}
+📍 *Address:* {address}
+
+Thank you for being a valued member! 💪
+
+_Reply STOP to unsubscribe from reminders_""",
+    "manual": "Hi {member_name}! This is a reminder from {gym_name}. Please contact us for any queries.",
+}
+
+
+@lru_cache(maxsize=1024)
+def compile_template(body: str) -> Tuple[Tuple[str, Optional[str]], ...]:
+    """Split a template body into (literal text, field name or None) pieces"""
+    pieces = []
+    for literal, name, format_spec, conversion in Formatter().parse(body):
+        if name is not None and (not name.isidentifier() or format_spec or conversion):
+            raise ValueError(f"Unsupported placeholder {{{name}}}: use plain {{field}} names")
+        pieces.append((literal, name))
+    return tuple(pieces)
+
+
+def template_fields(body: str) -> List[str]:
+    return [name for _, name in compile_template(body) if name is not None]
+
+
+def render(body: str, params: Dict) -> str:
+    """Fill a template body; missing parameters render as empty text"""
+    return "".join(
+        literal + ("" if name is None or params.get(name) is None else str(params[name]))
+        for literal, name in compile_template(body)
+    )
+
+
+def validate_template(template_id: str, body: str):
+    """Raise ValueError unless `body` can replace the built-in template"""
+    if template_id not in DEFAULT_TEMPLATES:
+        raise ValueError(f"Unknown template '{template_id}'")
+    if not body.strip() or len(body) > TEMPLATE_MAX_LENGTH:
+        raise ValueError(f"Template must be 1-{TEMPLATE_MAX_LENGTH} characters")
+    allowed = set(template_fields(DEFAULT_TEMPLATES[template_id]))
+    unknown = sorted(set(template_fields(body)) - allowed)
+    if unknown:
+        raise ValueError(f"Unknown fields {unknown}; available: {sorted(allowed)}")
+
+
+async def ensure_indexes(db):
+    """One document per saved version of a gym's template (idempotent)"""
+    await db.notification_templates.create_index(
+        [("gym_id", ASCENDING), ("template_id", ASCENDING), ("version", DESCENDING)], unique=True
+    )
+
+
+async def get_template(db, gym_id: str, template_id: str) -> Dict:
+    """The gym's latest version of a template, or the default (version 0)"""
+    async def load():
+        saved = await db.notification_templates.find_one(
+            {"gym_id": gym_id, "template_id": template_id},
+            {"_id": 0, "version": 1, "body": 1},
+            sort=[("version", DESCENDING)]
+        )
+        return saved or {"version": 0, "body": DEFAULT_TEMPLATES[template_id]}
+
+    template = await cache.get_or_load(gym_key(gym_id, "template", template_id), load, ttl=TEMPLATE_CACHE_TTL)
+    return {"template_id": template_id, **template}
+
+
+async def save_template(db, gym_id: str, template_id: str, body: str) -> Dict:
+    """Store `body` as the next version of the gym's template"""
+    validate_template(template_id, body)
+    while True:
+        latest = await db.notification_templates.find_one(
+            {"gym_id": gym_id, "template_id": template_id}, {"version": 1}, sort=[("version", DESCENDING)]
+        )
+        template = {
+            "gym_id": gym_id,
+            "template_id": template_id,
+            "version": (latest["version"] if latest else 0) + 1,
+            "body": body,
+            "created_at": datetime.utcnow(),
+        }
+        try:
+            await db.notification_templates.insert_one(template)
+            break
+        except DuplicateKeyError:
+            # Another save took this version number
+            continue
+
+    await cache.invalidate(gym_key(gym_id, "template", template_id))
+    return {"template_id": template_id, "version": template["version"], "body": body}
+
+
+async def render_notification(db, notification: Dict) -> Dict:
+    """
+    Queue entry as a sender receives it: the message rendered from the gym's
+    current template (entries without a template keep their stored message).
+    """
+    rendered = {key: value for key, value in notification.items() if key not in ("_id", "params")}
+    template_id = notification.get("template")
+    if template_id in DEFAULT_TEMPLATES:
+        template = await get_template(db, notification["gym_id"], template_id)
+        params = {
+            "gym_name": notification.get("gym_name"),
+            "member_name": notification.get("member_name"),
+            **notification.get("params", {}),
+        }
+        rendered["message"] = render(template["body"], params)
+        rendered["template_version"] = template["version"]
+    return rendered
+
+
+async def render_notifications(db, notifications: List[Dict]) -> List[Dict]:
+    return [await render_notification(db, notification) for notification in notifications]
@@ -0,0 +1,179 @@
+"""
+Payments ledger and revenue reports
+Every payment is appended to the `payments` collection and never updated.
+A per-gym, per-period document in `payment_rollups` is incremented alongside
+each entry, so monthly revenue and cash/online reports read one small
+document per month instead of scanning the ledger.
+"""
+
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from pymongo import ASCENDING
+from pymongo.errors import DuplicateKeyError
+
+from billing import current_period, members_collection_name, shift_period
+
+PAYMENT_METHODS = ("cash", "online")
+
+
+def rollup_id(gym_id: str, period: str) -> str:
+    return f"{gym_id}:{period}"
+
+
+def _method_key(method: Optional[str]) -> str:
+    # Used in rollup field paths, so only known names are allowed through
+    return method if method in PAYMENT_METHODS else "other"
+
+
+async def ensure_indexes(db):
+    """Indexes for ledger queries by gym and period (idempotent)"""
+    await db.payments.create_index([("gym_id", ASCENDING), ("period", ASCENDING)])
+    await db.payments.create_index([("gym_id", ASCENDING), ("member_id", ASCENDING), ("recorded_at", ASCENDING)])
+    await db.payment_rollups.create_index([("gym_id", ASCENDING), ("period", ASCENDING)])
+
+
+async def record_payment(
+    db,
+    gym_id: str,
+    member_id: str,
+    amount: float,
+    method: str,
+    source: str,
+    reference: Optional[str] = None,
+    period: Optional[str] = None,
+) -> Optional[Dict]:
+    """
+    Append a payment to the ledger and add it to its monthly rollup.
+
+    `reference` (e.g. the Razorpay payment id) makes the entry idempotent, so
+    the verify call and the webhook for the same payment record it once.
+    Returns the entry, or None if it had already been recorded.
+    """
+    period = period or current_period()
+    now = datetime.utcnow()
+    method_key = _method_key(method)
+    entry = {
+        "_id": f"{source}:{reference}" if reference else str(uuid.uuid4()),
+        "gym_id": gym_id,
+        "member_id": member_id,
+        "period": period,
+        "amount": round(float(amount or 0), 2),
+        "method": method_key,
+        "source": source,
+        "reference": reference,
+        "recorded_at": now,
+    }
+
+    try:
+        await db.payments.insert_one(entry)
+    except DuplicateKeyError:
+        return None
+
+    await db.payment_rollups.update_one(
+        {"_id": rollup_id(gym_id, period)},
+        {
+            "$inc": {
+                "total_amount": entry["amount"],
+                "payment_count": 1,
+                f"by_method.{method_key}.amount": entry["amount"],
+                f"by_method.{method_key}.count": 1,
+            },
+            "$set": {"updated_at": now},
+            "$setOnInsert": {"gym_id": gym_id, "period": period},
+        },
+        upsert=True
+    )
+    return entry
+
+
+async def rebuild_rollup(db, gym_id: str, period: str):
+    """Recompute one rollup from the ledger (repair after a partial write)"""
+    pipeline = [
+        {"$match": {"gym_id": gym_id, "period": period}},
+        {"$group": {
+            "_id": "$method",
+            "amount": {"$sum": "$amount"},
+            "count": {"$sum": 1},
+        }},
+    ]
+    by_method = {
+        row["_id"]: {"amount": row["amount"], "count": row["count"]}
+        async for row in db.payments.aggregate(pipeline)
+    }
+    await db.payment_rollups.replace_one(
+        {"_id": rollup_id(gym_id, period)},
+        {
+            "gym_id": gym_id,
+            "period": period,
+            "total_amount": sum(method["amount"] for method in by_method.values()),
+            "payment_count": sum(method["count"] for method in by_method.values()),
+            "by_method": by_method,
+            "updated_at": datetime.utcnow(),
+        },
+        upsert=True
+    )
+
+
+def _format_rollup(rollup: Dict) -> Dict:
+    by_method = rollup.get("by_method", {})
+    return {
+        "period": rollup["period"],
+        "total_amount": round(rollup.get("total_amount", 0), 2),
+        "payment_count": rollup.get("payment_count", 0),
+        "by_method": {
+            method: {
+                "amount": round(by_method.get(method, {}).get("amount", 0), 2),
+                "count": by_method.get(method, {}).get("count", 0),
+            }
+            for method in (*PAYMENT_METHODS, *(key for key in by_method if key not in PAYMENT_METHODS))
+        },
+    }
+
+
+async def monthly_revenue(db, gym_id: str, from_period: str, to_period: str) -> List[Dict]:
+    """Revenue per period (oldest first) from the rollups; empty months included"""
+    cursor = db.payment_rollups.find(
+        {"gym_id": gym_id, "period": {"$gte": from_period, "$lte": to_period}}
+    ).sort("period", ASCENDING)
+    rollups = {rollup["period"]: rollup async for rollup in cursor}
+
+    periods = []
+    period = from_period
+    while period <= to_period:
+        periods.append(_format_rollup(rollups.get(period, {"period": period})))
+        period = shift_period(period, 1)
+    return periods
+
+
+async def method_split(db, gym_id: str, period: str) -> Dict:
+    """Cash vs online amounts and shares for one period"""
+    rollup = await db.payment_rollups.find_one({"_id": rollup_id(gym_id, period)})
+    report = _format_rollup(rollup or {"period": period})
+    total = report["total_amount"]
+    for method in report["by_method"].values():
+        method["share"] = round(method["amount"] / total, 4) if total else 0.0
+    return report
+
+
+async def collection_rate(db, gym_id: str, period: str) -> Dict:
+    """Share of active members with a payment recorded for the period"""
+    paid_cursor = db.payments.aggregate([
+        {"$match": {"gym_id": gym_id, "period": period}},
+        {"$group": {"_id": "$member_id"}},
+        {"$count": "members"},
+    ])
+    paid = await paid_cursor.to_list(length=1)
+    members_paid = paid[0]["members"] if paid else 0
+
+    active_members = await db[members_collection_name(gym_id)].count_documents({"is_active": True})
+    rollup = await db.payment_rollups.find_one({"_id": rollup_id(gym_id, period)}, {"total_amount": 1})
+
+    return {
+        "period": period,
+        "members_paid": members_paid,
+        "active_members": active_members,
+        "collection_rate": round(min(members_paid / active_members, 1.0), 4) if active_members else 0.0,
+        "collected_amount": round(rollup.get("total_amount", 0), 2) if rollup else 0.0,
+    }
@@ -0,0 +1,219 @@
+"""
+On-demand sampling profiler for the live API
+Produces collapsed stacks ("frame;frame;frame count" lines) that flamegraph.pl,
+speedscope and similar tools read directly. Disabled unless PROFILING_ENABLED
+is set, and every use requires the ADMIN_TOKEN admin token.
+"""
+
+import asyncio
+import os
+import signal
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from typing import Callable, Dict, Optional
+
+from admin_auth import is_admin_token
+
+PROFILING_ENABLED = os.environ.get("PROFILING_ENABLED", "false").lower() == "true"
+PROFILE_HEADER = "x-profile"
+PROFILE_ID_HEADER = "X-Profile-Id"
+MAX_PROFILE_SECONDS = 60
+DEFAULT_INTERVAL_MS = 5
+# Per-request profiles kept for retrieval, and how many may run at once
+MAX_STORED_REQUEST_PROFILES = 50
+MAX_CONCURRENT_REQUEST_PROFILES = 4
+
+_process_profile_lock = asyncio.Lock()
+_request_profiles: "OrderedDict[str, Dict]" = OrderedDict()
+_active_request_profiles = 0
+
+
+def is_authorized(token: Optional[str]) -> bool:
+    """Profiling is off unless enabled and the caller presents the admin token"""
+    return PROFILING_ENABLED and is_admin_token(token)
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+def _stack_key(frame, root: Optional[str] = None) -> str:
+    frames = []
+    while frame is not None:
+        frames.append(_frame_label(frame))
+        frame = frame.f_back
+    if root:
+        frames.append(root)
+    return ";".join(reversed(frames))
+
+
+def collapse(stacks: Counter) -> str:
+    return "\n".join(f"{stack} {count}" for stack, count in stacks.most_common()) + "\n"
+
+
+class StackSampler(threading.Thread):
+    """
+    Samples Python stacks from a background thread at a fixed interval (wall clock).
+
+    `thread_id` limits sampling to one thread; `should_sample` can skip
+    samples (e.g. when another request's task is running on the loop).
+    """
+
+    def __init__(self, interval: float, thread_id: Optional[int] = None, should_sample: Callable[[], bool] = None):
+        super().__init__(name="stack-sampler", daemon=True)
+        self.interval = interval
+        self.thread_id = thread_id
+        self.should_sample = should_sample
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        own_id = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+
+        while not self._stop_event.wait(self.interval):
+            if self.should_sample and not self.should_sample():
+                continue
+            frames = sys._current_frames()
+            if self._stop_event.is_set():
+                # Sampled while being stopped; the target is just waiting in stop()
+                break
+            self.samples += 1
+            for thread_id, frame in frames.items():
+                if thread_id == own_id or (self.thread_id is not None and thread_id != self.thread_id):
+                    continue
+                root = None if self.thread_id is not None else names.get(thread_id, f"thread-{thread_id}")
+                self.stacks[_stack_key(frame, root)] += 1
+
+    def stop(self) -> Counter:
+        self._stop_event.set()
+        self.join()
+        return self.stacks
+
+
+async def profile_process(seconds: float, mode: str = "wall", interval_ms: float = DEFAULT_INTERVAL_MS) -> Dict:
+    """
+    Profile the whole process for `seconds`.
+
+    wall: every thread sampled on a timer, including time spent waiting.
+    cpu:  SIGPROF fires per interval of process CPU time and records the
+          event-loop (main) thread's stack; idle time is not sampled.
+    """
+    seconds = min(max(seconds, 0.1), MAX_PROFILE_SECONDS)
+    interval = max(interval_ms, 1) / 1000
+
+    if _process_profile_lock.locked():
+        raise RuntimeError("A profile is already running")
+
+    async with _process_profile_lock:
+        started = time.perf_counter()
+        if mode == "cpu":
+            stacks = await _profile_cpu(seconds, interval)
+        else:
+            sampler = StackSampler(interval)
+            sampler.start()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                stacks = sampler.stop()
+
+        return {
+            "mode": mode,
+            "duration_seconds": round(time.perf_counter() - started, 3),
+            "samples": sum(stacks.values()),
+            "collapsed": collapse(stacks),
+        }
+
+
+async def _profile_cpu(seconds: float, interval: float) -> Counter:
+    if threading.current_thread() is not threading.main_thread():
+        raise RuntimeError("CPU profiling needs the event loop in the main thread")
+
+    stacks: Counter = Counter()
+
+    def handler(signum, frame):
+        stacks[_stack_key(frame)] += 1
+
+    previous = signal.signal(signal.SIGPROF, handler)
+    signal.setitimer(signal.ITIMER_PROF, interval, interval)
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, previous)
+    return stacks
+
+
+def get_request_profile(profile_id: str) -> Optional[Dict]:
+    return _request_profiles.get(profile_id)
+
+
+def _store_request_profile(profile_id: str, profile: Dict):
+    _request_profiles[profile_id] = profile
+    while len(_request_profiles) > MAX_STORED_REQUEST_PROFILES:
+        _request_profiles.popitem(last=False)
+
+
+class RequestProfilerMiddleware:
+    """
+    Profiles a single request when it sends `X-Profile: 1` with a valid
+    `X-Admin-Token`. Samples are only taken while the request's own task is
+    running on the loop, so concurrent requests do not leak into the profile.
+    The response carries an X-Profile-Id for GET /api/admin/profile/requests/{id}.
+    """
+
+    def __init__(self, app, interval_ms: float = 1):
+        self.app = app
+        self.interval = interval_ms / 1000
+
+    async def __call__(self, scope, receive, send):
+        global _active_request_profiles
+
+        if scope["type"] != "http" or not PROFILING_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        wants_profile = headers.get(PROFILE_HEADER.encode()) in (b"1", b"true")
+        token = headers.get(b"x-admin-token", b"").decode()
+        if not wants_profile or not is_authorized(token) or _active_request_profiles >= MAX_CONCURRENT_REQUEST_PROFILES:
+            await self.app(scope, receive, send)
+            return
+
+        loop = asyncio.get_running_loop()
+        task = asyncio.current_task()
+        profile_id = uuid.uuid4().hex
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [
+                    (PROFILE_ID_HEADER.encode(), profile_id.encode())
+                ]
+            await send(message)
+
+        sampler = StackSampler(
+            self.interval,
+            thread_id=threading.get_ident(),
+            should_sample=lambda: asyncio.current_task(loop) is task,
+        )
+        _active_request_profiles += 1
+        started = time.perf_counter()
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            stacks = sampler.stop()
+            _active_request_profiles -= 1
+            _store_request_profile(profile_id, {
+                "id": profile_id,
+                "method": scope["method"],
+                "path": scope["path"],
+                "duration_seconds": round(time.perf_counter() - started, 4),
+                "samples": sum(stacks.values()),
+                "collapsed": collapse(stacks),
+            })
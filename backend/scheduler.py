@@ -1,82 +1,379 @@
 """
 Scheduler for Gym Management SaaS
-Handles monthly fee resets and WhatsApp reminders
+Handles WhatsApp reminders and queue cleanup. Monthly fees need no job:
+members roll into a new billing period lazily (see billing.py).
+
+Runs inside the API process on the same event loop and MongoDB client.
+Job state is persisted in the `scheduled_jobs` collection and the
+"scheduler" lease makes sure only one replica fires jobs at a time.
 """
 
 import asyncio
-import schedule
-import time
-from datetime import datetime
-from whatsapp_service import run_monthly_reminders
-import requests
 import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List, Optional
+from zoneinfo import ZoneInfo
 
-# Backend URL for API calls
-BACKEND_URL = os.environ.get("BACKEND_URL", "http://localhost:8001")
+from coordination import INSTANCE_ID, LeaseLock, run_exclusive
 
-def reset_monthly_fees():
-    """Reset monthly fees on the 1st of each month"""
-    try:
-        response = requests.post(f"{BACKEND_URL}/api/admin/reset-monthly-fees")
-        if response.status_code == 200:
-            result = response.json()
-            print(f"Monthly fees reset: {result}")
-        else:
-            print(f"Failed to reset monthly fees: {response.text}")
-    except Exception as e:
-        print(f"Error resetting monthly fees: {e}")
-
-def send_daily_reminders():
-    """Send WhatsApp reminders daily during reminder period (1st-7th)"""
-    try:
-        result = asyncio.run(run_monthly_reminders())
-        print(f"Daily reminders result: {result}")
-    except Exception as e:
-        print(f"Error sending daily reminders: {e}")
+# Environment variables
+SCHEDULER_ENABLED = os.environ.get("SCHEDULER_ENABLED", "true").lower() == "true"
+SCHEDULER_TIMEZONE = os.environ.get("SCHEDULER_TIMEZONE", "Asia/Kolkata")
+SCHEDULER_POLL_SECONDS = int(os.environ.get("SCHEDULER_POLL_SECONDS", "30"))
+SCHEDULER_LEASE_SECONDS = int(os.environ.get("SCHEDULER_LEASE_SECONDS", "90"))
+
+
+class CronTrigger:
+    """Standard 5-field cron expression: minute hour day-of-month month day-of-week"""
+
+    # Day of week accepts 7 as well as 0 for Sunday
+    FIELD_RANGES = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+    def __init__(self, expression: str, tz: str = SCHEDULER_TIMEZONE):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression must have 5 fields: {expression!r}")
+
+        self.expression = expression
+        self.timezone = ZoneInfo(tz)
+        self.minutes, self.hours, self.days, self.months, self.weekdays = [
+            self._parse_field(field, low, high)
+            for field, (low, high) in zip(fields, self.FIELD_RANGES)
+        ]
+        if 7 in self.weekdays:
+            self.weekdays = (self.weekdays - {7}) | {0}
+        # Cron semantics: when both day fields are restricted either one may match
+        self.day_restricted = fields[2] != "*"
+        self.weekday_restricted = fields[4] != "*"
+
+    @staticmethod
+    def _parse_field(field: str, low: int, high: int) -> set:
+        values = set()
+        for part in field.split(","):
+            step = 1
+            if "/" in part:
+                part, step_str = part.split("/", 1)
+                step = int(step_str)
+            if part == "*":
+                start, end = low, high
+            elif "-" in part:
+                start_str, end_str = part.split("-", 1)
+                start, end = int(start_str), int(end_str)
+            else:
+                start = end = int(part)
+                if step != 1:
+                    end = high
+
+            if start < low or end > high or start > end or step < 1:
+                raise ValueError(f"Invalid cron field: {field!r}")
+            values.update(range(start, end + 1, step))
+        return values
+
+    def _day_matches(self, moment: datetime) -> bool:
+        day_ok = moment.day in self.days
+        weekday_ok = (moment.weekday() + 1) % 7 in self.weekdays
+        if self.day_restricted and self.weekday_restricted:
+            return day_ok or weekday_ok
+        return day_ok and weekday_ok
+
+    def next_fire_time(self, after: datetime) -> datetime:
+        """Next fire time strictly after `after` (naive UTC in, naive UTC out)"""
+        local = after.replace(tzinfo=timezone.utc).astimezone(self.timezone).replace(tzinfo=None)
+        candidate = local.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = candidate + timedelta(days=366 * 5)
+
+        while candidate <= limit:
+            if candidate.month not in self.months:
+                year = candidate.year + (candidate.month == 12)
+                month = candidate.month % 12 + 1
+                candidate = datetime(year, month, 1)
+                continue
+            if not self._day_matches(candidate):
+                candidate = candidate.replace(hour=0, minute=0) + timedelta(days=1)
+                continue
+            if candidate.hour not in self.hours:
+                candidate = candidate.replace(minute=0) + timedelta(hours=1)
+                continue
+            if candidate.minute not in self.minutes:
+                candidate += timedelta(minutes=1)
+                continue
+
+            return candidate.replace(tzinfo=self.timezone).astimezone(timezone.utc).replace(tzinfo=None)
+
+        raise ValueError(f"Cron expression never fires: {self.expression!r}")
+
+
+class ScheduledJob:
+    def __init__(
+        self,
+        job_id: str,
+        trigger: CronTrigger,
+        func: Callable[[], Awaitable],
+        misfire_grace_seconds: int = 3600,
+        description: str = "",
+    ):
+        self.id = job_id
+        self.trigger = trigger
+        self.func = func
+        self.misfire_grace_seconds = misfire_grace_seconds
+        self.description = description
+
+
+class JobScheduler:
+    """Asyncio job scheduler with Mongo-persisted state and single-leader execution"""
+
+    def __init__(
+        self,
+        db,
+        poll_interval: int = SCHEDULER_POLL_SECONDS,
+        lease_seconds: int = SCHEDULER_LEASE_SECONDS,
+    ):
+        self.db = db
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.instance_id = INSTANCE_ID
+        self.leader_lease = LeaseLock(db, "scheduler", lease_seconds)
+        self.jobs: Dict[str, ScheduledJob] = {}
+        self.is_leader = False
+        self._loop_task: Optional[asyncio.Task] = None
+        self._running: Dict[str, asyncio.Task] = {}
+
+    def add_job(
+        self,
+        job_id: str,
+        cron: str,
+        func: Callable[[], Awaitable],
+        misfire_grace_seconds: int = 3600,
+        description: str = "",
+    ) -> ScheduledJob:
+        """Register a job; must be called before start()"""
+        job = ScheduledJob(job_id, CronTrigger(cron), func, misfire_grace_seconds, description)
+        self.jobs[job_id] = job
+        return job
+
+    async def start(self):
+        """Persist job definitions and start the polling loop"""
+        await self._sync_jobs()
+        self._loop_task = asyncio.create_task(self._run_loop())
+        print(f"Scheduler {self.instance_id} started with {len(self.jobs)} jobs")
+
+    async def shutdown(self):
+        """Stop polling, wait for running jobs and give up leadership"""
+        if self._loop_task:
+            self._loop_task.cancel()
+            try:
+                await self._loop_task
+            except asyncio.CancelledError:
+                pass
+            self._loop_task = None
+
+        if self._running:
+            await asyncio.gather(*self._running.values(), return_exceptions=True)
+
+        if self.is_leader:
+            await self.leader_lease.release()
+            self.is_leader = False
+
+    async def _sync_jobs(self):
+        """Create job documents and recompute next runs when a schedule changed"""
+        now = datetime.utcnow()
+        for job in self.jobs.values():
+            state = await self.db.scheduled_jobs.find_one({"_id": job.id})
+            if state and state.get("cron") == job.trigger.expression:
+                continue
+
+            await self.db.scheduled_jobs.update_one(
+                {"_id": job.id},
+                {
+                    "$set": {
+                        "cron": job.trigger.expression,
+                        "description": job.description,
+                        "next_run_at": job.trigger.next_fire_time(now),
+                    },
+                    "$setOnInsert": {"created_at": now},
+                },
+                upsert=True,
+            )
+
+    async def _run_loop(self):
+        while True:
+            try:
+                await self._tick()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Scheduler tick failed: {e}")
+            await asyncio.sleep(self.poll_interval)
+
+    async def _tick(self):
+        if self.is_leader:
+            self.is_leader = await self.leader_lease.renew()
+        if not self.is_leader:
+            self.is_leader = await self.leader_lease.acquire()
+        if not self.is_leader:
+            return
+
+        now = datetime.utcnow()
+        due_cursor = self.db.scheduled_jobs.find({"_id": {"$in": list(self.jobs)}, "next_run_at": {"$lte": now}})
+        for state in await due_cursor.to_list(length=None):
+            await self._fire(self.jobs[state["_id"]], state["next_run_at"], now)
 
-def setup_scheduler():
+    async def _fire(self, job: ScheduledJob, fire_time: datetime, now: datetime):
+        """Claim a due fire time and run the job unless it misfired"""
+        # Missed fire times are coalesced into a single run
+        next_run = job.trigger.next_fire_time(now)
+        claimed = await self.db.scheduled_jobs.find_one_and_update(
+            {"_id": job.id, "next_run_at": fire_time},
+            {"$set": {"next_run_at": next_run, "last_fire_time": fire_time}},
+        )
+        if not claimed:
+            return
+
+        lateness = (now - fire_time).total_seconds()
+        if lateness > job.misfire_grace_seconds:
+            print(f"Job {job.id} misfired: scheduled {fire_time}, {int(lateness)}s late")
+            await self.db.scheduled_jobs.update_one(
+                {"_id": job.id},
+                {"$set": {"last_status": "misfired", "last_misfire_at": now}, "$inc": {"misfire_count": 1}},
+            )
+            return
+
+        if job.id in self._running and not self._running[job.id].done():
+            print(f"Job {job.id} still running, skipping fire time {fire_time}")
+            return
+
+        task = asyncio.create_task(self.run_job(job.id))
+        self._running[job.id] = task
+        task.add_done_callback(lambda _: self._running.pop(job.id, None))
+
+    async def run_job(self, job_id: str):
+        """Run a job immediately and record the outcome"""
+        job = self.jobs[job_id]
+        started_at = datetime.utcnow()
+        started = time.perf_counter()
+        await self.db.scheduled_jobs.update_one(
+            {"_id": job.id},
+            {"$set": {"last_status": "running", "last_started_at": started_at, "last_run_by": self.instance_id}},
+        )
+
+        try:
+            # Guards against overlap with manual runs of the same job on other replicas
+            result = await run_exclusive(self.db, f"job:{job.id}", job.func)
+            update = {"last_status": "success", "last_result": result, "last_error": None}
+            print(f"Job {job.id} completed: {result}")
+        except Exception as e:
+            result = None
+            update = {"last_status": "error", "last_error": str(e)}
+            print(f"Job {job.id} failed: {e}")
+
+        update["last_finished_at"] = datetime.utcnow()
+        update["last_duration_seconds"] = round(time.perf_counter() - started, 3)
+        await self.db.scheduled_jobs.update_one({"_id": job.id}, {"$set": update})
+        return result
+
+    async def get_jobs(self) -> List[Dict]:
+        """Persisted state of all registered jobs"""
+        cursor = self.db.scheduled_jobs.find({"_id": {"$in": list(self.jobs)}})
+        jobs = await cursor.to_list(length=None)
+        for job in jobs:
+            job["id"] = job.pop("_id")
+        return jobs
+
+
+async def send_daily_reminders():
+    """Send WhatsApp reminders (only sends during the 1st-7th reminder period)"""
+    from whatsapp_service import run_monthly_reminders
+
+    return await run_monthly_reminders()
+
+
+async def cleanup_notifications():
+    """Archive completed notifications and remove expired payment sessions"""
+    from whatsapp_automation import whatsapp_automation
+
+    result = await run_exclusive(whatsapp_automation.db, "cleanup_old_notifications", whatsapp_automation.cleanup_old_notifications)
+    return {"status": "completed", **(result or {})}
+
+
+async def pace_notifications():
+    """Re-plan send slots so each sender's queue is spread over the send windows"""
+    from send_pacing import pace_queue
+    from whatsapp_automation import whatsapp_automation
+
+    return await run_exclusive(whatsapp_automation.db, "notification_pacing", lambda: pace_queue(whatsapp_automation.db))
+
+
+def setup_scheduler(db) -> JobScheduler:
     """Setup the scheduler for all recurring tasks"""
-    
-    # Reset monthly fees on the 1st of every month at 1 AM
-    schedule.every().month.at("01:00").do(reset_monthly_fees)
-    
-    # Send reminders daily at 10 AM (will only send during 1st-7th period)
-    schedule.every().day.at("10:00").do(send_daily_reminders)
-    
-    # Send reminders daily at 6 PM (will only send during 1st-7th period)
-    schedule.every().day.at("18:00").do(send_daily_reminders)
-    
-    print("Scheduler setup complete:")
-    print("- Monthly fee reset: 1st of every month at 1:00 AM")
-    print("- WhatsApp reminders: Daily at 10:00 AM and 6:00 PM (1st-7th only)")
-
-def run_scheduler():
-    """Run the scheduler continuously"""
-    setup_scheduler()
-    
+    scheduler = JobScheduler(db)
+
+    # Send reminders daily at 10 AM and 6 PM (will only send during 1st-7th period)
+    scheduler.add_job(
+        "reminders_morning", "0 10 * * *", send_daily_reminders,
+        misfire_grace_seconds=3600,
+        description="WhatsApp reminders: daily at 10:00 AM (1st-7th only)",
+    )
+    scheduler.add_job(
+        "reminders_evening", "0 18 * * *", send_daily_reminders,
+        misfire_grace_seconds=3600,
+        description="WhatsApp reminders: daily at 6:00 PM (1st-7th only)",
+    )
+
+    # Re-plan notification send slots as the queue and sent counts change
+    scheduler.add_job(
+        "notification_pacing", "*/15 * * * *", pace_notifications,
+        misfire_grace_seconds=600,
+        description="Notification send pacing: every 15 minutes",
+    )
+
+    # Archive completed notifications in bounded runs (skipped during send windows)
+    scheduler.add_job(
+        "notification_cleanup", "30 * * * *", cleanup_notifications,
+        misfire_grace_seconds=1800,
+        description="Notification archival: hourly at :30 outside send windows",
+    )
+
+    return scheduler
+
+
+async def run_scheduler():
+    """Run the scheduler as a standalone process"""
+    from server import db
+
+    scheduler = setup_scheduler(db)
+    await scheduler.start()
+
     print(f"Scheduler started at {datetime.now()}")
     print("Waiting for scheduled tasks...")
-    
-    while True:
-        schedule.run_pending()
-        time.sleep(60)  # Check every minute
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await scheduler.shutdown()
+
 
 if __name__ == "__main__":
     # For testing - you can run specific tasks
     import sys
-    
-    if len(sys.argv) > 1:
-        if sys.argv[1] == "reset":
+
+    async def run_task(task: str):
+        if task == "reset":
+            from server import reset_monthly_fees
+
             print("Testing monthly fee reset...")
-            reset_monthly_fees()
-        elif sys.argv[1] == "reminders":
+            print(f"Monthly fees reset: {await reset_monthly_fees()}")
+        elif task == "reminders":
             print("Testing WhatsApp reminders...")
-            send_daily_reminders()
-        elif sys.argv[1] == "schedule":
-            print("Running scheduler...")
-            run_scheduler()
+            print(f"Daily reminders result: {await send_daily_reminders()}")
+
+    if len(sys.argv) > 1 and sys.argv[1] in ("reset", "reminders"):
+        asyncio.run(run_task(sys.argv[1]))
+    elif len(sys.argv) > 1 and sys.argv[1] == "schedule":
+        print("Running scheduler...")
+        asyncio.run(run_scheduler())
     else:
         print("Usage:")
         print("  python scheduler.py reset      - Test monthly fee reset")
         print("  python scheduler.py reminders  - Test WhatsApp reminders")
-        print("  python scheduler.py schedule   - Run continuous scheduler")
\ No newline at end of file
+        print("  python scheduler.py schedule   - Run standalone scheduler (normally embedded in the API)")
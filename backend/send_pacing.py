@@ -0,0 +1,289 @@
+"""
+Send pacing for the WhatsApp notification queue
+Instead of sending until the hourly limit trips at the top of each hour, the
+planner gives every pending notification a target send slot: each sender's
+daily budget is spread evenly over the sending windows in the gym's local
+time (by default the 10:00 and 18:00 reminder campaigns). The slot is
+written to `next_attempt_at`, so the claim query only hands out
+notifications whose slot has come. One-off sends (manual notifications on
+their first attempt) get no slot and go out at once, but count against their
+sender's budget. Redundant notifications are coalesced first (see
+coalescing.py) so they take no slot.
+"""
+
+import heapq
+import os
+from collections import Counter, defaultdict
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from pymongo import UpdateOne
+
+from billing import BILLING_TIMEZONE
+from coalescing import COALESCE_FIELDS, apply_merges, coalesce, coalesce_report, phones_in_several_gyms
+from notification_queue import MAX_PER_DAY, MAX_PER_HOUR_RANGE, sender_sent_counts, sends_immediately
+from sender_pool import pool_senders, sender_pool
+
+# Environment variables
+# Comma-separated local-time windows; sends are spread across their open time
+SEND_WINDOWS = os.environ.get("SEND_WINDOWS", "10:00-13:00,18:00-21:00")
+SEND_PLAN_HORIZON_DAYS = int(os.environ.get("SEND_PLAN_HORIZON_DAYS", "14"))
+SEND_PLAN_PAGE_GYMS = int(os.environ.get("SEND_PLAN_PAGE_GYMS", "100"))
+
+# Slots that moved less than this are not rewritten
+SEND_PLAN_RESLOT_SECONDS = 300
+
+PACING_FIELDS = {
+    "_id": 1, "id": 1, "gym_id": 1, "member_id": 1, "sender_number": 1, "priority": 1, "created_at": 1, "retry_at": 1,
+    "next_attempt_at": 1,
+}
+OWNER_FIELDS = {"_id": 0, "id": 1, "phone": 1, "timezone": 1, "whatsapp_sender_number": 1, "whatsapp_sender_numbers": 1}
+
+
+def parse_windows(spec: str) -> List[Tuple[time, time]]:
+    """"10:00-13:00,18:00-21:00" -> [(10:00, 13:00), (18:00, 21:00)]"""
+    windows = []
+    for window in spec.split(","):
+        start, end = (time.fromisoformat(part.strip()) for part in window.split("-"))
+        if end <= start:
+            raise ValueError(f"Send window {window!r} must end after it starts")
+        windows.append((start, end))
+    return sorted(windows)
+
+
+def to_utc(moment: datetime) -> datetime:
+    return moment.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def local_date(moment: datetime, tz: ZoneInfo) -> date:
+    """Local date of a naive UTC moment"""
+    return moment.replace(tzinfo=timezone.utc).astimezone(tz).date()
+
+
+def open_intervals(
+    day: date, tz: ZoneInfo, windows: List[Tuple[time, time]], after: datetime
+) -> List[Tuple[datetime, datetime]]:
+    """A local day's sending windows as naive UTC intervals, clipped to start at `after`"""
+    intervals = []
+    for start, end in windows:
+        start_utc = to_utc(datetime.combine(day, start, tz))
+        end_utc = to_utc(datetime.combine(day, end, tz))
+        if end_utc > after:
+            intervals.append((max(start_utc, after), end_utc))
+    return intervals
+
+
+def spread(intervals: List[Tuple[datetime, datetime]], count: int) -> List[datetime]:
+    """`count` evenly spaced moments over the open time of `intervals`"""
+    open_seconds = sum((end - start).total_seconds() for start, end in intervals)
+    gap = open_seconds / count
+    moments = []
+    for i in range(count):
+        offset = gap * i
+        for start, end in intervals:
+            length = (end - start).total_seconds()
+            if offset < length:
+                moments.append(start + timedelta(seconds=offset))
+                break
+            offset -= length
+    return moments
+
+
+def plan_sender(
+    notifications: List[Dict],
+    now: datetime,
+    tz: ZoneInfo,
+    windows: List[Tuple[time, time]],
+    per_hour: int = MAX_PER_HOUR_RANGE[0],
+    per_day: int = MAX_PER_DAY,
+    sent_today: int = 0,
+    horizon_days: int = SEND_PLAN_HORIZON_DAYS,
+) -> Dict[str, datetime]:
+    """
+    Send slot (naive UTC) per notification id for one sender.
+
+    Each day gets at most `per_day` sends (less what was already sent today),
+    evenly spaced over the remaining window time and never closer than
+    3600 / `per_hour` seconds apart. Slots go to the highest-priority, oldest
+    notification that is eligible (a failed one not before its retry_at).
+    Notifications that do not fit within the horizon get no slot.
+    """
+    min_gap = 3600 / per_hour
+    waiting = sorted(notifications, key=lambda n: n.get("retry_at") or datetime.min)
+    eligible = []
+    slots = {}
+    next_waiting = 0
+    budget = per_day - sent_today
+    day = local_date(now, tz)
+
+    for _ in range(horizon_days):
+        if len(slots) == len(notifications):
+            break
+        intervals = open_intervals(day, tz, windows, now)
+        open_seconds = sum((end - start).total_seconds() for start, end in intervals)
+        count = min(len(notifications) - len(slots), max(budget, 0), int(open_seconds // min_gap))
+        for moment in spread(intervals, count) if count else []:
+            while next_waiting < len(waiting) and (waiting[next_waiting].get("retry_at") or datetime.min) <= moment:
+                notification = waiting[next_waiting]
+                created_at = notification.get("created_at") or datetime.min
+                heapq.heappush(eligible, (-notification.get("priority", 0), created_at, next_waiting))
+                next_waiting += 1
+            if eligible:
+                slots[waiting[heapq.heappop(eligible)[2]]["id"]] = moment
+        day += timedelta(days=1)
+        budget = per_day
+
+    return slots
+
+
+def plan_sends(
+    notifications: Iterable[Dict],
+    now: datetime,
+    timezones: Dict[str, str],
+    sent_today: Dict[str, int],
+    windows: Optional[List[Tuple[time, time]]] = None,
+    per_hour: int = MAX_PER_HOUR_RANGE[0],
+    per_day: int = MAX_PER_DAY,
+) -> Tuple[Dict[str, datetime], Dict]:
+    """
+    Plan every sender's pending notifications.
+
+    Returns (slot per notification id, report) where the report projects
+    when each gym's and each sender's queue will be drained.
+    """
+    windows = windows or parse_windows(SEND_WINDOWS)
+    by_sender = defaultdict(list)
+    for notification in notifications:
+        by_sender[notification.get("sender_number")].append(notification)
+
+    slots = {}
+    for sender, queued in by_sender.items():
+        # update_whatsapp_config keeps a sender number to one gym, so its local time is that gym's
+        tz = ZoneInfo(timezones.get(queued[0]["gym_id"], BILLING_TIMEZONE))
+        slots.update(plan_sender(queued, now, tz, windows, per_hour, per_day, sent_today.get(sender, 0)))
+
+    def projection(queued: List[Dict]) -> Dict:
+        planned = [slots[n["id"]] for n in queued if n["id"] in slots]
+        return {
+            "pending": len(queued),
+            "unscheduled": len(queued) - len(planned),
+            "first_send_at": min(planned).isoformat() if planned else None,
+            "projected_completion_at": max(planned).isoformat() if planned else None,
+        }
+
+    by_gym = defaultdict(list)
+    for queued in by_sender.values():
+        for notification in queued:
+            by_gym[notification["gym_id"]].append(notification)
+
+    report = {
+        "planned_at": now.isoformat(),
+        "windows": [f"{start:%H:%M}-{end:%H:%M}" for start, end in windows],
+        "per_hour": per_hour,
+        "per_day": per_day,
+        "gyms": {gym_id: projection(queued) for gym_id, queued in by_gym.items()},
+        "senders": {str(sender): projection(queued) for sender, queued in by_sender.items()},
+    }
+    return slots, report
+
+
+async def pending_gym_ids(db) -> List[str]:
+    return sorted([
+        row["_id"] async for row in db.notification_queue.aggregate([
+            {"$match": {"status": "pending"}},
+            {"$group": {"_id": "$gym_id"}},
+        ])
+    ])
+
+
+def slot_changed(old: Optional[datetime], new: Optional[datetime]) -> bool:
+    """Whether a slot moved enough to be worth rewriting"""
+    if old is None or new is None:
+        return old is not new
+    return abs((new - old).total_seconds()) >= SEND_PLAN_RESLOT_SECONDS
+
+
+async def pace_gyms(db, gym_ids: List[str], apply: bool, now: datetime) -> Tuple[Dict, Dict, int]:
+    """Coalesce and plan one page of gyms; returns (plan report, coalescing report, slots written)"""
+    notifications = await db.notification_queue.find(
+        {"status": "pending", "gym_id": {"$in": gym_ids}}, {**PACING_FIELDS, **COALESCE_FIELDS}
+    ).to_list(length=None)
+
+    merges, priorities = coalesce(notifications)
+    coalescing = coalesce_report(notifications, merges)
+    if apply:
+        await apply_merges(db, merges, priorities, now)
+    merged = {merge["id"] for merge in merges}
+    notifications = [notification for notification in notifications if notification["id"] not in merged]
+    for notification in notifications:
+        if notification["id"] in priorities:
+            notification["priority"] = priorities[notification["id"]]
+
+    owners = {owner["id"]: owner async for owner in db.gym_owners.find({"id": {"$in": gym_ids}}, OWNER_FIELDS)}
+    timezones = {gym_id: owner.get("timezone") or BILLING_TIMEZONE for gym_id, owner in owners.items()}
+    # Today's sends from the rate counters claim_notifications enforces
+    senders = {number for owner in owners.values() for number in sender_pool(owner)}
+    senders |= {notification.get("sender_number") for notification in notifications}
+    sent_today = {sender: day_count for sender, (_, day_count) in (await sender_sent_counts(db, senders, now)).items()}
+
+    # Spread each gym's notifications over its sender numbers before planning per number
+    moved = {notification["id"] for notification in await pool_senders(db, notifications, owners, sent_today, save=apply)}
+
+    # One-off sends go out unpaced; the planner leaves room for them in their sender's budget
+    immediate = [notification for notification in notifications if sends_immediately(notification)]
+    for notification in immediate:
+        sent_today[notification.get("sender_number")] = sent_today.get(notification.get("sender_number"), 0) + 1
+    paced = [notification for notification in notifications if not sends_immediately(notification)]
+    slots, report = plan_sends(paced, now, timezones, sent_today)
+
+    operations = []
+    if apply:
+        for notification in notifications:
+            update = {}
+            slot = slots.get(notification["id"])
+            if sends_immediately(notification):
+                # A slot from before it counted as immediate would only delay it
+                if notification.get("next_attempt_at"):
+                    update = {"$unset": {"next_attempt_at": ""}}
+            elif slot_changed(notification.get("next_attempt_at"), slot):
+                # Notifications that got no slot lose their old one and wait for a later plan
+                update = {"$set": {"next_attempt_at": slot}} if slot else {"$unset": {"next_attempt_at": ""}}
+            if notification["id"] in moved:
+                update.setdefault("$set", {})["sender_number"] = notification["sender_number"]
+            if update:
+                operations.append(UpdateOne({"_id": notification["_id"], "status": "pending"}, update))
+        if operations:
+            await db.notification_queue.bulk_write(operations, ordered=False)
+    return report, coalescing, len(operations)
+
+
+async def pace_queue(db, apply: bool = True, now: Optional[datetime] = None) -> Dict:
+    """
+    Coalesce and plan send slots for all pending notifications and (if
+    `apply`) store the slots that changed.
+
+    Gyms are planned SEND_PLAN_PAGE_GYMS at a time (a sender number belongs
+    to one gym, see update_whatsapp_config, so pages are independent), which
+    bounds how much of the queue is held in memory.
+    """
+    now = now or datetime.utcnow()
+    _, report = plan_sends([], now, {}, {})
+    coalescing = {"budget_saved": 0, "by_reason": Counter(), "gyms": {}}
+    updated = 0
+
+    gym_ids = await pending_gym_ids(db)
+    for start in range(0, len(gym_ids), SEND_PLAN_PAGE_GYMS):
+        page_report, page_coalescing, page_updated = await pace_gyms(
+            db, gym_ids[start:start + SEND_PLAN_PAGE_GYMS], apply, now
+        )
+        report["gyms"].update(page_report["gyms"])
+        report["senders"].update(page_report["senders"])
+        coalescing["budget_saved"] += page_coalescing["budget_saved"]
+        coalescing["by_reason"].update(page_coalescing["by_reason"])
+        coalescing["gyms"].update(page_coalescing["gyms"])
+        updated += page_updated
+
+    coalescing["by_reason"] = dict(coalescing["by_reason"])
+    coalescing["phones_in_several_gyms"] = await phones_in_several_gyms(db)
+    return {**report, "updated": updated, "coalescing": coalescing}
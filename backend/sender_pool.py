@@ -0,0 +1,208 @@
+"""
+WhatsApp sender-number pools
+A gym can register several sender numbers, each with its own hourly and
+daily limit. When sends are planned, each member's notifications go to the
+number the member was first assigned (kept in `sender_assignments`, so a
+member keeps hearing from the same number) and new members go to the number
+with the most budget left. A number belongs to one gym: send pacing plans
+each number's budget in that gym's timezone.
+"""
+
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import OperationFailure
+
+from notification_queue import MAX_PER_DAY, sender_sent_counts
+
+SENDER_POOL_MAX = 10
+# Failure share over the last day above which a number is reported degraded
+SENDER_DEGRADED_FAILURE_RATE = 0.2
+
+
+def sender_pool(gym_owner: Dict) -> List[str]:
+    """A gym's sender numbers, primary first"""
+    if gym_owner.get("whatsapp_sender_numbers"):
+        return gym_owner["whatsapp_sender_numbers"]
+    return [gym_owner.get("whatsapp_sender_number") or gym_owner["phone"]]
+
+
+def assignment_id(gym_id: str, member_id: str) -> str:
+    return f"{gym_id}:{member_id}"
+
+
+async def ensure_indexes(db):
+    await db.sender_assignments.create_index([("gym_id", ASCENDING), ("sender_number", ASCENDING)])
+    try:
+        # No number in two gyms' pools (a multikey unique index compares across documents)
+        await db.gym_owners.create_index(
+            "whatsapp_sender_numbers",
+            unique=True,
+            partialFilterExpression={"whatsapp_sender_numbers": {"$exists": True}},
+        )
+    except OperationFailure as e:
+        # Existing duplicates: update_whatsapp_config still rejects new ones
+        print(f"Sender number index not created: {e}")
+
+
+async def sender_numbers_in_use(db, numbers: List[str], gym_id: str) -> List[str]:
+    """Those of `numbers` another gym already sends from"""
+    taken = set()
+    async for owner in db.gym_owners.find(
+        {
+            "id": {"$ne": gym_id},
+            "$or": [{"whatsapp_sender_numbers": {"$in": numbers}}, {"whatsapp_sender_number": {"$in": numbers}}],
+        },
+        {"_id": 0, "whatsapp_sender_number": 1, "whatsapp_sender_numbers": 1, "phone": 1},
+    ):
+        taken.update(sender_pool(owner))
+        taken.add(owner.get("whatsapp_sender_number"))
+    return [number for number in numbers if number in taken]
+
+
+def assign_senders(
+    notifications: Iterable[Dict],
+    pools: Dict[str, List[str]],
+    sticky: Dict[str, str],
+    load: Dict[str, int],
+) -> Dict[str, str]:
+    """
+    Pick a pool number for each notification and return the new sticky
+    assignments (assignment id -> number).
+
+    A member's sticky number is kept while it is still in the pool; other
+    members go to the pool number with the lowest load (messages sent today
+    plus those assigned so far). `notifications` get their sender_number
+    updated in place and `load` is updated as numbers are picked.
+    """
+    new_sticky = {}
+    for notification in notifications:
+        pool = pools.get(notification["gym_id"])
+        if not pool:
+            continue
+        key = assignment_id(notification["gym_id"], notification["member_id"])
+        sender = sticky.get(key)
+        if sender not in pool:
+            sender = min(pool, key=lambda number: (load.get(number, 0), pool.index(number)))
+            if len(pool) > 1:
+                sticky[key] = new_sticky[key] = sender
+        notification["sender_number"] = sender
+        load[sender] = load.get(sender, 0) + 1
+    return new_sticky
+
+
+async def load_sticky(db, gym_ids: Iterable[str]) -> Dict[str, str]:
+    cursor = db.sender_assignments.find({"gym_id": {"$in": list(gym_ids)}}, {"sender_number": 1})
+    return {assignment["_id"]: assignment["sender_number"] async for assignment in cursor}
+
+
+async def save_sticky(db, assignments: Dict[str, str]):
+    if not assignments:
+        return
+    now = datetime.utcnow()
+    await db.sender_assignments.bulk_write([
+        UpdateOne(
+            {"_id": key},
+            {
+                "$set": {"sender_number": sender, "assigned_at": now},
+                "$setOnInsert": {"gym_id": key.split(":", 1)[0], "member_id": key.split(":", 1)[1]},
+            },
+            upsert=True
+        )
+        for key, sender in assignments.items()
+    ], ordered=False)
+
+
+async def pool_senders(
+    db, notifications: List[Dict], owners: Dict[str, Dict], sent_today: Dict[str, int], save: bool = True
+) -> List[Dict]:
+    """
+    Spread pending notifications over their gyms' sender pools.
+
+    Notifications are handled highest priority, oldest first, so the
+    emptiest numbers go to the most urgent ones. Returns the notifications
+    whose sender number changed; new sticky assignments are stored if `save`.
+    """
+    pools = {gym_id: sender_pool(owner) for gym_id, owner in owners.items()}
+    pooled_gyms = [gym_id for gym_id, pool in pools.items() if len(pool) > 1]
+    sticky = await load_sticky(db, pooled_gyms) if pooled_gyms else {}
+
+    previous = {notification["id"]: notification.get("sender_number") for notification in notifications}
+    ordered = sorted(
+        (notification for notification in notifications if notification.get("member_id")),
+        key=lambda n: (-n.get("priority", 0), n.get("created_at") or datetime.min)
+    )
+    new_sticky = assign_senders(ordered, pools, sticky, dict(sent_today))
+    if save:
+        await save_sticky(db, new_sticky)
+    return [
+        notification for notification in notifications
+        if notification.get("sender_number") != previous[notification["id"]]
+    ]
+
+
+async def sender_health(db, gym_owner: Dict, now: Optional[datetime] = None) -> List[Dict]:
+    """Per-number throughput, backlog and failure rate for a gym's pool"""
+    now = now or datetime.utcnow()
+    gym_id = gym_owner["id"]
+    pool = sender_pool(gym_owner)
+    day_ago = now - timedelta(days=1)
+
+    counts = await sender_sent_counts(db, pool, now)
+    queue_stats = {
+        row["_id"]: row
+        async for row in db.notification_queue.aggregate([
+            {"$match": {"gym_id": gym_id, "sender_number": {"$in": pool}}},
+            {"$group": {
+                "_id": "$sender_number",
+                "pending": {"$sum": {"$cond": [{"$eq": ["$status", "pending"]}, 1, 0]}},
+                "retrying": {"$sum": {"$cond": [
+                    {"$and": [{"$eq": ["$status", "pending"]}, {"$gte": ["$attempts", 1]}]}, 1, 0
+                ]}},
+                "sent_24h": {"$sum": {"$cond": [{"$gte": ["$sent_at", day_ago]}, 1, 0]}},
+                "failed_24h": {"$sum": {"$cond": [{"$gte": ["$failed_at", day_ago]}, 1, 0]}},
+                "last_sent_at": {"$max": "$sent_at"},
+            }},
+        ])
+    }
+    members = Counter({
+        row["_id"]: row["count"]
+        async for row in db.sender_assignments.aggregate([
+            {"$match": {"gym_id": gym_id}},
+            {"$group": {"_id": "$sender_number", "count": {"$sum": 1}}},
+        ])
+    })
+
+    report = []
+    for number in pool:
+        stats = queue_stats.get(number, {})
+        hour_count, day_count = counts.get(number, (0, 0))
+        # Dead-lettered notifications stay in the queue with their failed_at
+        failed = stats.get("failed_24h", 0)
+        attempts = stats.get("sent_24h", 0) + failed
+        failure_rate = round(failed / attempts, 4) if attempts else 0.0
+        remaining = max(MAX_PER_DAY - day_count, 0)
+        if not remaining:
+            health = "exhausted"
+        elif failure_rate > SENDER_DEGRADED_FAILURE_RATE:
+            health = "degraded"
+        else:
+            health = "healthy"
+        report.append({
+            "sender_number": number,
+            "health": health,
+            "sent_last_hour": hour_count,
+            "sent_today": day_count,
+            "remaining_today": remaining,
+            "pending": stats.get("pending", 0),
+            "retrying": stats.get("retrying", 0),
+            "sent_24h": stats.get("sent_24h", 0),
+            "failed_24h": failed,
+            "failure_rate": failure_rate,
+            "last_sent_at": stats["last_sent_at"].isoformat() if stats.get("last_sent_at") else None,
+            # Single-number gyms keep no assignments
+            "members_assigned": members.get(number, 0) if len(pool) > 1 else None,
+        })
+    return report
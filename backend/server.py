@@ -1,26 +1,37 @@
-from fastapi import FastAPI, HTTPException, Depends, Request
+from fastapi import FastAPI, HTTPException, Depends, Header, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse, PlainTextResponse
 from pydantic import BaseModel, validator
 from typing import Optional, List
-from datetime import datetime, date
-from motor.motor_asyncio import AsyncIOMotorClient
+from datetime import datetime, date, timedelta
 import os
 import uuid
-import qrcode
 import io
 import base64
-from calendar import monthrange
-import razorpay
 import hashlib
 import hmac
 import secrets
 import time
-import bcrypt
-
-# Environment variables
-MONGO_URL = os.environ.get("MONGO_URL", "mongodb://localhost:27017")
-DB_NAME = os.environ.get("DB_NAME", "gym_saas")
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from coordination import get_leases, run_exclusive
+from billing import calculate_prorated_fee, current_period, member_for_period, paid_fields, roll_over_gym, rollover_fields, shift_period
+from cache import cache, gym_key
+from notification_templates import DEFAULT_TEMPLATES, ensure_indexes as ensure_template_indexes, get_template, render_notifications, save_template
+from notification_queue import ACK_MAX_BATCH, ACK_STATUSES, MAX_PER_DAY, MAX_PER_HOUR_RANGE, ack_notifications, claim_notifications, ensure_indexes as ensure_queue_indexes, record_sent, retry_stats, sent_counts
+from coalescing import coalescing_stats, ensure_indexes as ensure_coalescing_indexes, find_covering
+from notification_archive import ensure_indexes as ensure_archive_indexes
+from send_pacing import pace_queue
+from sender_pool import SENDER_POOL_MAX, ensure_indexes as ensure_sender_indexes, sender_health, sender_numbers_in_use, sender_pool
+from suppression import ensure_indexes as ensure_suppression_indexes, handle_inbound, normalize_phone, suppression_list
+from payments import collection_rate, ensure_indexes as ensure_payment_indexes, method_split, monthly_revenue, record_payment
+from database import database, get_db
+from metrics import METRICS_ENABLED, MetricsMiddleware, render_metrics, span
+from profiling import PROFILING_ENABLED, RequestProfilerMiddleware
+from loop_monitor import LOOP_WATCHDOG_ENABLED, ActiveRequestMiddleware, loop_watchdog
+from warmup import start_warmup, warmup_status
+from admin_auth import is_admin_token
+from http_caching import CompressionMiddleware, cache_headers, is_not_modified, make_etag
 
 # Razorpay configuration (with placeholders)
 RAZORPAY_KEY_ID = os.environ.get("RAZORPAY_KEY_ID", "YOUR_RAZORPAY_KEY_ID")
@@ -42,14 +53,36 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# MongoDB client
-client = AsyncIOMotorClient(MONGO_URL)
-db = client[DB_NAME]
+# gzip/brotli for JSON responses above COMPRESSION_MIN_SIZE
+app.add_middleware(CompressionMiddleware)
+
+# Request latency / in-flight metrics (exposed on /metrics)
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
+# Attribute event-loop stalls to the route being served
+if LOOP_WATCHDOG_ENABLED:
+    app.add_middleware(ActiveRequestMiddleware)
+
+# Opt-in per-request profiling (X-Profile: 1 with X-Admin-Token)
+if PROFILING_ENABLED:
+    app.add_middleware(RequestProfilerMiddleware)
 
-# Razorpay client (only initialize if keys are provided)
-razorpay_client = None
-if RAZORPAY_KEY_ID != "YOUR_RAZORPAY_KEY_ID" and RAZORPAY_KEY_SECRET != "YOUR_RAZORPAY_KEY_SECRET":
-    razorpay_client = razorpay.Client(auth=(RAZORPAY_KEY_ID, RAZORPAY_KEY_SECRET))
+# MongoDB (shared client, connected on startup)
+db = get_db()
+reporting_db = get_db("reporting")
+
+# Razorpay client (only initialize if keys are provided, created on first use)
+RAZORPAY_CONFIGURED = RAZORPAY_KEY_ID != "YOUR_RAZORPAY_KEY_ID" and RAZORPAY_KEY_SECRET != "YOUR_RAZORPAY_KEY_SECRET"
+_razorpay_client = None
+
+def get_razorpay_client():
+    """Get the Razorpay client, importing the SDK on first use"""
+    global _razorpay_client
+    if _razorpay_client is None and RAZORPAY_CONFIGURED:
+        import razorpay
+        _razorpay_client = razorpay.Client(auth=(RAZORPAY_KEY_ID, RAZORPAY_KEY_SECRET))
+    return _razorpay_client
 
 # Pydantic models
 class GymOwnerCreate(BaseModel):
@@ -81,6 +114,7 @@ class GymOwnerResponse(BaseModel):
     member_registration_url: str
     cash_verification_qr: str
     whatsapp_sender_number: str
+    whatsapp_sender_numbers: List[str] = []
     created_at: datetime
 
 class MemberCreate(BaseModel):
@@ -105,6 +139,11 @@ class MemberResponse(BaseModel):
     is_active: bool
     created_at: datetime
 
+# Fields returned by MemberResponse, for projecting member queries
+MEMBER_RESPONSE_PROJECTION = {"_id": 0, **{field: 1 for field in MemberResponse.model_fields}}
+# Fields member_for_period reads on top of those
+BILLING_PROJECTION = {"billing_period": 1, "paid_period": 1, "month_reset_at": 1}
+
 class PaymentUpdate(BaseModel):
     payment_method: str  # 'cash' or 'online'
 
@@ -121,12 +160,56 @@ class RazorpayPaymentVerify(BaseModel):
     gym_id: str
 
 class WhatsAppConfig(BaseModel):
-    sender_number: str
+    sender_number: Optional[str] = None
+    # Pool of sender numbers, primary first (replaces sender_number when given)
+    sender_numbers: Optional[List[str]] = None
+    
+    # Stored as 10 digits, like member phones, so inbound replies can be matched to the gym
+    @validator('sender_number')
+    def validate_sender_number(cls, v):
+        return (normalize_phone(v) or None) if v is not None else None
+    
+    @validator('sender_numbers')
+    def validate_sender_numbers(cls, v):
+        if v is not None:
+            v = list(dict.fromkeys(normalize_phone(number) for number in v if normalize_phone(number)))
+            if not 1 <= len(v) <= SENDER_POOL_MAX:
+                raise ValueError(f'Provide between 1 and {SENDER_POOL_MAX} sender numbers')
+        return v
 
 class SendNotificationRequest(BaseModel):
     member_id: str
     custom_message: Optional[str] = None
 
+class TemplateUpdate(BaseModel):
+    body: str
+
+class NotificationAck(BaseModel):
+    id: str
+    status: str
+    error: Optional[str] = None
+    sent_at: Optional[datetime] = None
+    
+    @validator('status')
+    def validate_status(cls, v):
+        if v not in ACK_STATUSES:
+            raise ValueError(f"Status must be one of {', '.join(ACK_STATUSES)}")
+        return v
+
+class NotificationAckBatch(BaseModel):
+    results: List[NotificationAck]
+    
+    @validator('results')
+    def validate_results(cls, v):
+        if not 1 <= len(v) <= ACK_MAX_BATCH:
+            raise ValueError(f"Send between 1 and {ACK_MAX_BATCH} results per batch")
+        return v
+
+class InboundMessage(BaseModel):
+    phone: str  # member who replied
+    to: Optional[str] = None  # sender number the reply went to
+    text: str
+
 class PaymentSessionRequest(BaseModel):
     member_id: str
     amount: float
@@ -134,14 +217,17 @@ class PaymentSessionRequest(BaseModel):
 # Utility functions
 def generate_qr_code(data: str) -> str:
     """Generate QR code and return as base64 string"""
-    qr = qrcode.QRCode(version=1, box_size=10, border=5)
-    qr.add_data(data)
-    qr.make(fit=True)
+    import qrcode
     
-    img = qr.make_image(fill_color="black", back_color="white")
-    buffer = io.BytesIO()
-    img.save(buffer, format='PNG')
-    buffer.seek(0)
+    with span("qrcode.render"):
+        qr = qrcode.QRCode(version=1, box_size=10, border=5)
+        qr.add_data(data)
+        qr.make(fit=True)
+        
+        img = qr.make_image(fill_color="black", back_color="white")
+        buffer = io.BytesIO()
+        img.save(buffer, format='PNG')
+        buffer.seek(0)
     
     return base64.b64encode(buffer.getvalue()).decode()
 
@@ -152,32 +238,21 @@ def generate_payment_session_qr(gym_id: str, session_id: str) -> str:
 
 def generate_password_hash(password: str) -> str:
     """Generate password hash using bcrypt"""
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    import bcrypt
+    
+    with span("bcrypt.hash"):
+        return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
 
 def verify_password(password: str, hashed: str) -> bool:
     """Verify password against hash"""
-    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
-
-def calculate_prorated_fee(monthly_fee: float, joining_date: date) -> float:
-    """Calculate prorated fee based on joining date"""
-    today = date.today()
-    
-    # If joined on 1st, no proration needed
-    if joining_date.day == 1:
-        return 0.0
+    import bcrypt
     
-    # Calculate days remaining in current month
-    days_in_month = monthrange(joining_date.year, joining_date.month)[1]
-    days_remaining = days_in_month - joining_date.day + 1
-    
-    # Calculate prorated amount
-    daily_rate = monthly_fee / days_in_month
-    prorated_amount = daily_rate * days_remaining
-    
-    return round(prorated_amount, 2)
+    with span("bcrypt.verify"):
+        return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
 
 def verify_razorpay_signature(order_id: str, payment_id: str, signature: str) -> bool:
     """Verify Razorpay payment signature"""
+    razorpay_client = get_razorpay_client()
     if not razorpay_client:
         return False
     
@@ -187,11 +262,76 @@ def verify_razorpay_signature(order_id: str, payment_id: str, signature: str) ->
             'razorpay_payment_id': payment_id,
             'razorpay_signature': signature
         }
-        razorpay_client.utility.verify_payment_signature(params_dict)
+        with span("razorpay.verify_signature"):
+            razorpay_client.utility.verify_payment_signature(params_dict)
         return True
     except:
         return False
 
+def require_admin_token(x_admin_token: Optional[str] = Header(None)):
+    """Dependency for admin endpoints: the X-Admin-Token header must match ADMIN_TOKEN"""
+    if not is_admin_token(x_admin_token):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+VERSION_PROJECTION = {"_id": 0, "owner_version": 1, "owner_updated_at": 1, "members_version": 1, "members_updated_at": 1}
+
+async def load_gym_owner(gym_id: str) -> Optional[dict]:
+    """Gym owner document (without the password hash), served from the shared cache"""
+    return await cache.get_or_load(
+        gym_key(gym_id, "owner"),
+        lambda: db.gym_owners.find_one({"id": gym_id}, {"_id": 0, "password_hash": 0})
+    )
+
+async def load_versions(gym_id: str) -> Optional[dict]:
+    """A gym's version counters read from MongoDB, never the cache, so ETags cannot lag a write"""
+    return await db.gym_owners.find_one({"id": gym_id}, VERSION_PROJECTION)
+
+async def load_current_gym_owner(gym_id: str) -> Optional[dict]:
+    """
+    Gym owner for a conditional response: the cached copy if its versions
+    match MongoDB's, else a fresh read (a load racing a version bump can
+    put the old document back in the cache after the invalidation).
+    """
+    versions = await load_versions(gym_id)
+    if not versions:
+        return None
+    owner = await load_gym_owner(gym_id)
+    if owner and all(owner.get(field) == versions.get(field) for field in VERSION_PROJECTION if field != "_id"):
+        return owner
+    await cache.invalidate(gym_key(gym_id, "owner"))
+    return await db.gym_owners.find_one({"id": gym_id}, {"_id": 0, "password_hash": 0})
+
+async def bump_members_version(gym_id: str):
+    """Record a member change so cached member lists are revalidated"""
+    await db.gym_owners.update_one(
+        {"id": gym_id},
+        {"$inc": {"members_version": 1}, "$set": {"members_updated_at": datetime.utcnow()}}
+    )
+    await cache.invalidate(gym_key(gym_id, "owner"))
+
+async def bump_owner_version(gym_id: str):
+    """Record a gym owner profile change so cached copies are revalidated"""
+    await db.gym_owners.update_one(
+        {"id": gym_id},
+        {"$inc": {"owner_version": 1}, "$set": {"owner_updated_at": datetime.utcnow()}}
+    )
+    await cache.invalidate(gym_key(gym_id, "owner"))
+
+async def mark_member_paid(members_collection, gym_owner: dict, member: dict, payment_method: str, extra: Optional[dict] = None) -> Optional[dict]:
+    """
+    Mark a member paid for the current period, rolling its fee fields over
+    first if the monthly job has not reached it. Returns the member as it
+    read before the payment (in the current period), or None if it is gone.
+    """
+    period = current_period()
+    fields = {**rollover_fields(member, gym_owner["monthly_fee"], period), **paid_fields(payment_method, period), **(extra or {})}
+    previous = await members_collection.find_one_and_update(
+        {"id": member["id"]},
+        {"$set": fields},
+        return_document=ReturnDocument.BEFORE
+    )
+    return member_for_period(previous, gym_owner["monthly_fee"], period) if previous else None
+
 # API Routes
 @app.get("/")
 async def root():
@@ -284,12 +424,19 @@ async def register_gym_owner(owner: GymOwnerCreate):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/gym-owner/{gym_id}")
-async def get_gym_owner(gym_id: str):
+async def get_gym_owner(gym_id: str, request: Request, response: Response):
     """Get gym owner details"""
-    owner = await db.gym_owners.find_one({"id": gym_id})
+    owner = await load_current_gym_owner(gym_id)
     if not owner:
         raise HTTPException(status_code=404, detail="Gym owner not found")
     
+    etag = make_etag("owner", gym_id, owner.get("owner_version", 0))
+    last_modified = owner.get("owner_updated_at") or owner.get("created_at")
+    headers = cache_headers(etag, last_modified)
+    if is_not_modified(request.headers, etag):
+        return Response(status_code=304, headers=headers)
+    
+    response.headers.update(headers)
     return GymOwnerResponse(**owner)
 
 @app.post("/api/member/register", response_model=MemberResponse)
@@ -297,7 +444,7 @@ async def register_member(member: MemberCreate):
     """Register a new gym member"""
     try:
         # Get gym owner details
-        gym_owner = await db.gym_owners.find_one({"id": member.gym_id})
+        gym_owner = await load_gym_owner(member.gym_id)
         if not gym_owner:
             raise HTTPException(status_code=404, detail="Gym not found")
         
@@ -328,11 +475,14 @@ async def register_member(member: MemberCreate):
             "current_month_fee": prorated_fee if prorated_fee > 0 else monthly_fee,
             "payment_method": None,
             "is_active": True,
+            "billing_period": current_period(),
+            "paid_period": None,
             "created_at": datetime.utcnow()
         }
         
         # Insert member
         await members_collection.insert_one(member_doc)
+        await bump_members_version(member.gym_id)
         
         return MemberResponse(**member_doc)
     
@@ -340,23 +490,51 @@ async def register_member(member: MemberCreate):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/gym/{gym_id}/members", response_model=List[MemberResponse])
-async def get_gym_members(gym_id: str):
-    """Get all members of a gym"""
+async def get_gym_members(gym_id: str, request: Request, response: Response, fast: bool = False):
+    """Get all members of a gym
+    
+    With fast=true the projected documents are serialized straight to JSON
+    with orjson, skipping per-member model construction and re-encoding.
+    Responses carry an ETag / Last-Modified from the gym's members version;
+    a matching If-None-Match gets a 304 without reading the member
+    collection.
+    """
     try:
         # Verify gym exists
-        gym_owner = await db.gym_owners.find_one({"id": gym_id})
+        gym_owner = await load_gym_owner(gym_id)
         if not gym_owner:
             raise HTTPException(status_code=404, detail="Gym not found")
         
+        # The version comes from MongoDB: a cached owner may predate the last member change
+        versions = await load_versions(gym_id) or {}
+        etag = make_etag("members", gym_id, versions.get("members_version", 0))
+        last_modified = versions.get("members_updated_at") or gym_owner.get("created_at")
+        headers = cache_headers(etag, last_modified)
+        if is_not_modified(request.headers, etag):
+            return Response(status_code=304, headers=headers)
+        
         # Get collection name
         collection_name = f"gym_{gym_id.replace('-', '_')}_members"
         members_collection = db[collection_name]
         
+        # Fee fields are shown for the current period even before the monthly rollover reaches the gym
+        period = current_period()
+        monthly_fee = gym_owner["monthly_fee"]
+        
+        if fast:
+            members_cursor = members_collection.find({}, {**MEMBER_RESPONSE_PROJECTION, **BILLING_PROJECTION})
+            members = [
+                {field: value for field, value in member_for_period(member, monthly_fee, period).items() if field in MEMBER_RESPONSE_PROJECTION}
+                for member in await members_cursor.to_list(length=None)
+            ]
+            return ORJSONResponse(members, headers=headers)
+        
         # Get all members
         members_cursor = members_collection.find({})
         members = await members_cursor.to_list(length=None)
         
-        return [MemberResponse(**member) for member in members]
+        response.headers.update(headers)
+        return [MemberResponse(**member_for_period(member, monthly_fee, period)) for member in members]
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -365,25 +543,30 @@ async def get_gym_members(gym_id: str):
 async def update_payment_status(gym_id: str, member_id: str, payment: PaymentUpdate):
     """Update member payment status (mark as paid)"""
     try:
+        gym_owner = await load_gym_owner(gym_id)
+        if not gym_owner:
+            raise HTTPException(status_code=404, detail="Gym not found")
+        
         # Get collection name
         collection_name = f"gym_{gym_id.replace('-', '_')}_members"
         members_collection = db[collection_name]
         
         # Update member payment status
-        update_result = await members_collection.update_one(
-            {"id": member_id},
-            {
-                "$set": {
-                    "fee_status": "paid",
-                    "payment_method": payment.payment_method,
-                    "payment_updated_at": datetime.utcnow()
-                }
-            }
-        )
+        period = current_period()
+        member = await members_collection.find_one({"id": member_id})
+        member = member and await mark_member_paid(members_collection, gym_owner, member, payment.payment_method)
         
-        if update_result.matched_count == 0:
+        if not member:
             raise HTTPException(status_code=404, detail="Member not found")
         
+        # Marking an already paid member again is not a new payment
+        if member.get("paid_period") != period:
+            await record_payment(
+                db, gym_id, member_id, member["current_month_fee"], payment.payment_method,
+                source="manual", period=period
+            )
+        await bump_members_version(gym_id)
+        
         return {"message": "Payment status updated successfully"}
     
     except Exception as e:
@@ -404,11 +587,19 @@ async def toggle_member_active_status(gym_id: str, member_id: str):
         
         # Toggle active status
         new_status = not member.get("is_active", True)
+        update = {"is_active": new_status}
+        
+        # Members inactive at rollover are brought into the current period on reactivation
+        if new_status:
+            gym_owner = await load_gym_owner(gym_id)
+            if gym_owner:
+                update.update(rollover_fields(member, gym_owner["monthly_fee"]))
         
         await members_collection.update_one(
             {"id": member_id},
-            {"$set": {"is_active": new_status}}
+            {"$set": update}
         )
+        await bump_members_version(gym_id)
         
         return {"message": f"Member {'activated' if new_status else 'deactivated'} successfully"}
     
@@ -429,6 +620,8 @@ async def delete_member(gym_id: str, member_id: str):
         if delete_result.deleted_count == 0:
             raise HTTPException(status_code=404, detail="Member not found")
         
+        await bump_members_version(gym_id)
+        
         return {"message": "Member deleted successfully"}
     
     except Exception as e:
@@ -439,7 +632,7 @@ async def generate_payment_session(gym_id: str, request: PaymentSessionRequest):
     """Generate dynamic QR code for payment session"""
     try:
         # Verify gym exists
-        gym_owner = await db.gym_owners.find_one({"id": gym_id})
+        gym_owner = await load_gym_owner(gym_id)
         if not gym_owner:
             raise HTTPException(status_code=404, detail="Gym not found")
         
@@ -475,19 +668,84 @@ async def generate_payment_session(gym_id: str, request: PaymentSessionRequest):
 
 @app.post("/api/gym/{gym_id}/whatsapp-config")
 async def update_whatsapp_config(gym_id: str, config: WhatsAppConfig):
-    """Update WhatsApp sender number configuration"""
+    """Update WhatsApp sender number configuration (a single number or a pool)"""
     try:
-        # Update gym owner's WhatsApp sender number
-        update_result = await db.gym_owners.update_one(
-            {"id": gym_id},
-            {"$set": {"whatsapp_sender_number": config.sender_number}}
-        )
+        sender_numbers = config.sender_numbers or ([config.sender_number] if config.sender_number else [])
+        if not sender_numbers:
+            raise HTTPException(status_code=400, detail="Provide sender_number or sender_numbers")
+        
+        # A number's daily budget is planned for one gym only
+        taken = await sender_numbers_in_use(db, sender_numbers, gym_id)
+        if taken:
+            raise HTTPException(status_code=409, detail=f"Sender number already used by another gym: {', '.join(taken)}")
+        
+        # Update gym owner's WhatsApp sender numbers (the first is the primary)
+        try:
+            update_result = await db.gym_owners.update_one(
+                {"id": gym_id},
+                {"$set": {
+                    "whatsapp_sender_number": sender_numbers[0],
+                    "whatsapp_sender_numbers": sender_numbers
+                }}
+            )
+        except DuplicateKeyError:
+            # Another gym took one of the numbers since the check
+            raise HTTPException(status_code=409, detail="Sender number already used by another gym")
         
         if update_result.matched_count == 0:
             raise HTTPException(status_code=404, detail="Gym not found")
         
-        return {"message": "WhatsApp sender number updated successfully"}
+        await bump_owner_version(gym_id)
+        
+        return {
+            "message": "WhatsApp sender number updated successfully",
+            "sender_numbers": sender_numbers
+        }
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/gym/{gym_id}/templates")
+async def get_notification_templates(gym_id: str):
+    """Current notification templates for a gym (version 0 is the built-in default)"""
+    try:
+        return {
+            "templates": [await get_template(db, gym_id, template_id) for template_id in DEFAULT_TEMPLATES]
+        }
+    
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.put("/api/gym/{gym_id}/templates/{template_id}")
+async def update_notification_template(gym_id: str, template_id: str, template: TemplateUpdate):
+    """Save a new version of a gym's template; queued notifications pick it up when sent"""
+    try:
+        if not await load_gym_owner(gym_id):
+            raise HTTPException(status_code=404, detail="Gym not found")
+        
+        return await save_template(db, gym_id, template_id, template.body)
     
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/gym/{gym_id}/whatsapp-senders")
+async def get_sender_health(gym_id: str):
+    """Health, throughput and backlog of each of a gym's sender numbers"""
+    try:
+        gym_owner = await load_gym_owner(gym_id)
+        if not gym_owner:
+            raise HTTPException(status_code=404, detail="Gym not found")
+        
+        return {"gym_id": gym_id, "senders": await sender_health(db, gym_owner)}
+    
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -496,7 +754,7 @@ async def send_manual_notification(gym_id: str, member_id: str, request: SendNot
     """Send manual notification to a member"""
     try:
         # Get gym owner and member details
-        gym_owner = await db.gym_owners.find_one({"id": gym_id})
+        gym_owner = await load_gym_owner(gym_id)
         if not gym_owner:
             raise HTTPException(status_code=404, detail="Gym not found")
         
@@ -507,6 +765,10 @@ async def send_manual_notification(gym_id: str, member_id: str, request: SendNot
         if not member:
             raise HTTPException(status_code=404, detail="Member not found")
         
+        await suppression_list.refresh(db)
+        if suppression_list.is_suppressed(gym_id, member["phone"]):
+            raise HTTPException(status_code=409, detail="Member has opted out of WhatsApp messages")
+        
         # Create notification entry for WhatsApp automation
         notification = {
             "id": str(uuid.uuid4()),
@@ -515,18 +777,28 @@ async def send_manual_notification(gym_id: str, member_id: str, request: SendNot
             "phone": member["phone"],
             "member_name": member["name"],
             "gym_name": gym_owner["gym_name"],
-            "sender_number": gym_owner.get("whatsapp_sender_number", gym_owner["phone"]),
-            "message": request.custom_message or f"Hi {member['name']}! This is a reminder from {gym_owner['gym_name']}. Please contact us for any queries.",
+            "sender_number": sender_pool(gym_owner)[0],
             "status": "pending",
             "type": "manual",
             "created_at": datetime.utcnow()
         }
+        if request.custom_message:
+            notification["message"] = request.custom_message
+        else:
+            notification["template"] = "manual"
+        
+        # The same message (or the member's monthly reminder) is already waiting to go out
+        covering = await find_covering(db, notification)
+        if covering:
+            return {"message": "Notification already queued", "notification_id": covering["id"], "coalesced": True}
         
         # Store notification in queue
         await db.notification_queue.insert_one(notification)
         
         return {"message": "Notification added to queue", "notification_id": notification["id"]}
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -534,6 +806,7 @@ async def send_manual_notification(gym_id: str, member_id: str, request: SendNot
 @app.post("/api/payment/create-order")
 async def create_payment_order(order_data: RazorpayOrderCreate, gym_id: str, member_id: str):
     """Create Razorpay payment order"""
+    razorpay_client = get_razorpay_client()
     if not razorpay_client:
         return {
             "error": "Razorpay not configured",
@@ -543,7 +816,7 @@ async def create_payment_order(order_data: RazorpayOrderCreate, gym_id: str, mem
     
     try:
         # Verify gym and member exist
-        gym_owner = await db.gym_owners.find_one({"id": gym_id})
+        gym_owner = await load_gym_owner(gym_id)
         if not gym_owner:
             raise HTTPException(status_code=404, detail="Gym not found")
         
@@ -556,12 +829,13 @@ async def create_payment_order(order_data: RazorpayOrderCreate, gym_id: str, mem
         # Create order
         order_data.receipt = f"gym_{gym_id}_member_{member_id}_{int(datetime.utcnow().timestamp())}"
         
-        order = razorpay_client.order.create({
-            "amount": order_data.amount,
-            "currency": order_data.currency,
-            "receipt": order_data.receipt,
-            "payment_capture": 1
-        })
+        with span("razorpay.order_create"):
+            order = razorpay_client.order.create({
+                "amount": order_data.amount,
+                "currency": order_data.currency,
+                "receipt": order_data.receipt,
+                "payment_capture": 1
+            })
         
         # Store order in database
         await db.payment_orders.insert_one({
@@ -587,6 +861,7 @@ async def create_payment_order(order_data: RazorpayOrderCreate, gym_id: str, mem
 @app.post("/api/payment/verify")
 async def verify_payment(payment_data: RazorpayPaymentVerify):
     """Verify Razorpay payment"""
+    razorpay_client = get_razorpay_client()
     if not razorpay_client:
         return {
             "error": "Razorpay not configured",
@@ -603,7 +878,7 @@ async def verify_payment(payment_data: RazorpayPaymentVerify):
             raise HTTPException(status_code=400, detail="Invalid payment signature")
         
         # Update payment order status
-        await db.payment_orders.update_one(
+        order = await db.payment_orders.find_one_and_update(
             {"order_id": payment_data.razorpay_order_id},
             {
                 "$set": {
@@ -615,20 +890,23 @@ async def verify_payment(payment_data: RazorpayPaymentVerify):
         )
         
         # Update member payment status
+        gym_owner = await load_gym_owner(payment_data.gym_id)
+        
         collection_name = f"gym_{payment_data.gym_id.replace('-', '_')}_members"
         members_collection = db[collection_name]
         
-        await members_collection.update_one(
-            {"id": payment_data.member_id},
-            {
-                "$set": {
-                    "fee_status": "paid",
-                    "payment_method": "online",
-                    "payment_id": payment_data.razorpay_payment_id,
-                    "payment_updated_at": datetime.utcnow()
-                }
-            }
-        )
+        member = await members_collection.find_one({"id": payment_data.member_id})
+        if gym_owner and member:
+            await mark_member_paid(
+                members_collection, gym_owner, member, "online", {"payment_id": payment_data.razorpay_payment_id}
+            )
+        if order:
+            # Keyed by the Razorpay payment id, so the webhook won't record it again
+            await record_payment(
+                db, payment_data.gym_id, payment_data.member_id, order["amount"] / 100, "online",
+                source="razorpay", reference=payment_data.razorpay_payment_id
+            )
+        await bump_members_version(payment_data.gym_id)
         
         return {"message": "Payment verified successfully", "status": "success"}
     
@@ -638,6 +916,7 @@ async def verify_payment(payment_data: RazorpayPaymentVerify):
 @app.post("/api/payment/webhook")
 async def razorpay_webhook(request: Request):
     """Handle Razorpay webhooks"""
+    razorpay_client = get_razorpay_client()
     if not razorpay_client:
         return {"status": "not_configured"}
     
@@ -667,7 +946,7 @@ async def razorpay_webhook(request: Request):
             
             if order_id:
                 # Update payment order status
-                await db.payment_orders.update_one(
+                order = await db.payment_orders.find_one_and_update(
                     {"order_id": order_id},
                     {
                         "$set": {
@@ -676,6 +955,12 @@ async def razorpay_webhook(request: Request):
                         }
                     }
                 )
+                
+                if order and payment.get('id'):
+                    await record_payment(
+                        db, order["gym_id"], order["member_id"], payment.get('amount', order["amount"]) / 100, "online",
+                        source="razorpay", reference=payment['id']
+                    )
         
         return {"status": "processed"}
     
@@ -687,6 +972,10 @@ async def razorpay_webhook(request: Request):
 async def verify_cash_payment(gym_id: str, phone: str, name: str, session_id: Optional[str] = None):
     """Verify cash payment"""
     try:
+        gym_owner = await load_gym_owner(gym_id)
+        if not gym_owner:
+            raise HTTPException(status_code=404, detail="Gym not found")
+        
         # Get collection name
         collection_name = f"gym_{gym_id.replace('-', '_')}_members"
         members_collection = db[collection_name]
@@ -717,63 +1006,121 @@ async def verify_cash_payment(gym_id: str, phone: str, name: str, session_id: Op
             )
         
         # Mark as paid
-        await members_collection.update_one(
-            {"id": member["id"]},
-            {
-                "$set": {
-                    "fee_status": "paid",
-                    "payment_method": "cash",
-                    "payment_updated_at": datetime.utcnow(),
-                    "payment_session_id": session_id if session_id else None
-                }
-            }
+        period = current_period()
+        previous = await mark_member_paid(
+            members_collection, gym_owner, member, "cash",
+            {"payment_session_id": session_id if session_id else None}
         )
         
+        if previous and previous.get("paid_period") != period:
+            await record_payment(
+                db, gym_id, member["id"], previous["current_month_fee"], "cash",
+                source="cash_verification", reference=session_id, period=period
+            )
+        await bump_members_version(gym_id)
+        
         return {"message": f"Cash payment verified for {member['name']}", "success": True}
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-# Monthly fee reset logic (to be called by a scheduler)
+# Monthly fee rollover (until it reaches a member, reads derive its fields with member_for_period)
+async def reset_all_member_fees():
+    """Roll every gym's active members into the current billing period"""
+    # Get all gym owners
+    gym_owners_cursor = db.gym_owners.find({}, {"_id": 0, "password_hash": 0})
+    gym_owners = await gym_owners_cursor.to_list(length=None)
+    
+    total_updated = 0
+    gyms_rolled_over = 0
+    
+    for gym_owner in gym_owners:
+        rolled_over = await roll_over_gym(db, gym_owner)
+        if rolled_over is None:
+            continue
+        
+        await bump_members_version(gym_owner["id"])
+        gyms_rolled_over += 1
+        total_updated += rolled_over
+    
+    return {
+        "message": f"Monthly fees reset for {total_updated} members across {gyms_rolled_over} gyms",
+        "period": current_period(),
+        "total_members_updated": total_updated,
+        "total_gyms": len(gym_owners)
+    }
+
 @app.post("/api/admin/reset-monthly-fees")
-async def reset_monthly_fees():
-    """Reset all member fee statuses for new month (admin endpoint)"""
+async def reset_monthly_fees(force: bool = False):
+    """Roll all gyms into the current billing period now (admin endpoint)
+    
+    Not needed for correctness: paid/unpaid is derived from each member's
+    paid_period, and reads and payments bring single members into the new
+    month. Runs once per month across all replicas; pass force=true to run
+    again.
+    """
     try:
-        # Get all gym owners
-        gym_owners_cursor = db.gym_owners.find({})
-        gym_owners = await gym_owners_cursor.to_list(length=None)
-        
-        total_updated = 0
-        
-        for gym_owner in gym_owners:
-            gym_id = gym_owner["id"]
-            collection_name = f"gym_{gym_id.replace('-', '_')}_members"
-            members_collection = db[collection_name]
-            
-            # Reset all active members to unpaid status
-            update_result = await members_collection.update_many(
-                {"is_active": True},
-                {
-                    "$set": {
-                        "fee_status": "unpaid",
-                        "payment_method": None,
-                        "current_month_fee": gym_owner["monthly_fee"],
-                        "month_reset_at": datetime.utcnow()
-                    }
-                }
-            )
-            
-            total_updated += update_result.modified_count
+        return await run_exclusive(
+            db,
+            "monthly_fee_reset",
+            reset_all_member_fees,
+            run_key=None if force else current_period()
+        )
+    
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Revenue reports (served from the payments ledger rollups)
+@app.get("/api/gym/{gym_id}/reports/revenue")
+async def get_revenue_report(gym_id: str, from_period: Optional[str] = None, to_period: Optional[str] = None):
+    """Monthly revenue with cash/online split (default: the last 12 months)"""
+    try:
+        to_period = to_period or current_period()
+        from_period = from_period or shift_period(to_period, -11)
+        periods = await monthly_revenue(reporting_db, gym_id, from_period, to_period)
         
         return {
-            "message": f"Monthly fees reset for {total_updated} members across {len(gym_owners)} gyms",
-            "total_members_updated": total_updated,
-            "total_gyms": len(gym_owners)
+            "gym_id": gym_id,
+            "periods": periods,
+            "total_amount": round(sum(period["total_amount"] for period in periods), 2)
         }
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/gym/{gym_id}/reports/payment-methods")
+async def get_payment_method_report(gym_id: str, period: Optional[str] = None):
+    """Cash vs online split for a billing period (default: current)"""
+    try:
+        return await method_split(reporting_db, gym_id, period or current_period())
+    
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/gym/{gym_id}/reports/collection-rate")
+async def get_collection_rate_report(gym_id: str, period: Optional[str] = None):
+    """Share of active members who have paid for a billing period (default: current)"""
+    try:
+        return await collection_rate(reporting_db, gym_id, period or current_period())
+    
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/gym/{gym_id}/analytics")
+async def get_gym_analytics(gym_id: str):
+    """Expected revenue, mid-month proration and overdue aging (cached per gym per day)"""
+    try:
+        from analytics import gym_analytics
+        
+        gym_owner = await load_gym_owner(gym_id)
+        if not gym_owner:
+            raise HTTPException(status_code=404, detail="Gym not found")
+        
+        return await gym_analytics(reporting_db, gym_owner)
+    
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 # WhatsApp integration endpoints
 @app.get("/api/whatsapp/status")
 async def get_whatsapp_status():
@@ -789,51 +1136,25 @@ async def get_whatsapp_status():
 async def get_notification_queue():
     """Get pending notifications for WhatsApp automation"""
     try:
-        # Check rate limiting
-        current_hour = datetime.utcnow().hour
-        today = datetime.utcnow().date()
-        
-        # Count notifications sent in current hour
-        hour_start = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
-        hour_count = await db.notification_queue.count_documents({
-            "status": "sent",
-            "sent_at": {"$gte": hour_start}
-        })
-        
-        # Count notifications sent today
-        day_start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
-        day_count = await db.notification_queue.count_documents({
-            "status": "sent",
-            "sent_at": {"$gte": day_start}
-        })
+        # Messages sent this hour and today across all senders
+        hour_count, day_count = await sent_counts(db)
         
-        # Apply rate limiting (40-50 per hour, 250 per day)
+        # Apply rate limiting per sender number (40-50 per hour, 250 per day)
         import random
-        max_per_hour = random.randint(40, 50)
-        max_per_day = 250
+        max_per_hour = random.randint(*MAX_PER_HOUR_RANGE)
+        max_per_day = MAX_PER_DAY
         
-        if hour_count >= max_per_hour:
-            return {
-                "notifications": [],
-                "rate_limited": True,
-                "message": f"Hourly limit reached ({hour_count}/{max_per_hour}). Try again next hour."
-            }
+        # Due notifications (max 10 at a time) whose sender is under its limits
+        notifications, held_back = await claim_notifications(db, 10, max_per_hour, max_per_day)
         
-        if day_count >= max_per_day:
+        if not notifications and held_back:
             return {
                 "notifications": [],
                 "rate_limited": True,
-                "message": f"Daily limit reached ({day_count}/{max_per_day}). Try again tomorrow."
+                "message": f"Every sender with due notifications reached its limit ({max_per_hour}/hour, {max_per_day}/day). Try again later."
             }
         
-        # Get pending notifications
-        remaining_slots = min(max_per_hour - hour_count, max_per_day - day_count, 10)  # Max 10 at a time
-        
-        notifications_cursor = db.notification_queue.find({
-            "status": "pending"
-        }).limit(remaining_slots)
-        
-        notifications = await notifications_cursor.to_list(length=remaining_slots)
+        notifications = await render_notifications(db, notifications)
         
         return {
             "notifications": notifications,
@@ -851,29 +1172,96 @@ async def get_notification_queue():
 async def update_notification_status(notification_id: str, status: str):
     """Update notification status after sending"""
     try:
+        if status == "failed":
+            # Failures are retried with backoff, then dead-lettered
+            await ack_notifications(db, [{"id": notification_id, "status": "failed"}])
+            return {"message": "Status updated successfully"}
+        
         update_data = {"status": status}
         if status == "sent":
             update_data["sent_at"] = datetime.utcnow()
-        elif status == "failed":
-            update_data["failed_at"] = datetime.utcnow()
         
-        await db.notification_queue.update_one(
+        previous = await db.notification_queue.find_one_and_update(
             {"id": notification_id},
-            {"$set": update_data}
+            {"$set": update_data},
+            projection={"_id": 0, "status": 1, "sender_number": 1},
+            return_document=ReturnDocument.BEFORE
         )
         
+        if previous and status == "sent" and previous.get("status") != "sent":
+            await record_sent(db, {previous.get("sender_number"): 1})
+        
         return {"message": "Status updated successfully"}
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/whatsapp/pacing")
+async def get_send_pacing(gym_id: Optional[str] = None):
+    """Projected send schedule per gym and sender (does not change the queue)"""
+    try:
+        report = await pace_queue(db, apply=False)
+        if gym_id:
+            report["gyms"] = {gym_id: report["gyms"].get(gym_id)}
+            report.pop("senders")
+        return report
+    
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/whatsapp/pacing")
+async def apply_send_pacing():
+    """Re-plan send slots for every pending notification"""
+    try:
+        return await run_exclusive(db, "notification_pacing", lambda: pace_queue(db))
+    
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/whatsapp/coalescing")
+async def get_coalescing_stats(days: int = 1):
+    """Sends saved by coalescing redundant notifications over the last `days` days"""
+    try:
+        return await coalescing_stats(db, datetime.utcnow() - timedelta(days=days))
+    
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/whatsapp/retries")
+async def get_retry_status():
+    """Notifications waiting to be retried and the dead-letter depth"""
+    try:
+        return await retry_stats(db)
+    
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/whatsapp/ack")
+async def ack_notification_results(batch: NotificationAckBatch):
+    """Apply a batch of sent/failed results from the automation client"""
+    try:
+        return await ack_notifications(db, [ack.model_dump() for ack in batch.results])
+    
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/whatsapp/inbound")
+async def receive_inbound_message(message: InboundMessage):
+    """Member reply forwarded by the automation client: STOP opts out, START opts back in"""
+    try:
+        return await handle_inbound(db, message.phone, message.to, message.text)
+    
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.post("/api/whatsapp/send-reminders")
 async def send_monthly_reminders():
     """Generate monthly fee reminders for unpaid members"""
     try:
         from whatsapp_automation import whatsapp_automation
         
-        await whatsapp_automation.generate_monthly_reminders()
+        await run_exclusive(db, "generate_monthly_reminders", whatsapp_automation.generate_monthly_reminders)
+        await run_exclusive(db, "notification_pacing", lambda: pace_queue(db))
         
         # Get queue status
         queue_size = await db.notification_queue.count_documents({"status": "pending"})
@@ -899,6 +1287,134 @@ async def get_automation_instructions():
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# Background job scheduler (monthly reset, reminders, cleanup)
+job_scheduler = None
+
+@app.on_event("startup")
+async def startup():
+    """Open the shared MongoDB pool and start the in-process job scheduler"""
+    global job_scheduler
+    from scheduler import SCHEDULER_ENABLED, setup_scheduler
+    from whatsapp_automation import ensure_indexes as ensure_reminder_indexes
+    
+    database.connect()
+    await cache.start()
+    await ensure_payment_indexes(db)
+    await ensure_template_indexes(db)
+    await ensure_queue_indexes(db)
+    await ensure_sender_indexes(db)
+    await ensure_coalescing_indexes(db)
+    await ensure_archive_indexes(db)
+    await ensure_reminder_indexes(db)
+    await ensure_suppression_indexes(db)
+    await suppression_list.refresh(db, force=True)
+    
+    if LOOP_WATCHDOG_ENABLED:
+        loop_watchdog.start()
+    
+    if SCHEDULER_ENABLED:
+        job_scheduler = setup_scheduler(db)
+        await job_scheduler.start()
+    
+    # Preload heavy optional dependencies once the server is accepting requests
+    start_warmup(get_razorpay_client)
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Stop the job scheduler, release its lease and close the MongoDB pool"""
+    if job_scheduler:
+        await job_scheduler.shutdown()
+    
+    if LOOP_WATCHDOG_ENABLED:
+        await loop_watchdog.stop()
+    
+    await cache.close()
+    database.close()
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Prometheus metrics (text exposition format)"""
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics disabled")
+    
+    return PlainTextResponse(
+        await render_metrics(db, database.pool_metrics()),
+        media_type="text/plain; version=0.0.4"
+    )
+
+@app.get("/api/admin/profile", dependencies=[Depends(require_admin_token)])
+async def profile_process(seconds: float = 10, mode: str = "wall", interval_ms: float = 5):
+    """Sample the running process and return collapsed stacks (admin endpoint)"""
+    import profiling
+    
+    if not profiling.PROFILING_ENABLED:
+        raise HTTPException(status_code=404, detail="Profiling disabled")
+    if mode not in ("wall", "cpu"):
+        raise HTTPException(status_code=400, detail="mode must be 'wall' or 'cpu'")
+    
+    try:
+        profile = await profiling.profile_process(seconds, mode, interval_ms)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    
+    return PlainTextResponse(profile["collapsed"], headers={
+        "X-Profile-Mode": profile["mode"],
+        "X-Profile-Samples": str(profile["samples"]),
+        "X-Profile-Duration": str(profile["duration_seconds"])
+    })
+
+@app.get("/api/admin/profile/requests/{profile_id}", dependencies=[Depends(require_admin_token)])
+async def get_request_profile(profile_id: str):
+    """Get the collapsed-stack profile recorded for a single request (admin endpoint)"""
+    import profiling
+    
+    profile = profiling.get_request_profile(profile_id)
+    if not profile:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    
+    return PlainTextResponse(profile["collapsed"], headers={
+        "X-Profile-Path": profile["path"],
+        "X-Profile-Samples": str(profile["samples"]),
+        "X-Profile-Duration": str(profile["duration_seconds"])
+    })
+
+@app.get("/api/admin/loop-blocks", dependencies=[Depends(require_admin_token)])
+async def get_loop_blocks():
+    """Get recent event-loop stalls with the blocking stack (admin endpoint)"""
+    return {
+        "enabled": LOOP_WATCHDOG_ENABLED,
+        "threshold_ms": loop_watchdog.threshold * 1000,
+        "blocks": loop_watchdog.recent_blocks()
+    }
+
+@app.get("/api/admin/warmup", dependencies=[Depends(require_admin_token)])
+async def get_warmup_status():
+    """Get background warm-up progress (admin endpoint)"""
+    return warmup_status()
+
+@app.get("/api/admin/db/pool", dependencies=[Depends(require_admin_token)])
+async def get_db_pool_metrics():
+    """Get MongoDB connection pool utilization (admin endpoint)"""
+    return database.pool_metrics()
+
+@app.get("/api/admin/scheduler/jobs", dependencies=[Depends(require_admin_token)])
+async def get_scheduled_jobs():
+    """Get scheduled job state (admin endpoint)"""
+    if not job_scheduler:
+        return {"enabled": False, "jobs": []}
+    
+    try:
+        return {
+            "enabled": True,
+            "instance_id": job_scheduler.instance_id,
+            "is_leader": job_scheduler.is_leader,
+            "jobs": await job_scheduler.get_jobs(),
+            "leases": await get_leases(db)
+        }
+    
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8001)
\ No newline at end of file
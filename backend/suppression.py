@@ -0,0 +1,156 @@
+"""
+Opt-out (STOP) suppression list
+A member who replies STOP to a gym's sender number is recorded in
+`notification_suppressions` and gets no further messages from that gym (a
+STOP that does not say which number it went to suppresses the phone for
+every gym; one to a number no gym owns is logged and not applied). START
+lifts it again. Each process keeps the active suppressions in a set so
+enqueue paths can drop suppressed phones without a query; the set is topped
+up from the collection's `updated_at` index every SUPPRESSION_REFRESH_SECONDS.
+"""
+
+import asyncio
+import os
+import re
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set
+
+from pymongo import ASCENDING
+
+# Environment variables
+SUPPRESSION_REFRESH_SECONDS = float(os.environ.get("SUPPRESSION_REFRESH_SECONDS", "30"))
+
+OPT_OUT_KEYWORDS = {"STOP", "STOPALL", "UNSUBSCRIBE", "CANCEL", "END", "QUIT", "OPTOUT"}
+OPT_IN_KEYWORDS = {"START", "UNSTOP", "SUBSCRIBE", "OPTIN"}
+# Scope of a suppression that applies to every gym
+ALL_GYMS = "*"
+# Writes from other processes can commit slightly out of updated_at order
+REFRESH_OVERLAP_SECONDS = 5
+
+
+def normalize_phone(phone: str) -> str:
+    """Member phones are stored as 10 digits; inbound numbers may carry a country code"""
+    digits = re.sub(r"\D", "", phone or "")
+    return digits[-10:]
+
+
+def parse_keyword(text: str) -> Optional[str]:
+    """"opt_out", "opt_in" or None; only a bare keyword counts (case and punctuation ignored)"""
+    keyword = re.sub(r"[^A-Za-z]", "", text or "").upper()
+    if keyword in OPT_OUT_KEYWORDS:
+        return "opt_out"
+    if keyword in OPT_IN_KEYWORDS:
+        return "opt_in"
+    return None
+
+
+def suppression_id(scope: str, phone: str) -> str:
+    return f"{scope}:{phone}"
+
+
+class SuppressionList:
+    """Active suppressions of this process, as phone sets per scope"""
+
+    def __init__(self):
+        self.phones: Dict[str, Set[str]] = {}
+        self.synced_at: Optional[datetime] = None
+        self.checked_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def apply(self, scope: str, phone: str, active: bool):
+        if active:
+            self.phones.setdefault(scope, set()).add(phone)
+        else:
+            self.phones.get(scope, set()).discard(phone)
+
+    def is_suppressed(self, gym_id: str, phone: str) -> bool:
+        phone = normalize_phone(phone)
+        return phone in self.phones.get(gym_id, ()) or phone in self.phones.get(ALL_GYMS, ())
+
+    def phones_for(self, gym_id: str) -> List[str]:
+        """Suppressed phones of one gym, including those suppressed for all gyms"""
+        return sorted(self.phones.get(gym_id, set()) | self.phones.get(ALL_GYMS, set()))
+
+    async def refresh(self, db, force: bool = False):
+        """Load the list on first use, then pick up changes made since the last sync"""
+        if not force and self.synced_at and time.monotonic() - self.checked_at < SUPPRESSION_REFRESH_SECONDS:
+            return
+        async with self._lock:
+            if not force and self.synced_at and time.monotonic() - self.checked_at < SUPPRESSION_REFRESH_SECONDS:
+                return
+            started = datetime.utcnow()
+            if self.synced_at is None:
+                query = {"active": True}
+            else:
+                query = {"updated_at": {"$gte": self.synced_at - timedelta(seconds=REFRESH_OVERLAP_SECONDS)}}
+            cursor = db.notification_suppressions.find(query, {"_id": 0, "scope": 1, "phone": 1, "active": 1})
+            async for suppression in cursor:
+                self.apply(suppression["scope"], suppression["phone"], suppression["active"])
+            self.synced_at = started
+            self.checked_at = time.monotonic()
+
+
+# Global instance
+suppression_list = SuppressionList()
+
+
+async def ensure_indexes(db):
+    """Incremental refresh reads by updated_at (idempotent)"""
+    await db.notification_suppressions.create_index("updated_at")
+    await db.notification_suppressions.create_index([("phone", ASCENDING), ("active", ASCENDING)])
+
+
+async def set_suppression(db, phone: str, gym_id: Optional[str], active: bool, source: str, text: str = "") -> Dict:
+    """Record an opt-out (`active`) or opt-in and apply it to this process's list"""
+    phone = normalize_phone(phone)
+    scope = gym_id or ALL_GYMS
+    now = datetime.utcnow()
+    await db.notification_suppressions.update_one(
+        {"_id": suppression_id(scope, phone)},
+        {
+            "$set": {"active": active, "source": source, "last_message": text[:160], "updated_at": now},
+            "$setOnInsert": {"scope": scope, "phone": phone, "created_at": now},
+        },
+        upsert=True
+    )
+    suppression_list.apply(scope, phone, active)
+
+    cancelled = 0
+    if active:
+        # Queued messages to the phone would only waste send budget
+        query = {"status": "pending", "phone": phone}
+        if gym_id:
+            query["gym_id"] = gym_id
+        result = await db.notification_queue.update_many(
+            query, {"$set": {"status": "suppressed", "suppressed_at": now}}
+        )
+        cancelled = result.modified_count
+    return {"phone": phone, "scope": scope, "suppressed": active, "cancelled": cancelled}
+
+
+async def handle_inbound(db, phone: str, to: Optional[str], text: str) -> Dict:
+    """
+    Apply a member's reply. `to` is the sender number the member replied to;
+    it scopes the opt-out to the gym that owns it. A reply without `to`
+    applies to every gym; one to a number no gym owns is not applied.
+    """
+    action = parse_keyword(text)
+    if action is None:
+        return {"phone": normalize_phone(phone), "action": "ignored"}
+
+    gym_id = None
+    if to:
+        # Sender numbers are stored normalized (see WhatsAppConfig)
+        sender = normalize_phone(to)
+        owner = await db.gym_owners.find_one(
+            {"$or": [{"whatsapp_sender_numbers": sender}, {"whatsapp_sender_number": sender}, {"phone": sender}]},
+            {"_id": 0, "id": 1}
+        )
+        if not owner:
+            print(f"Inbound {action} from {normalize_phone(phone)} to unknown sender {to} not applied")
+            return {"phone": normalize_phone(phone), "action": "unmatched", "to": to}
+        gym_id = owner["id"]
+
+    result = await set_suppression(db, phone, gym_id, action == "opt_out", "inbound", text)
+    return {**result, "action": action}
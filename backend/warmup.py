@@ -0,0 +1,72 @@
+"""
+Background warm-up for heavy optional dependencies
+The API imports qrcode/PIL, bcrypt, razorpay and pandas (analytics) on first
+use to keep cold start fast; once it is accepting requests these are
+preloaded in a thread.
+"""
+
+import asyncio
+import importlib
+import os
+import time
+from typing import Callable, Dict, List, Optional
+
+WARMUP_ENABLED = os.environ.get("WARMUP_ENABLED", "true").lower() == "true"
+
+# Modules deferred out of server.py's import path, in preload order
+WARMUP_MODULES: List[str] = [
+    "bcrypt",
+    "qrcode",
+    "PIL.Image",
+    "PIL.PngImagePlugin",
+    "analytics",
+]
+
+_status: Dict = {"state": "pending", "modules": {}, "errors": {}}
+_task: Optional[asyncio.Task] = None
+
+
+def preload_modules(extra_hooks: List[Callable[[], object]]):
+    """Import deferred modules and run warm-up hooks (runs in a worker thread)"""
+    started = time.perf_counter()
+
+    for module_name in WARMUP_MODULES:
+        module_started = time.perf_counter()
+        try:
+            importlib.import_module(module_name)
+            _status["modules"][module_name] = round((time.perf_counter() - module_started) * 1000, 1)
+        except Exception as e:
+            _status["errors"][module_name] = str(e)
+
+    for hook in extra_hooks:
+        hook_started = time.perf_counter()
+        try:
+            hook()
+            _status["modules"][hook.__name__] = round((time.perf_counter() - hook_started) * 1000, 1)
+        except Exception as e:
+            _status["errors"][hook.__name__] = str(e)
+
+    _status["total_ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+
+async def _warm_up(extra_hooks: List[Callable[[], object]]):
+    # Yield first so startup completes and the server starts accepting requests
+    await asyncio.sleep(0)
+    _status["state"] = "running"
+    await asyncio.to_thread(preload_modules, extra_hooks)
+    _status["state"] = "completed"
+    print(f"Warm-up completed in {_status['total_ms']}ms: {_status['modules']}")
+
+
+def start_warmup(*extra_hooks: Callable[[], object]):
+    """Schedule the warm-up in the background; hooks are extra callables such as client factories"""
+    global _task
+    if not WARMUP_ENABLED:
+        _status["state"] = "disabled"
+        return
+    if _task is None:
+        _task = asyncio.create_task(_warm_up(list(extra_hooks)))
+
+
+def warmup_status() -> Dict:
+    return _status
@@ -7,58 +7,223 @@ import asyncio
 import json
 import os
 from datetime import datetime
-from typing import List, Dict, Optional
-from motor.motor_asyncio import AsyncIOMotorClient
+from typing import List, Dict, Optional, Tuple
 import httpx
 import random
 import time
+from pymongo.errors import DuplicateKeyError
+from billing import current_period, fee_due, members_collection_name, unpaid_filter
+from coordination import run_exclusive
+from database import get_db
+from notification_archive import archive_notifications
+from notification_queue import MAX_PER_DAY, MAX_PER_HOUR_RANGE, ack_notifications, claim_notifications
+from send_pacing import pace_queue
+from suppression import suppression_list
 
 # Environment variables
-MONGO_URL = os.environ.get("MONGO_URL", "mongodb://localhost:27017")
-DB_NAME = os.environ.get("DB_NAME", "gym_saas")
 FRONTEND_URL = os.environ.get("FRONTEND_URL", "http://localhost:3000")
+# "pipeline" builds the reminder queue inside MongoDB (5.0+), "python" loops over members.
+# The loop stays the default until benchmarks/reminder_generation.py has been run on production data.
+REMINDER_GENERATION = os.environ.get("REMINDER_GENERATION", "python")
+REMINDER_PIPELINE_GYMS = int(os.environ.get("REMINDER_PIPELINE_GYMS", "200"))
+
+REMINDER_OWNER_FIELDS = ["gym_name", "phone", "address", "monthly_fee", "whatsapp_sender_number"]
+REMINDER_MEMBER_FIELDS = ["id", "name", "phone", "billing_period", "current_month_fee"]
+
+
+def reminder_key(gym_id: str, member_id: str, month: str) -> str:
+    """Queue _id of a member's monthly reminder, so each month's reminder is stored once"""
+    return f"monthly_reminder:{gym_id}:{member_id}:{month}"
+
+
+def month_label(period: str) -> str:
+    return datetime.strptime(period, "%Y-%m").strftime("%B %Y")
+
+
+def format_amount(amount) -> str:
+    """Fee as MongoDB's $toString prints it (no trailing .0)"""
+    return f"{float(amount):.2f}".rstrip("0").rstrip(".")
+
+
+def reminder_params(member: Dict, gym_owner: Dict, period: str) -> Dict:
+    """Parameters of the monthly_reminder template besides gym and member name"""
+    return {
+        "month": month_label(period),
+        "amount": format_amount(fee_due(member, gym_owner, period)),
+        "phone": gym_owner["phone"],
+        "address": gym_owner["address"],
+    }
+
+
+def reminder_pipeline(
+    gym_ids: List[str], period: str, shared: bool = False, suppressed: Optional[Dict[str, List[str]]] = None
+) -> Tuple[str, List[Dict]]:
+    """
+    (collection, pipeline) queueing `period`'s reminders for these gyms.
+
+    Unpaid members of every gym are combined with $unionWith (or matched in
+    the shared `members` collection), joined to their owner and $merge'd into
+    notification_queue on the reminder_key _id, keeping reminders that are
+    already queued. Members whose phone is in `suppressed` (gym id -> opted
+    out phones) are left out. Nothing is returned to the client.
+    """
+    member_projection = {"_id": 0, **{field: 1 for field in REMINDER_MEMBER_FIELDS}}
+    suppressed = suppressed or {}
+
+    if shared:
+        collection = "members"
+        opted_out = [
+            {"gym_id": gym_id, "phone": {"$in": suppressed[gym_id]}} for gym_id in gym_ids if suppressed.get(gym_id)
+        ]
+        stages = [
+            {"$match": {"gym_id": {"$in": gym_ids}, **unpaid_filter(period), **({"$nor": opted_out} if opted_out else {})}},
+            {"$project": {**member_projection, "gym_id": 1}},
+        ]
+    else:
+        def branch(gym_id):
+            opted_out = {"phone": {"$nin": suppressed[gym_id]}} if suppressed.get(gym_id) else {}
+            return [
+                {"$match": {**unpaid_filter(period), **opted_out}},
+                {"$project": {**member_projection, "gym_id": {"$literal": gym_id}}},
+            ]
+
+        collection = members_collection_name(gym_ids[0])
+        stages = branch(gym_ids[0]) + [
+            {"$unionWith": {"coll": members_collection_name(gym_id), "pipeline": branch(gym_id)}}
+            for gym_id in gym_ids[1:]
+        ]
+
+    # fee_due(): members not rolled over yet owe the gym's full monthly fee
+    amount = {"$cond": [
+        {"$eq": [{"$ifNull": ["$billing_period", period]}, period]},
+        "$current_month_fee",
+        "$gym.monthly_fee",
+    ]}
+    params = {
+        "month": {"$literal": month_label(period)},
+        "amount": {"$toString": amount},
+        "phone": "$gym.phone",
+        "address": "$gym.address",
+    }
+
+    stages += [
+        {"$lookup": {
+            "from": "gym_owners",
+            "localField": "gym_id",
+            "foreignField": "id",
+            "pipeline": [{"$project": {"_id": 0, **{field: 1 for field in REMINDER_OWNER_FIELDS}}}],
+            "as": "gym",
+        }},
+        {"$unwind": "$gym"},
+        {"$project": {
+            # Same as reminder_key()
+            "_id": {"$concat": ["monthly_reminder:", "$gym_id", ":", "$id", ":", {"$literal": period}]},
+            "id": {"$concat": ["reminder_", "$gym_id", "_", "$id", "_", {"$literal": str(int(time.time()))}]},
+            "gym_id": 1,
+            "member_id": "$id",
+            "phone": 1,
+            "member_name": "$name",
+            "gym_name": "$gym.gym_name",
+            "sender_number": {"$ifNull": ["$gym.whatsapp_sender_number", "$gym.phone"]},
+            "template": {"$literal": "monthly_reminder"},
+            "params": params,
+            "status": {"$literal": "pending"},
+            "type": {"$literal": "monthly_reminder"},
+            "month": {"$literal": period},
+            "created_at": "$$NOW",
+            "priority": {"$literal": 1},
+        }},
+        {"$merge": {
+            "into": "notification_queue",
+            "on": "_id",
+            "whenMatched": "keepExisting",
+            "whenNotMatched": "insert",
+        }},
+    ]
+    return collection, stages
+
+
+async def ensure_indexes(db):
+    """The reminder pipeline looks owners up by id once per member (idempotent)"""
+    await db.gym_owners.create_index("id")
+
 
 class WhatsAppAutomation:
     def __init__(self):
-        self.client = AsyncIOMotorClient(MONGO_URL)
-        self.db = self.client[DB_NAME]
+        self.db = get_db()
+        self.read_db = get_db("background")
         self.automation_active = False
         self.message_interval = random.randint(10, 15)  # 10-15 seconds
     
-    async def generate_monthly_reminders(self):
+    async def generate_monthly_reminders(self) -> int:
         """Generate monthly reminders for unpaid members"""
+        if REMINDER_GENERATION == "python":
+            return await self.generate_monthly_reminders_loop()
+        try:
+            return await self.generate_monthly_reminders_pipeline()
+        except Exception as e:
+            # e.g. MongoDB older than 5.0 rejects $unionWith/$merge; the loop queues the same reminders
+            print(f"Reminder pipeline failed, falling back to the Python loop: {e}")
+            return await self.generate_monthly_reminders_loop()
+    
+    async def generate_monthly_reminders_pipeline(self, shared: bool = False) -> int:
+        """Queue this month's reminders inside MongoDB; returns how many were added (errors are raised)"""
+        period = current_period()
+        owners_cursor = self.read_db.gym_owners.find({}, {"_id": 0, "id": 1})
+        gym_ids = [owner["id"] async for owner in owners_cursor]
+        
+        queued = {"type": "monthly_reminder", "month": period}
+        before = await self.db.notification_queue.count_documents(queued)
+        
+        # Opted-out phones are excluded inside the pipeline
+        await suppression_list.refresh(self.db)
+        suppressed = {gym_id: suppression_list.phones_for(gym_id) for gym_id in gym_ids}
+        
+        for start in range(0, len(gym_ids), REMINDER_PIPELINE_GYMS):
+            collection, pipeline = reminder_pipeline(
+                gym_ids[start:start + REMINDER_PIPELINE_GYMS], period, shared, suppressed
+            )
+            # $merge runs on the primary and yields no documents
+            await self.db[collection].aggregate(pipeline).to_list(length=None)
+        
+        added = await self.db.notification_queue.count_documents(queued) - before
+        print(f"Monthly reminders generated for {len(gym_ids)} gyms ({added} new)")
+        return added
+    
+    async def generate_monthly_reminders_loop(self) -> int:
+        """Generate monthly reminders one member at a time; returns how many were added"""
+        added = 0
         try:
             # Get all gym owners
-            gym_owners_cursor = self.db.gym_owners.find({})
+            gym_owners_cursor = self.read_db.gym_owners.find({})
             gym_owners = await gym_owners_cursor.to_list(length=None)
+            period = current_period()
+            await suppression_list.refresh(self.db)
             
             for gym_owner in gym_owners:
                 gym_id = gym_owner["id"]
-                collection_name = f"gym_{gym_id.replace('-', '_')}_members"
-                members_collection = self.db[collection_name]
+                members_collection = self.read_db[members_collection_name(gym_id)]
                 
                 # Get unpaid active members
-                unpaid_cursor = members_collection.find({
-                    "fee_status": "unpaid",
-                    "is_active": True
-                })
+                unpaid_cursor = members_collection.find(unpaid_filter(period))
                 unpaid_members = await unpaid_cursor.to_list(length=None)
                 
                 # Generate notifications for unpaid members
                 for member in unpaid_members:
+                    if suppression_list.is_suppressed(gym_id, member["phone"]):
+                        continue
+                    
                     # Check if reminder already sent this month
-                    current_month = datetime.now().strftime("%Y-%m")
                     existing_reminder = await self.db.notification_queue.find_one({
                         "member_id": member["id"],
                         "gym_id": gym_id,
                         "type": "monthly_reminder",
-                        "month": current_month
+                        "month": period
                     })
                     
                     if not existing_reminder:
-                        message = self.generate_reminder_message(member, gym_owner)
-                        
                         notification = {
+                            "_id": reminder_key(gym_id, member["id"], period),
                             "id": f"reminder_{gym_id}_{member['id']}_{int(time.time())}",
                             "gym_id": gym_id,
                             "member_id": member["id"],
@@ -66,82 +231,37 @@ class WhatsAppAutomation:
                             "member_name": member["name"],
                             "gym_name": gym_owner["gym_name"],
                             "sender_number": gym_owner.get("whatsapp_sender_number", gym_owner["phone"]),
-                            "message": message,
+                            # Rendered when a sender pulls it (notification_templates)
+                            "template": "monthly_reminder",
+                            "params": reminder_params(member, gym_owner, period),
                             "status": "pending",
                             "type": "monthly_reminder",
-                            "month": current_month,
+                            "month": period,
                             "created_at": datetime.utcnow(),
                             "priority": 1  # Monthly reminders have high priority
                         }
                         
-                        await self.db.notification_queue.insert_one(notification)
+                        try:
+                            await self.db.notification_queue.insert_one(notification)
+                            added += 1
+                        except DuplicateKeyError:
+                            # Queued by a concurrent run
+                            pass
             
-            print(f"Monthly reminders generated for {len(gym_owners)} gyms")
+            print(f"Monthly reminders generated for {len(gym_owners)} gyms ({added} new)")
             
         except Exception as e:
             print(f"Error generating monthly reminders: {e}")
-    
-    def generate_reminder_message(self, member: Dict, gym_owner: Dict) -> str:
-        """Generate personalized reminder message"""
-        current_month = datetime.now().strftime("%B %Y")
-        
-        message = f"""🏋️ *{gym_owner['gym_name']}* 
-
-Hi {member['name']}! 👋
-
-This is a friendly reminder that your gym membership fee for {current_month} is due.
-
-💰 *Amount Due:* ₹{member['current_month_fee']}
-
-*Payment Options:*
-💵 Cash Payment: Visit the gym and pay directly
-💳 Online Payment: Use our secure payment portal
-
-📞 *Contact:* {gym_owner['phone']}
-📍 *Address:* {gym_owner['address']}
-
-Thank you for being a valued member! 💪
-
-_Reply STOP to unsubscribe from reminders_"""
-        
-        return message
+        return added
     
     async def get_pending_notifications(self, limit: int = 10) -> List[Dict]:
         """Get pending notifications with rate limiting"""
         try:
-            # Check rate limiting
-            current_hour = datetime.utcnow().hour
-            today = datetime.utcnow().date()
-            
-            # Count notifications sent in current hour
-            hour_start = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
-            hour_count = await self.db.notification_queue.count_documents({
-                "status": "sent",
-                "sent_at": {"$gte": hour_start}
-            })
+            # Apply rate limiting per sender number (40-50 per hour, 250 per day)
+            max_per_hour = random.randint(*MAX_PER_HOUR_RANGE)
             
-            # Count notifications sent today
-            day_start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
-            day_count = await self.db.notification_queue.count_documents({
-                "status": "sent",
-                "sent_at": {"$gte": day_start}
-            })
-            
-            # Apply rate limiting (40-50 per hour, 250 per day)
-            max_per_hour = random.randint(40, 50)
-            max_per_day = 250
-            
-            if hour_count >= max_per_hour or day_count >= max_per_day:
-                return []
-            
-            # Get pending notifications (prioritize monthly reminders)
-            remaining_slots = min(max_per_hour - hour_count, max_per_day - day_count, limit)
-            
-            notifications_cursor = self.db.notification_queue.find({
-                "status": "pending"
-            }).sort("priority", -1).limit(remaining_slots)
-            
-            notifications = await notifications_cursor.to_list(length=remaining_slots)
+            # Due notifications, prioritizing monthly reminders
+            notifications, _ = await claim_notifications(self.db, limit, max_per_hour, MAX_PER_DAY)
             
             return notifications
             
@@ -152,54 +272,34 @@ _Reply STOP to unsubscribe from reminders_"""
     async def mark_notification_sent(self, notification_id: str):
         """Mark notification as sent"""
         try:
-            await self.db.notification_queue.update_one(
-                {"id": notification_id},
-                {
-                    "$set": {
-                        "status": "sent",
-                        "sent_at": datetime.utcnow()
-                    }
-                }
-            )
+            await ack_notifications(self.db, [{"id": notification_id, "status": "sent"}])
         except Exception as e:
             print(f"Error marking notification as sent: {e}")
     
     async def mark_notification_failed(self, notification_id: str, error: str):
-        """Mark notification as failed"""
+        """Mark notification as failed (retried with backoff, then dead-lettered)"""
         try:
-            await self.db.notification_queue.update_one(
-                {"id": notification_id},
-                {
-                    "$set": {
-                        "status": "failed",
-                        "failed_at": datetime.utcnow(),
-                        "error": error
-                    }
-                }
-            )
+            await ack_notifications(self.db, [{"id": notification_id, "status": "failed", "error": error}])
         except Exception as e:
             print(f"Error marking notification as failed: {e}")
     
-    async def cleanup_old_notifications(self):
-        """Clean up old notifications (older than 7 days)"""
+    async def cleanup_old_notifications(self) -> Dict:
+        """Archive completed notifications and delete expired payment sessions"""
         try:
-            seven_days_ago = datetime.utcnow().timestamp() - (7 * 24 * 60 * 60)
-            
-            # Delete old sent/failed notifications
-            await self.db.notification_queue.delete_many({
-                "status": {"$in": ["sent", "failed"]},
-                "created_at": {"$lt": datetime.fromtimestamp(seven_days_ago)}
-            })
+            # Bounded, throttled batches into the monthly archive collections
+            result = await archive_notifications(self.db)
             
             # Delete old payment sessions
             await self.db.payment_sessions.delete_many({
                 "expires_at": {"$lt": datetime.utcnow().timestamp()}
             })
             
-            print("Old notifications and sessions cleaned up")
+            print(f"Archived {result['archived']} notifications; expired sessions cleaned up")
+            return result
             
         except Exception as e:
             print(f"Error cleaning up old notifications: {e}")
+            return {"archived": 0, "error": str(e)}
     
     def get_whatsapp_automation_instructions(self) -> Dict:
         """Get instructions for WhatsApp Web automation"""
@@ -236,10 +336,25 @@ async def run_automation_cycle():
         # Generate monthly reminders if needed
         today = datetime.now().day
         if 1 <= today <= 7:  # First 7 days of month
-            await whatsapp_automation.generate_monthly_reminders()
+            await run_exclusive(
+                whatsapp_automation.db,
+                "generate_monthly_reminders",
+                whatsapp_automation.generate_monthly_reminders
+            )
+        
+        # Give newly queued notifications a send slot; unslotted ones are not claimed
+        await run_exclusive(
+            whatsapp_automation.db,
+            "notification_pacing",
+            lambda: pace_queue(whatsapp_automation.db)
+        )
         
-        # Clean up old notifications
-        await whatsapp_automation.cleanup_old_notifications()
+        # Clean up old notifications (one replica at a time)
+        await run_exclusive(
+            whatsapp_automation.db,
+            "cleanup_old_notifications",
+            whatsapp_automation.cleanup_old_notifications
+        )
         
         # Get pending notifications
         notifications = await whatsapp_automation.get_pending_notifications()
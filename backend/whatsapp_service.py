@@ -1,6 +1,4 @@
-<file>
-      <absolute_file_name>/app/backend/whatsapp_service.py</absolute_file_name>
-      <content">"""
+"""
 WhatsApp Integration for Gym Management SaaS
 Simplified implementation using webhooks and external WhatsApp Business API
 """
@@ -9,20 +7,27 @@ import os
 import json
 import asyncio
 from datetime import datetime, date
-from typing import List, Dict
-from motor.motor_asyncio import AsyncIOMotorClient
+from typing import AsyncIterator, Dict, Tuple
 import httpx
+from billing import current_period, fee_due, unpaid_filter
+from database import get_db
+from suppression import suppression_list
 
 # Environment variables
-MONGO_URL = os.environ.get("MONGO_URL", "mongodb://localhost:27017")
-DB_NAME = os.environ.get("DB_NAME", "gym_saas")
 WHATSAPP_API_URL = os.environ.get("WHATSAPP_API_URL", "YOUR_WHATSAPP_API_ENDPOINT")
 WHATSAPP_API_TOKEN = os.environ.get("WHATSAPP_API_TOKEN", "YOUR_WHATSAPP_API_TOKEN")
+REMINDER_SENDERS = int(os.environ.get("REMINDER_SENDERS", "1"))
+REMINDER_QUEUE_SIZE = int(os.environ.get("REMINDER_QUEUE_SIZE", "100"))
+REMINDER_BATCH_SIZE = 500
+
+# Only the fields the reminder template and logs need (no QR images or password hash)
+REMINDER_OWNER_PROJECTION = {"_id": 0, "id": 1, "gym_name": 1, "phone": 1, "address": 1, "monthly_fee": 1}
+REMINDER_MEMBER_PROJECTION = {"_id": 0, "id": 1, "name": 1, "phone": 1, "current_month_fee": 1, "billing_period": 1}
 
 class WhatsAppService:
     def __init__(self):
-        self.client = AsyncIOMotorClient(MONGO_URL)
-        self.db = self.client[DB_NAME]
+        self.db = get_db()
+        self.read_db = get_db("background")
         self.api_configured = (
             WHATSAPP_API_URL != "YOUR_WHATSAPP_API_ENDPOINT" and 
             WHATSAPP_API_TOKEN != "YOUR_WHATSAPP_API_TOKEN"
@@ -54,31 +59,32 @@ class WhatsAppService:
             print(f"Error sending WhatsApp message: {e}")
             return False
     
-    async def get_unpaid_members(self) -> List[Dict]:
-        """Get all unpaid members across all gyms"""
-        unpaid_members = []
+    async def iter_unpaid_members(self) -> AsyncIterator[Tuple[Dict, Dict]]:
+        """Stream (member, gym_info) for every unpaid member across all gyms
         
-        # Get all gym owners
-        gym_owners_cursor = self.db.gym_owners.find({})
-        gym_owners = await gym_owners_cursor.to_list(length=None)
+        Owners and members are read with projections and batched cursors, and
+        all members of a gym share one gym_info dict, so memory stays flat
+        however many members are unpaid. Members who opted out are skipped.
+        """
+        period = current_period()
+        await suppression_list.refresh(self.db)
         
-        for gym_owner in gym_owners:
+        gym_owners_cursor = self.read_db.gym_owners.find({}, REMINDER_OWNER_PROJECTION, batch_size=REMINDER_BATCH_SIZE)
+        async for gym_owner in gym_owners_cursor:
             gym_id = gym_owner["id"]
             collection_name = f"gym_{gym_id.replace('-', '_')}_members"
-            members_collection = self.db[collection_name]
+            members_collection = self.read_db[collection_name]
             
             # Get unpaid active members
-            unpaid_cursor = members_collection.find({
-                "fee_status": "unpaid",
-                "is_active": True
-            })
-            unpaid_list = await unpaid_cursor.to_list(length=None)
-            
-            for member in unpaid_list:
-                member["gym_info"] = gym_owner
-                unpaid_members.append(member)
-        
-        return unpaid_members
+            unpaid = unpaid_filter(period)
+            opted_out = suppression_list.phones_for(gym_id)
+            if opted_out:
+                unpaid["phone"] = {"$nin": opted_out}
+            unpaid_cursor = members_collection.find(
+                unpaid, REMINDER_MEMBER_PROJECTION, batch_size=REMINDER_BATCH_SIZE
+            )
+            async for member in unpaid_cursor:
+                yield member, gym_owner
     
     def generate_reminder_message(self, member: Dict, gym_info: Dict) -> str:
         """Generate personalized reminder message"""
@@ -90,7 +96,7 @@ Hi {member['name']}!
 
 This is a friendly reminder that your gym membership fee for {current_month} is due.
 
-*Amount Due:* Rs.{member['current_month_fee']}
+*Amount Due:* Rs.{fee_due(member, gym_info)}
 
 *Payment Options:*
 - Cash Payment: Visit the gym and pay directly
@@ -106,62 +112,49 @@ Reply STOP to unsubscribe from reminders"""
         return message
     
     async def send_monthly_reminders(self) -> Dict:
-        """Send monthly fee reminders to all unpaid members"""
-        print("Starting monthly reminder process...")
-        
-        unpaid_members = await self.get_unpaid_members()
+        """Send monthly fee reminders to all unpaid members
         
-        if not unpaid_members:
-            print("No unpaid members found.")
-            return {
-                "total_members": 0,
-                "messages_sent": 0,
-                "messages_failed": 0,
-                "status": "completed"
-            }
+        A producer streams unpaid members into a bounded queue that
+        REMINDER_SENDERS workers drain, so at most REMINDER_QUEUE_SIZE
+        members are held in memory at once.
+        """
+        print("Starting monthly reminder process...")
         
-        messages_sent = 0
-        messages_failed = 0
+        queue: asyncio.Queue = asyncio.Queue(maxsize=REMINDER_QUEUE_SIZE)
+        counts = {"total_members": 0, "messages_sent": 0, "messages_failed": 0}
         
-        for member in unpaid_members:
+        async def produce():
             try:
-                message = self.generate_reminder_message(member, member["gym_info"])
-                success = await self.send_message(member["phone"], message)
-                
-                if success:
-                    messages_sent += 1
-                    # Log the reminder
-                    await self.db.whatsapp_logs.insert_one({
-                        "member_id": member["id"],
-                        "gym_id": member["gym_info"]["id"],
-                        "phone": member["phone"],
-                        "message_type": "monthly_reminder",
-                        "status": "sent",
-                        "sent_at": datetime.utcnow()
-                    })
+                async for item in self.iter_unpaid_members():
+                    counts["total_members"] += 1
+                    await queue.put(item)
+            finally:
+                # One stop marker per sender, also when the producer fails
+                for _ in range(REMINDER_SENDERS):
+                    await queue.put(None)
+        
+        async def send():
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                member, gym_info = item
+                if await self.send_reminder(member, gym_info):
+                    counts["messages_sent"] += 1
                 else:
-                    messages_failed += 1
-                    # Log the failure
-                    await self.db.whatsapp_logs.insert_one({
-                        "member_id": member["id"],
-                        "gym_id": member["gym_info"]["id"],
-                        "phone": member["phone"],
-                        "message_type": "monthly_reminder",
-                        "status": "failed",
-                        "failed_at": datetime.utcnow()
-                    })
+                    counts["messages_failed"] += 1
                 
                 # Add delay to avoid rate limiting
                 await asyncio.sleep(1)
-                
-            except Exception as e:
-                messages_failed += 1
-                print(f"Error sending reminder to {member['phone']}: {e}")
+        
+        await asyncio.gather(produce(), *(send() for _ in range(REMINDER_SENDERS)))
+        
+        if not counts["total_members"]:
+            print("No unpaid members found.")
+            return {**counts, "status": "completed"}
         
         result = {
-            "total_members": len(unpaid_members),
-            "messages_sent": messages_sent,
-            "messages_failed": messages_failed,
+            **counts,
             "status": "completed",
             "timestamp": datetime.utcnow().isoformat()
         }
@@ -169,6 +162,27 @@ Reply STOP to unsubscribe from reminders"""
         print(f"Reminder process completed: {result}")
         return result
     
+    async def send_reminder(self, member: Dict, gym_info: Dict) -> bool:
+        """Send one monthly reminder and log the outcome"""
+        try:
+            message = self.generate_reminder_message(member, gym_info)
+            success = await self.send_message(member["phone"], message)
+            
+            log = {
+                "member_id": member["id"],
+                "gym_id": gym_info["id"],
+                "phone": member["phone"],
+                "message_type": "monthly_reminder",
+                "status": "sent" if success else "failed",
+            }
+            log["sent_at" if success else "failed_at"] = datetime.utcnow()
+            await self.db.whatsapp_logs.insert_one(log)
+            return success
+        
+        except Exception as e:
+            print(f"Error sending reminder to {member['phone']}: {e}")
+            return False
+    
     async def send_payment_confirmation(self, member_id: str, gym_id: str) -> bool:
         """Send payment confirmation message"""
         try:
@@ -239,5 +253,3 @@ if __name__ == "__main__":
         print(json.dumps(result, indent=2))
     
     asyncio.run(test())
-</content>
-    </file>
\ No newline at end of file
@@ -0,0 +1,199 @@
+"""
+Vectorized vs per-member fee analytics
+Runs analytics.compute_gym_analytics (pandas/NumPy) and an equivalent
+per-member Python loop built on calculate_prorated_fee over the same
+synthetic members, checks they agree and reports the timings. No database
+is involved; the vectorized timing includes building the DataFrame from
+the projected documents, as the endpoint does per cursor batch.
+
+Usage:
+  python benchmarks/fee_analytics.py [--members 1000000] [--repeat 3] [--output results.json]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend")
+sys.path.insert(0, BACKEND_DIR)
+
+import pandas as pd  # noqa: E402
+
+from analytics import AGING_BUCKETS, MEMBER_COLUMNS, compute_gym_analytics  # noqa: E402
+from billing import calculate_prorated_fee, shift_period  # noqa: E402
+
+MONTHLY_FEE = 1500.0
+
+
+def generate_members(count: int, period: str, today: date, seed: int):
+    """Projected member documents with a spread of joining dates and payment histories"""
+    rng = random.Random(seed)
+    previous = shift_period(period, -1)
+    members = []
+    for i in range(count):
+        joining_date = today - timedelta(days=rng.randint(0, 3 * 365))
+        joined_now = joining_date.strftime("%Y-%m") == period
+        paid_roll = rng.random()
+        if paid_roll < 0.6:
+            paid_period = period
+        elif paid_roll < 0.85 and not joined_now:
+            paid_period = previous
+        elif paid_roll < 0.95 and not joined_now:
+            paid_period = shift_period(period, -rng.randint(2, 6))
+        else:
+            paid_period = None
+        rolled_over = rng.random() < 0.9
+        members.append({
+            "id": f"m{i:08d}",
+            "joining_date": joining_date.isoformat(),
+            "is_active": rng.random() < 0.92,
+            "fee_status": "paid" if paid_period == period else "unpaid",
+            "current_month_fee": (calculate_prorated_fee(MONTHLY_FEE, joining_date) or MONTHLY_FEE)
+            if joined_now else MONTHLY_FEE,
+            "billing_period": period if rolled_over or paid_period == period else previous,
+            "paid_period": paid_period,
+        })
+    return members
+
+
+def period_number(period: str) -> int:
+    return int(period[:4]) * 12 + int(period[5:7]) - 1
+
+
+def naive_analytics(members, monthly_fee: float, period: str, today: date):
+    """The same report computed one member at a time"""
+    current_index = period_number(period)
+    active_count = paid_count = joiners = 0
+    expected = collected = prorated_amount = 0.0
+    bucket_counts = [0] * len(AGING_BUCKETS)
+    bucket_amounts = [0.0] * len(AGING_BUCKETS)
+
+    for member in members:
+        if not member.get("is_active"):
+            continue
+        active_count += 1
+        joining_date = date.fromisoformat(member["joining_date"])
+        joining_index = joining_date.year * 12 + joining_date.month - 1
+
+        billing_period = member.get("billing_period")
+        fee_due = member["current_month_fee"] if billing_period == period else monthly_fee
+        if billing_period is None:
+            paid = member.get("fee_status") == "paid"
+        else:
+            paid = member.get("paid_period") == period
+        expected += fee_due
+
+        if joining_index == current_index:
+            prorated = calculate_prorated_fee(monthly_fee, joining_date)
+            if prorated > 0:
+                joiners += 1
+                prorated_amount += prorated
+
+        if paid:
+            paid_count += 1
+            collected += fee_due
+            continue
+
+        paid_period = member.get("paid_period")
+        first_unpaid = period_number(paid_period) + 1 if paid_period else joining_index
+        if billing_period is None:
+            first_unpaid = current_index
+        first_unpaid = min(first_unpaid, current_index)
+        due_date = date(first_unpaid // 12, first_unpaid % 12 + 1, 1)
+        days_overdue = (today - due_date).days
+        outstanding = fee_due + (current_index - first_unpaid) * monthly_fee
+
+        for bucket, (_, limit) in enumerate(AGING_BUCKETS):
+            if limit is None or days_overdue <= limit:
+                bucket_counts[bucket] += 1
+                bucket_amounts[bucket] += outstanding
+                break
+
+    return {
+        "active": active_count,
+        "paid": paid_count,
+        "expected": round(expected, 2),
+        "collected": round(collected, 2),
+        "mid_month_joiners": joiners,
+        "prorated_amount": round(prorated_amount, 2),
+        "aging_counts": bucket_counts,
+        "aging_amounts": [round(amount, 2) for amount in bucket_amounts],
+    }
+
+
+def vectorized_analytics(members, monthly_fee: float, period: str, today: date):
+    frame = pd.DataFrame.from_records(members, columns=MEMBER_COLUMNS)
+    return compute_gym_analytics(frame, monthly_fee, period, today)
+
+
+def same_report(naive, vectorized) -> bool:
+    def close(a, b):
+        return abs(a - b) <= max(0.01, abs(a) * 1e-9)
+
+    return (
+        naive["active"] == vectorized["members"]["active"]
+        and naive["paid"] == vectorized["members"]["paid"]
+        and close(naive["expected"], vectorized["revenue"]["expected"])
+        and close(naive["collected"], vectorized["revenue"]["collected"])
+        and naive["mid_month_joiners"] == vectorized["proration"]["mid_month_joiners"]
+        # Per-member rounding may differ in the last cent between round() and np.round
+        and abs(naive["prorated_amount"] - vectorized["proration"]["prorated_amount"]) <= 0.01 * naive["mid_month_joiners"]
+        and naive["aging_counts"] == [bucket["members"] for bucket in vectorized["overdue_aging"]]
+        and all(close(a, b["amount"]) for a, b in zip(naive["aging_amounts"], vectorized["overdue_aging"]))
+    )
+
+
+def best_of(func, repeat: int, *args) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fee analytics benchmark: pandas/NumPy vs per-member loop")
+    parser.add_argument("--members", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    today = date.today()
+    period = today.strftime("%Y-%m")
+    print(f"Generating {args.members} members...")
+    members = generate_members(args.members, period, today, args.seed)
+
+    naive = naive_analytics(members, MONTHLY_FEE, period, today)
+    vectorized = vectorized_analytics(members, MONTHLY_FEE, period, today)
+    assert same_report(naive, vectorized), (naive, vectorized)
+
+    frame = pd.DataFrame.from_records(members, columns=MEMBER_COLUMNS)
+    naive_seconds = best_of(naive_analytics, args.repeat, members, MONTHLY_FEE, period, today)
+    vectorized_seconds = best_of(vectorized_analytics, args.repeat, members, MONTHLY_FEE, period, today)
+    compute_seconds = best_of(compute_gym_analytics, args.repeat, frame, MONTHLY_FEE, period, today)
+
+    result = {
+        "benchmark": "fee_analytics",
+        "timestamp": datetime.utcnow().isoformat(),
+        "members": args.members,
+        "naive_loop_ms": round(naive_seconds * 1000, 1),
+        "vectorized_ms": round(vectorized_seconds * 1000, 1),
+        "vectorized_compute_only_ms": round(compute_seconds * 1000, 1),
+        "speedup": round(naive_seconds / vectorized_seconds, 1) if vectorized_seconds else None,
+        "speedup_compute_only": round(naive_seconds / compute_seconds, 1) if compute_seconds else None,
+    }
+    print(json.dumps(result, indent=2))
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
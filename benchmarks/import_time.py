@@ -0,0 +1,110 @@
+"""
+Import-time benchmark for the API process
+Measures how long `import server` takes in a fresh interpreter using
+`python -X importtime` and fails when it exceeds the startup budget.
+
+Usage:
+  python benchmarks/import_time.py [--runs 5] [--budget-ms 800] [--output results.json]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from datetime import datetime
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend")
+
+# Modules that must stay out of server.py's import path (loaded on first use / warm-up)
+DEFERRED_MODULES = ["qrcode", "PIL", "razorpay", "bcrypt", "pandas", "numpy"]
+
+
+def measure_once(module: str):
+    """Import `module` in a fresh interpreter; returns (total_us, [(name, cumulative_us, depth)])"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+
+    entries = []
+    for line in result.stderr.splitlines():
+        # Format: "import time: self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, self_us, cumulative_us, name = line.replace("import time:", "|", 1).split("|")
+        # Nested imports are indented by two spaces per level
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        entries.append((name.strip(), int(cumulative_us), depth))
+
+    total_us = next((us for name, us, depth in entries if name == module), 0)
+    return total_us, entries
+
+
+def direct_imports(entries, module: str):
+    """Cumulative time of each module imported directly by `module`"""
+    # Children are printed before their parent, one level deeper
+    index = next(i for i, (name, _, _) in enumerate(entries) if name == module)
+    depth = entries[index][2]
+    children = {}
+    for name, us, child_depth in reversed(entries[:index]):
+        if child_depth <= depth:
+            break
+        if child_depth == depth + 1:
+            children[name] = us
+    return children
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure API import time")
+    parser.add_argument("--module", default="server")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=float(os.environ.get("STARTUP_BUDGET_MS", "800")))
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    totals = []
+    entries = []
+    for _ in range(args.runs):
+        total_us, entries = measure_once(args.module)
+        totals.append(total_us / 1000)
+
+    median_ms = statistics.median(totals)
+    slowest = sorted(direct_imports(entries, args.module).items(), key=lambda item: item[1], reverse=True)[: args.top]
+    imported = {name for name, _, _ in entries}
+    leaked = [name for name in DEFERRED_MODULES if name in imported]
+
+    result = {
+        "benchmark": "import_time",
+        "module": args.module,
+        "timestamp": datetime.utcnow().isoformat(),
+        "runs_ms": [round(total, 1) for total in totals],
+        "median_ms": round(median_ms, 1),
+        "budget_ms": args.budget_ms,
+        "within_budget": median_ms <= args.budget_ms,
+        "slowest_imports_ms": {name: round(us / 1000, 1) for name, us in slowest},
+        "deferred_modules_imported": leaked,
+    }
+
+    print(f"import {args.module}: median {result['median_ms']}ms over {args.runs} runs (budget {args.budget_ms}ms)")
+    for name, ms in result["slowest_imports_ms"].items():
+        print(f"  {ms:>8.1f}ms  {name}")
+    if leaked:
+        print(f"Deferred modules imported at startup: {', '.join(leaked)}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+
+    if not result["within_budget"] or leaked:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""
+Load test for the Gym Management SaaS API
+Boots the FastAPI app in-process against a local mongod, seeds gyms and
+members into a throwaway database (see seed_data.py), then drives a
+weighted request mix with async concurrency and reports RPS and
+p50/p95/p99 per endpoint.
+
+Usage:
+  python benchmarks/load_test.py --gyms 20 --members 500 --duration 30 --concurrency 50 \\
+      --mix steady --output benchmarks/results/steady.json [--compare previous.json]
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend")
+sys.path.insert(0, BACKEND_DIR)
+
+from seed_data import member_id_for, seed_async  # noqa: E402
+
+# Request mixes: endpoint name -> weight
+MIXES = {
+    # Typical weekday traffic: dashboards polling members and the queue
+    "steady": {"member_list": 45, "payment_mark": 20, "queue_poll": 25, "login": 10},
+    # 1st of the month: every owner logs in and checks who has paid
+    "login_storm": {"login": 70, "member_list": 30},
+    # Reminder period: queue draining and reminder generation alongside dashboards
+    "reminders": {"queue_poll": 45, "member_list": 30, "payment_mark": 20, "reminder_generation": 5},
+}
+
+def percentile(sorted_values, pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(pct / 100 * len(sorted_values)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+class LoadTest:
+    def __init__(self, client, gyms, mix, concurrency, duration):
+        self.client = client
+        self.gyms = gyms
+        self.endpoints = list(mix)
+        self.weights = [mix[name] for name in self.endpoints]
+        self.concurrency = concurrency
+        self.duration = duration
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    async def login(self, gym):
+        return await self.client.post("/api/gym-owner/login", json={
+            "phone": gym["phone"],
+            "password": gym["password"],
+        })
+
+    async def member_list(self, gym):
+        return await self.client.get(f"/api/gym/{gym['id']}/members")
+
+    async def payment_mark(self, gym):
+        member_id = member_id_for(gym["id"], random.randrange(gym["member_count"]))
+        return await self.client.patch(
+            f"/api/member/{gym['id']}/{member_id}/payment",
+            json={"payment_method": random.choice(["cash", "online"])},
+        )
+
+    async def queue_poll(self, gym):
+        return await self.client.get("/api/whatsapp/queue")
+
+    async def reminder_generation(self, gym):
+        return await self.client.post("/api/whatsapp/send-reminders")
+
+    async def worker(self, deadline: float):
+        while time.perf_counter() < deadline:
+            endpoint = random.choices(self.endpoints, self.weights)[0]
+            gym = random.choice(self.gyms)
+            started = time.perf_counter()
+            try:
+                response = await getattr(self, endpoint)(gym)
+                ok = response.status_code < 400
+            except Exception:
+                ok = False
+            self.latencies[endpoint].append(time.perf_counter() - started)
+            if not ok:
+                self.errors[endpoint] += 1
+
+    async def run(self):
+        started = time.perf_counter()
+        deadline = started + self.duration
+        await asyncio.gather(*(self.worker(deadline) for _ in range(self.concurrency)))
+        return time.perf_counter() - started
+
+    def report(self, elapsed: float):
+        endpoints = {}
+        all_latencies = []
+        for endpoint, latencies in sorted(self.latencies.items()):
+            latencies.sort()
+            all_latencies.extend(latencies)
+            endpoints[endpoint] = summarize(latencies, self.errors[endpoint], elapsed)
+        all_latencies.sort()
+        return {
+            "endpoints": endpoints,
+            "total": summarize(all_latencies, sum(self.errors.values()), elapsed),
+        }
+
+
+def summarize(sorted_latencies, errors: int, elapsed: float):
+    count = len(sorted_latencies)
+    return {
+        "requests": count,
+        "errors": errors,
+        "rps": round(count / elapsed, 1) if elapsed else 0,
+        "mean_ms": round(sum(sorted_latencies) / count * 1000, 2) if count else 0,
+        "p50_ms": round(percentile(sorted_latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(sorted_latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(sorted_latencies, 99) * 1000, 2),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=BACKEND_DIR
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def compare(current, previous_path: str):
+    with open(previous_path) as f:
+        previous = json.load(f)
+    print(f"\nCompared with {previous_path} ({previous.get('revision')}):")
+    for endpoint, stats in current["results"]["endpoints"].items():
+        old = previous["results"]["endpoints"].get(endpoint)
+        if not old:
+            continue
+        deltas = []
+        for key in ("rps", "p50_ms", "p95_ms", "p99_ms"):
+            if old[key]:
+                deltas.append(f"{key} {(stats[key] - old[key]) / old[key] * 100:+.1f}%")
+        print(f"  {endpoint:<20} {', '.join(deltas)}")
+
+
+async def main_async(args):
+    import httpx
+
+    import server
+    from database import database
+
+    db = database.get_db()
+    await database.client.drop_database(args.db_name)
+    print(f"Seeding {args.gyms} gyms x {args.members} members into {args.db_name}...")
+    seed_started = time.perf_counter()
+    gyms = await seed_async(db, args.gyms, args.members, skew=args.skew, seed=args.seed)
+    print(f"Seeded in {time.perf_counter() - seed_started:.1f}s")
+
+    await server.startup()
+    try:
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+            test = LoadTest(client, gyms, MIXES[args.mix], args.concurrency, args.duration)
+            print(f"Running '{args.mix}' mix for {args.duration}s with {args.concurrency} concurrent clients...")
+            elapsed = await test.run()
+    finally:
+        await server.shutdown()
+
+    result = {
+        "benchmark": "load_test",
+        "revision": git_revision(),
+        "timestamp": datetime.utcnow().isoformat(),
+        "config": {
+            "mix": args.mix,
+            "gyms": args.gyms,
+            "members_per_gym": args.members,
+            "skew": args.skew,
+            "concurrency": args.concurrency,
+            "duration_s": args.duration,
+        },
+        "results": test.report(elapsed),
+    }
+
+    if not args.keep:
+        database.connect()
+        await database.client.drop_database(args.db_name)
+        database.close()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="In-process load test for the API")
+    parser.add_argument("--gyms", type=int, default=20)
+    parser.add_argument("--members", type=int, default=500, help="Average members per gym")
+    parser.add_argument("--skew", type=float, default=0.5, help="Log-normal sigma for gym sizes (0 = equal)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--duration", type=float, default=30, help="Seconds to run the mix")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--mix", choices=sorted(MIXES), default="steady")
+    parser.add_argument("--mongo-url", default=os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    parser.add_argument("--db-name", default="gym_saas_bench")
+    parser.add_argument("--keep", action="store_true", help="Keep the seeded database afterwards")
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    parser.add_argument("--compare", help="Previous results JSON to diff against")
+    args = parser.parse_args()
+
+    # Configure the app before it is imported
+    os.environ["MONGO_URL"] = args.mongo_url
+    os.environ["DB_NAME"] = args.db_name
+    os.environ.setdefault("SCHEDULER_ENABLED", "false")
+
+    result = asyncio.run(main_async(args))
+
+    print(f"\n{'endpoint':<22}{'reqs':>8}{'err':>6}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}")
+    rows = list(result["results"]["endpoints"].items()) + [("TOTAL", result["results"]["total"])]
+    for endpoint, stats in rows:
+        print(
+            f"{endpoint:<22}{stats['requests']:>8}{stats['errors']:>6}{stats['rps']:>9}"
+            f"{stats['p50_ms']:>9}{stats['p95_ms']:>9}{stats['p99_ms']:>9}"
+        )
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+    if args.compare:
+        compare(result, args.compare)
+
+
+if __name__ == "__main__":
+    main()
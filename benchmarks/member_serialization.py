@@ -0,0 +1,95 @@
+"""
+CPU cost of serializing a gym's member list
+Compares the default response path of GET /api/gym/{gym_id}/members
+(MemberResponse per document, then FastAPI's response validation,
+jsonable_encoder and json.dumps) with the fast=true path (projected
+documents straight to orjson). No database is involved.
+
+Usage:
+  python benchmarks/member_serialization.py [--members 10000] [--repeat 20] [--output results.json]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from typing import List
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend")
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import orjson  # noqa: E402
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from pydantic import TypeAdapter  # noqa: E402
+
+from seed_data import generate_member, generate_owner, GYM_NAMES  # noqa: E402
+from server import MEMBER_RESPONSE_PROJECTION, MemberResponse  # noqa: E402
+
+
+def default_path(documents, adapter):
+    # Handler builds models; FastAPI dumps, re-validates against response_model,
+    # serializes for JSON and renders with json.dumps
+    models = [MemberResponse(**document) for document in documents]
+    content = [model.model_dump() for model in models]
+    validated = adapter.validate_python(content)
+    encoded = jsonable_encoder(adapter.dump_python(validated, mode="json"))
+    return json.dumps(encoded, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+def fast_path(documents, _adapter):
+    return orjson.dumps(documents)
+
+
+def cpu_seconds(func, documents, adapter, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.process_time()
+        func(documents, adapter)
+        best = min(best, time.process_time() - started)
+    return best
+
+
+def main():
+    import random
+
+    parser = argparse.ArgumentParser(description="Member list serialization benchmark")
+    parser.add_argument("--members", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    now = datetime.utcnow()
+    owner = generate_owner(0, rng, {name: "" for name in GYM_NAMES}, now)
+    stored = [generate_member(owner, 0, i, rng, now) for i in range(args.members)]
+    # The default path reads whole documents; the fast path reads the projection
+    projected = [{key: doc[key] for key in MEMBER_RESPONSE_PROJECTION if key in doc} for doc in stored]
+    adapter = TypeAdapter(List[MemberResponse])
+
+    # Both paths must produce the same JSON
+    assert json.loads(default_path(stored, adapter)) == json.loads(fast_path(projected, adapter))
+
+    before = cpu_seconds(default_path, stored, adapter, args.repeat)
+    after = cpu_seconds(fast_path, projected, adapter, args.repeat)
+    per_10k = 10000 / args.members
+
+    result = {
+        "benchmark": "member_serialization",
+        "timestamp": now.isoformat(),
+        "members": args.members,
+        "default_cpu_ms_per_10k": round(before * per_10k * 1000, 2),
+        "fast_cpu_ms_per_10k": round(after * per_10k * 1000, 2),
+        "speedup": round(before / after, 1) if after else None,
+        "payload_bytes": len(fast_path(projected, adapter)),
+    }
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Overhead of the metrics middleware
+Drives a no-op ASGI app directly (no network, no server) with and without
+MetricsMiddleware and reports the added cost per request.
+
+Usage:
+  python benchmarks/metrics_overhead.py [--requests 200000] [--output results.json]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+from metrics import REGISTRY, MetricsMiddleware  # noqa: E402
+
+
+class _Route:
+    path = "/api/gym/{gym_id}/members"
+
+
+async def noop_app(scope, receive, send):
+    # Mimics the router recording the matched route
+    scope["route"] = _Route
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"[]"})
+
+
+async def receive():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+async def send(message):
+    pass
+
+
+async def drive(app, requests: int) -> float:
+    started = time.perf_counter()
+    for _ in range(requests):
+        scope = {"type": "http", "method": "GET", "path": "/api/gym/abc/members"}
+        await app(scope, receive, send)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure metrics middleware overhead")
+    parser.add_argument("--requests", type=int, default=200000)
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    baseline = asyncio.run(drive(noop_app, args.requests))
+    instrumented = asyncio.run(drive(MetricsMiddleware(noop_app), args.requests))
+
+    render_started = time.perf_counter()
+    exposition = REGISTRY.render()
+    render_ms = (time.perf_counter() - render_started) * 1000
+
+    overhead_us = (instrumented - baseline) / args.requests * 1e6
+    result = {
+        "benchmark": "metrics_overhead",
+        "timestamp": datetime.utcnow().isoformat(),
+        "requests": args.requests,
+        "baseline_us_per_request": round(baseline / args.requests * 1e6, 3),
+        "instrumented_us_per_request": round(instrumented / args.requests * 1e6, 3),
+        "overhead_us_per_request": round(overhead_us, 3),
+        "render_ms": round(render_ms, 3),
+        "exposition_bytes": len(exposition),
+    }
+
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Monthly reminder generation: Python loop vs aggregation pipeline
+Seeds gyms and members into a throwaway database on a local mongod (see
+seed_data.py), then queues the current month's reminders with the
+per-member loop and with the $unionWith/$lookup/$merge pipeline, checks
+both produce the same queue and times each. The pipeline is run a second
+time to confirm a rerun adds nothing.
+
+Usage:
+  python benchmarks/reminder_generation.py --gyms 200 --members 500 [--repeat 3] [--output results.json]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend")
+sys.path.insert(0, BACKEND_DIR)
+
+from seed_data import seed_async  # noqa: E402
+
+
+async def queued_reminders(db, period: str):
+    cursor = db.notification_queue.find(
+        {"type": "monthly_reminder", "month": period}, {"template": 1, "params": 1, "sender_number": 1}
+    )
+    return {doc.pop("_id"): doc async for doc in cursor}
+
+
+async def timed(db, period: str, generate, repeat: int):
+    """Best wall time of `generate` starting from an empty month each time"""
+    best = float("inf")
+    added = 0
+    for _ in range(repeat):
+        await db.notification_queue.delete_many({"type": "monthly_reminder", "month": period})
+        started = time.perf_counter()
+        added = await generate()
+        best = min(best, time.perf_counter() - started)
+    return best, added
+
+
+async def main_async(args):
+    from billing import current_period
+    from database import database
+    from whatsapp_automation import ensure_indexes, whatsapp_automation
+
+    db = database.get_db()
+    await database.client.drop_database(args.db_name)
+    print(f"Seeding {args.gyms} gyms x {args.members} members into {args.db_name}...")
+    await seed_async(db, args.gyms, args.members, skew=args.skew, seed=args.seed)
+
+    await ensure_indexes(db)
+    period = current_period()
+    loop_seconds, loop_added = await timed(db, period, whatsapp_automation.generate_monthly_reminders_loop, args.repeat)
+    loop_reminders = await queued_reminders(db, period)
+
+    pipeline_seconds, pipeline_added = await timed(
+        db, period, whatsapp_automation.generate_monthly_reminders_pipeline, args.repeat
+    )
+    pipeline_reminders = await queued_reminders(db, period)
+    assert loop_added == pipeline_added, (loop_added, pipeline_added)
+    assert loop_reminders == pipeline_reminders, "loop and pipeline queued different reminders"
+
+    started = time.perf_counter()
+    rerun_added = await whatsapp_automation.generate_monthly_reminders_pipeline()
+    rerun_seconds = time.perf_counter() - started
+    assert rerun_added == 0, rerun_added
+
+    if not args.keep:
+        await database.client.drop_database(args.db_name)
+    database.close()
+
+    return {
+        "benchmark": "reminder_generation",
+        "timestamp": datetime.utcnow().isoformat(),
+        "gyms": args.gyms,
+        "members_per_gym": args.members,
+        "reminders": pipeline_added,
+        "python_loop_ms": round(loop_seconds * 1000, 1),
+        "pipeline_ms": round(pipeline_seconds * 1000, 1),
+        "pipeline_rerun_ms": round(rerun_seconds * 1000, 1),
+        "speedup": round(loop_seconds / pipeline_seconds, 1) if pipeline_seconds else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reminder generation benchmark: Python loop vs $merge pipeline")
+    parser.add_argument("--gyms", type=int, default=200)
+    parser.add_argument("--members", type=int, default=500, help="Average members per gym")
+    parser.add_argument("--skew", type=float, default=0.5, help="Log-normal sigma for gym sizes (0 = equal)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--mongo-url", default=os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    parser.add_argument("--db-name", default="gym_saas_reminder_bench")
+    parser.add_argument("--keep", action="store_true", help="Keep the seeded database afterwards")
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    # Configure the backend before it is imported
+    os.environ["MONGO_URL"] = args.mongo_url
+    os.environ["DB_NAME"] = args.db_name
+
+    result = asyncio.run(main_async(args))
+    print(json.dumps(result, indent=2))
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
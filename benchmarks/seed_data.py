@@ -0,0 +1,387 @@
+"""
+Synthetic data generator for scale testing
+Bulk-loads gym owners, members, payment sessions, payment orders and
+notification queue entries with realistic status distributions.
+
+Generation is deterministic for a given --seed. The CLI splits gyms across
+processes, each inserting with `insert_many` batches; `seed_async` does the
+same in-process on a motor database for the load test and profiling runs.
+
+Usage:
+  python benchmarks/seed_data.py --gyms 2000 --members 5000 --db-name gym_saas_scale --drop
+  python benchmarks/seed_data.py --gyms 10 --members 1000 --layout shared
+"""
+
+import argparse
+import asyncio
+import math
+import multiprocessing
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterator, List, Tuple
+
+SEED_DATE_OF_BIRTH = "1990-01-01"
+
+# Owner passwords are DOB + gym name; names repeat so only a few bcrypt hashes are needed
+GYM_NAMES = [
+    "Iron Paradise", "Muscle Factory", "Fit Nation", "Power House", "Gold Standard",
+    "Flex Zone", "Pulse Fitness", "Titan Gym", "Core Strength", "Anytime Fit",
+    "Beast Mode", "Urban Athletics", "Peak Performance", "Steel Works", "Body Forge",
+    "Spartan Fitness", "Evolve Gym", "Momentum", "Lift Lab", "Zenith Fitness",
+]
+FIRST_NAMES = ["Aarav", "Vivaan", "Aditya", "Diya", "Ananya", "Ishaan", "Kavya", "Rohan", "Priya", "Arjun",
+               "Sneha", "Rahul", "Meera", "Karan", "Pooja", "Vikram", "Neha", "Siddharth", "Riya", "Aman"]
+LAST_NAMES = ["Sharma", "Verma", "Patel", "Reddy", "Iyer", "Nair", "Gupta", "Singh", "Khan", "Das"]
+
+# Status distributions (value, weight)
+FEE_STATUS = [("paid", 60), ("unpaid", 40)]
+PAYMENT_METHOD = [("cash", 55), ("online", 45)]
+SESSION_STATUS = [("completed", 70), ("pending", 20), ("expired", 10)]
+ORDER_STATUS = [("completed", 80), ("created", 15), ("failed", 5)]
+NOTIFICATION_STATUS = [("pending", 50), ("sent", 40), ("failed", 10)]
+ACTIVE_RATIO = 0.92
+SESSION_RATIO = 0.02
+MANUAL_NOTIFICATION_RATIO = 0.05
+
+
+def choose(rng: random.Random, distribution: List[Tuple[str, int]]) -> str:
+    values, weights = zip(*distribution)
+    return rng.choices(values, weights)[0]
+
+
+def members_collection_name(gym_id: str) -> str:
+    return f"gym_{gym_id.replace('-', '_')}_members"
+
+
+def gym_id_for(index: int) -> str:
+    return f"seed-{index:07d}"
+
+
+def member_id_for(gym_id: str, member_index: int) -> str:
+    return f"{gym_id}-m{member_index:08d}"
+
+
+def member_phone_for(gym_index: int, member_index: int) -> str:
+    # Unique within a gym; occasionally shared across gyms like real members of several gyms
+    return str(6000000000 + (gym_index * 104729 + member_index) % 3999999999)
+
+
+def gym_member_counts(gyms: int, members: int, skew: float, seed: int) -> List[int]:
+    """Members per gym, log-normally skewed around `members` (skew=0 gives equal sizes)"""
+    if skew <= 0:
+        return [members] * gyms
+    rng = random.Random(seed)
+    raw = [rng.lognormvariate(0, skew) for _ in range(gyms)]
+    scale = members * gyms / sum(raw)
+    return [max(1, int(value * scale)) for value in raw]
+
+
+def password_hashes(rounds: int) -> Dict[str, str]:
+    """bcrypt hash per gym name, computed in parallel (bcrypt releases the GIL)"""
+    import bcrypt
+
+    def hash_name(name):
+        password = f"{SEED_DATE_OF_BIRTH}{name}".encode("utf-8")
+        return name, bcrypt.hashpw(password, bcrypt.gensalt(rounds=rounds)).decode("utf-8")
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        return dict(pool.map(hash_name, GYM_NAMES))
+
+
+def generate_owner(index: int, rng: random.Random, hashes: Dict[str, str], now: datetime) -> Dict:
+    gym_id = gym_id_for(index)
+    gym_name = GYM_NAMES[index % len(GYM_NAMES)]
+    phone = str(9000000000 + index)
+    return {
+        "id": gym_id,
+        "name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+        "phone": phone,
+        "gym_name": gym_name,
+        "address": f"{rng.randint(1, 999)} MG Road, Sector {rng.randint(1, 80)}",
+        "monthly_fee": float(rng.choice([800, 1000, 1200, 1500, 2000, 2500])),
+        "date_of_birth": SEED_DATE_OF_BIRTH,
+        "password_hash": hashes[gym_name],
+        "qr_code": "",
+        "member_registration_url": f"http://localhost:3000/register-member/{gym_id}",
+        "cash_verification_qr": "",
+        "whatsapp_sender_number": phone,
+        "billing_period": now.strftime("%Y-%m"),
+        "created_at": now - timedelta(days=rng.randint(30, 1000)),
+    }
+
+
+def generate_member(owner: Dict, gym_index: int, member_index: int, rng: random.Random, now: datetime) -> Dict:
+    joining_date = date.today() - timedelta(days=rng.randint(0, 3 * 365))
+    fee_status = choose(rng, FEE_STATUS)
+    return {
+        "id": member_id_for(owner["id"], member_index),
+        "name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+        "phone": member_phone_for(gym_index, member_index),
+        "joining_date": joining_date.isoformat(),
+        "fee_status": fee_status,
+        "current_month_fee": owner["monthly_fee"],
+        "payment_method": choose(rng, PAYMENT_METHOD) if fee_status == "paid" else None,
+        "is_active": rng.random() < ACTIVE_RATIO,
+        "billing_period": now.strftime("%Y-%m"),
+        "paid_period": now.strftime("%Y-%m") if fee_status == "paid" else None,
+        "created_at": datetime.combine(joining_date, datetime.min.time()),
+    }
+
+
+def generate_related(owner: Dict, member: Dict, rng: random.Random, now: datetime) -> Iterator[Tuple[str, Dict]]:
+    """Payment sessions, orders and notifications belonging to one member"""
+    current_month = now.strftime("%Y-%m")
+
+    if rng.random() < SESSION_RATIO:
+        status = choose(rng, SESSION_STATUS)
+        created_at = now - timedelta(minutes=rng.randint(0, 60 * 24 * 30))
+        yield "payment_sessions", {
+            "session_id": f"{member['id']}-s{rng.getrandbits(32):08x}",
+            "gym_id": owner["id"],
+            "member_id": member["id"],
+            "amount": member["current_month_fee"],
+            "status": status,
+            "expires_at": created_at.timestamp() + 1800,
+            "created_at": created_at,
+        }
+
+    if member["payment_method"] == "online" or (member["fee_status"] == "unpaid" and rng.random() < 0.05):
+        status = "completed" if member["payment_method"] == "online" else choose(rng, ORDER_STATUS[1:])
+        order = {
+            "order_id": f"order_{member['id']}_{rng.getrandbits(32):08x}",
+            "gym_id": owner["id"],
+            "member_id": member["id"],
+            "amount": int(member["current_month_fee"] * 100),
+            "currency": "INR",
+            "status": status,
+            "created_at": now - timedelta(days=rng.randint(0, 28)),
+        }
+        if status == "completed":
+            order["payment_id"] = f"pay_{rng.getrandbits(48):012x}"
+            order["verified_at"] = order["created_at"] + timedelta(minutes=rng.randint(1, 10))
+        yield "payment_orders", order
+
+    notifications = []
+    if member["fee_status"] == "unpaid" and member["is_active"]:
+        notifications.append(("monthly_reminder", 1))
+    if rng.random() < MANUAL_NOTIFICATION_RATIO:
+        notifications.append(("manual", 0))
+
+    for notification_type, priority in notifications:
+        status = choose(rng, NOTIFICATION_STATUS)
+        created_at = now - timedelta(minutes=rng.randint(0, 60 * 24 * 6))
+        notification = {
+            "id": f"{notification_type}_{owner['id']}_{member['id']}_{rng.getrandbits(32):08x}",
+            "gym_id": owner["id"],
+            "member_id": member["id"],
+            "phone": member["phone"],
+            "member_name": member["name"],
+            "gym_name": owner["gym_name"],
+            "sender_number": owner["whatsapp_sender_number"],
+            "message": f"Hi {member['name']}! This is a reminder from {owner['gym_name']}.",
+            "status": status,
+            "type": notification_type,
+            "created_at": created_at,
+            "priority": priority,
+        }
+        if notification_type == "monthly_reminder":
+            notification["month"] = current_month
+        if status == "sent":
+            notification["sent_at"] = created_at + timedelta(minutes=rng.randint(1, 600))
+        elif status == "failed":
+            notification["failed_at"] = created_at + timedelta(minutes=rng.randint(1, 600))
+            notification["error"] = "Seeded failure"
+        yield "notification_queue", notification
+
+
+def generate_gym(
+    gym_index: int,
+    member_count: int,
+    hashes: Dict[str, str],
+    seed: int,
+    layout: str,
+    batch_size: int,
+    now: datetime,
+) -> Iterator[Tuple[str, List[Dict]]]:
+    """Yield (collection, documents) batches for one gym"""
+    rng = random.Random(seed * 1000003 + gym_index)
+    owner = generate_owner(gym_index, rng, hashes, now)
+    yield "gym_owners", [owner]
+
+    members_collection = members_collection_name(owner["id"]) if layout == "per_gym" else "members"
+    buffers: Dict[str, List[Dict]] = {}
+
+    for member_index in range(member_count):
+        member = generate_member(owner, gym_index, member_index, rng, now)
+        if layout == "shared":
+            member["gym_id"] = owner["id"]
+        buffers.setdefault(members_collection, []).append(member)
+
+        for collection, doc in generate_related(owner, member, rng, now):
+            buffers.setdefault(collection, []).append(doc)
+
+        for collection, docs in list(buffers.items()):
+            if len(docs) >= batch_size:
+                yield collection, docs
+                buffers[collection] = []
+
+    for collection, docs in buffers.items():
+        if docs:
+            yield collection, docs
+
+
+def gym_summary(gym_index: int, member_count: int) -> Dict:
+    """What callers need to address a seeded gym without keeping its documents"""
+    gym_id = gym_id_for(gym_index)
+    gym_name = GYM_NAMES[gym_index % len(GYM_NAMES)]
+    return {
+        "id": gym_id,
+        "phone": str(9000000000 + gym_index),
+        "password": f"{SEED_DATE_OF_BIRTH}{gym_name}",
+        "member_count": member_count,
+    }
+
+
+def index_specs(layout: str, gym_ids: List[str]) -> List[Tuple[str, List, Dict]]:
+    """Indexes the application creates (member phone is unique per gym)"""
+    if layout == "shared":
+        return [("members", [("gym_id", 1), ("phone", 1)], {"unique": True})]
+    return [(members_collection_name(gym_id), [("phone", 1)], {"unique": True}) for gym_id in gym_ids]
+
+
+async def seed_async(
+    db,
+    gyms: int,
+    members: int,
+    skew: float = 0.5,
+    layout: str = "per_gym",
+    batch_size: int = 5000,
+    concurrency: int = 8,
+    seed: int = 42,
+    bcrypt_rounds: int = 12,
+) -> List[Dict]:
+    """Seed through a motor database handle; returns one summary per gym"""
+    counts = gym_member_counts(gyms, members, skew, seed)
+    hashes = await asyncio.to_thread(password_hashes, bcrypt_rounds)
+    now = datetime.utcnow()
+    semaphore = asyncio.Semaphore(concurrency)
+    pending = set()
+
+    async def insert(collection, docs):
+        try:
+            await db[collection].insert_many(docs, ordered=False)
+        finally:
+            semaphore.release()
+
+    for gym_index, member_count in enumerate(counts):
+        for collection, docs in generate_gym(gym_index, member_count, hashes, seed, layout, batch_size, now):
+            # Bound the number of batches in memory / in flight
+            await semaphore.acquire()
+            task = asyncio.create_task(insert(collection, docs))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+
+    if pending:
+        await asyncio.gather(*pending)
+
+    for collection, keys, options in index_specs(layout, [gym_id_for(i) for i in range(gyms)]):
+        await db[collection].create_index(keys, **options)
+
+    return [gym_summary(i, count) for i, count in enumerate(counts)]
+
+
+def _seed_gym_range(job) -> Dict[str, int]:
+    """Worker process: seed a contiguous range of gyms with a synchronous client"""
+    from pymongo import MongoClient
+
+    mongo_url, db_name, gym_range, counts, hashes, seed, layout, batch_size, now = job
+    client = MongoClient(mongo_url, w=1)
+    db = client[db_name]
+    inserted: Dict[str, int] = {}
+
+    for gym_index in gym_range:
+        for collection, docs in generate_gym(gym_index, counts[gym_index], hashes, seed, layout, batch_size, now):
+            db[collection].insert_many(docs, ordered=False, bypass_document_validation=True)
+            # Report per-gym member collections together
+            key = "members" if collection.startswith("gym_") else collection
+            inserted[key] = inserted.get(key, 0) + len(docs)
+
+    client.close()
+    return inserted
+
+
+def seed_parallel(
+    mongo_url: str,
+    db_name: str,
+    gyms: int,
+    members: int,
+    skew: float,
+    layout: str,
+    batch_size: int,
+    processes: int,
+    seed: int,
+    bcrypt_rounds: int,
+) -> Dict[str, int]:
+    """Seed with several processes; returns documents inserted per collection"""
+    from pymongo import MongoClient
+
+    counts = gym_member_counts(gyms, members, skew, seed)
+    hashes = password_hashes(bcrypt_rounds)
+    now = datetime.utcnow()
+
+    # Interleave gyms so skewed sizes spread evenly over processes
+    ranges = [range(start, gyms, processes) for start in range(min(processes, gyms))]
+    jobs = [(mongo_url, db_name, gym_range, counts, hashes, seed, layout, batch_size, now) for gym_range in ranges]
+
+    totals: Dict[str, int] = {}
+    with multiprocessing.Pool(len(jobs)) as pool:
+        for inserted in pool.imap_unordered(_seed_gym_range, jobs):
+            for collection, count in inserted.items():
+                totals[collection] = totals.get(collection, 0) + count
+
+    client = MongoClient(mongo_url)
+    for collection, keys, options in index_specs(layout, [gym_id_for(i) for i in range(gyms)]):
+        client[db_name][collection].create_index(keys, **options)
+    client.close()
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-load synthetic gyms, members and queues")
+    parser.add_argument("--gyms", type=int, default=100)
+    parser.add_argument("--members", type=int, default=1000, help="Average members per gym")
+    parser.add_argument("--skew", type=float, default=0.5, help="Log-normal sigma for gym sizes (0 = equal)")
+    parser.add_argument("--layout", choices=["per_gym", "shared"], default="per_gym",
+                        help="Members in per-gym collections (as the API does) or one shared collection")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 4)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--bcrypt-rounds", type=int, default=12)
+    parser.add_argument("--mongo-url", default=os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    parser.add_argument("--db-name", default=os.environ.get("DB_NAME", "gym_saas_scale"))
+    parser.add_argument("--drop", action="store_true", help="Drop the database first")
+    args = parser.parse_args()
+
+    if args.drop:
+        from pymongo import MongoClient
+
+        MongoClient(args.mongo_url).drop_database(args.db_name)
+
+    started = time.perf_counter()
+    totals = seed_parallel(
+        args.mongo_url, args.db_name, args.gyms, args.members, args.skew, args.layout,
+        args.batch_size, args.processes, args.seed, args.bcrypt_rounds,
+    )
+    elapsed = time.perf_counter() - started
+
+    total_docs = sum(totals.values())
+    print(f"Seeded {args.db_name} in {elapsed:.1f}s ({math.floor(total_docs / elapsed):,} docs/s):")
+    for collection, count in sorted(totals.items()):
+        print(f"  {collection:<20} {count:>12,}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+from datetime import date, timedelta
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pd = pytest.importorskip("pandas")
+
+from analytics import MEMBER_COLUMNS, compute_gym_analytics, prorated_fees  # noqa: E402
+from billing import calculate_prorated_fee  # noqa: E402
+
+
+def test_prorated_fees_match_calculate_prorated_fee():
+    days = [date(2024, 2, 1) + timedelta(days=i) for i in range(400)]
+    vectorized = prorated_fees(1234.0, np.array(days, dtype="datetime64[D]"))
+    expected = [calculate_prorated_fee(1234.0, day) for day in days]
+    assert np.allclose(vectorized, expected, atol=0.01)
+
+
+def test_overdue_aging_and_revenue():
+    members = [
+        # Paid this month
+        {"id": "a", "joining_date": "2025-01-10", "is_active": True, "fee_status": "paid",
+         "current_month_fee": 1000.0, "billing_period": "2026-10", "paid_period": "2026-10"},
+        # Last paid in August: September and October outstanding
+        {"id": "b", "joining_date": "2025-01-10", "is_active": True, "fee_status": "unpaid",
+         "current_month_fee": 1000.0, "billing_period": "2026-10", "paid_period": "2026-08"},
+        # Joined mid-month and not paid yet
+        {"id": "c", "joining_date": "2026-10-16", "is_active": True, "fee_status": "unpaid",
+         "current_month_fee": 516.13, "billing_period": "2026-10", "paid_period": None},
+        # Inactive members are ignored
+        {"id": "d", "joining_date": "2024-01-01", "is_active": False, "fee_status": "unpaid",
+         "current_month_fee": 1000.0, "billing_period": "2026-09", "paid_period": "2024-03"},
+    ]
+    frame = pd.DataFrame.from_records(members, columns=MEMBER_COLUMNS)
+    report = compute_gym_analytics(frame, 1000.0, "2026-10", date(2026, 10, 19))
+
+    assert report["members"] == {"total": 4, "active": 3, "paid": 1, "unpaid": 2}
+    assert report["revenue"]["expected"] == 2516.13
+    assert report["revenue"]["collected"] == 1000.0
+    assert report["proration"] == {"mid_month_joiners": 1, "prorated_amount": 516.13, "full_fee_amount": 1000.0}
+    aging = {bucket["bucket"]: (bucket["members"], bucket["amount"]) for bucket in report["overdue_aging"]}
+    assert aging["0-30"] == (1, 516.13)
+    assert aging["31-60"] == (1, 2000.0)
+
+
+def test_members_migrated_while_unpaid_age_from_the_migration_month():
+    members = [
+        # Joined years ago, unpaid at the billing-period cut-over in September, since rolled over
+        {"id": "a", "joining_date": "2022-05-01", "is_active": True, "fee_status": "unpaid",
+         "current_month_fee": 1000.0, "billing_period": "2026-10", "paid_period": None,
+         "unpaid_since": "2026-09"},
+    ]
+    frame = pd.DataFrame.from_records(members, columns=MEMBER_COLUMNS)
+    report = compute_gym_analytics(frame, 1000.0, "2026-10", date(2026, 10, 19))
+
+    aging = {bucket["bucket"]: (bucket["members"], bucket["amount"]) for bucket in report["overdue_aging"]}
+    # September and October, not every month since 2022
+    assert aging["31-60"] == (1, 2000.0)
+    assert aging["90+"] == (0, 0.0)
+
+
+def test_members_who_never_paid_age_from_joining_across_rollovers():
+    members = [
+        # Joined in August, never paid, rolled over in September and October
+        {"id": "a", "joining_date": "2026-08-05", "is_active": True, "fee_status": "unpaid",
+         "current_month_fee": 1000.0, "billing_period": "2026-10", "paid_period": None},
+    ]
+    frame = pd.DataFrame.from_records(members, columns=MEMBER_COLUMNS)
+    report = compute_gym_analytics(frame, 1000.0, "2026-10", date(2026, 10, 19))
+
+    aging = {bucket["bucket"]: (bucket["members"], bucket["amount"]) for bucket in report["overdue_aging"]}
+    # August, September and October
+    assert aging["61-90"] == (1, 3000.0)
+    assert aging["0-30"] == (0, 0.0)
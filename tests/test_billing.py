@@ -0,0 +1,75 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from billing import fee_due, member_for_period, roll_over_gym, rollover_fields, shift_period, unpaid_filter
+
+GYM = {"id": "g1", "monthly_fee": 1000.0}
+
+
+def test_member_paid_for_the_period_is_not_reset():
+    member = {"billing_period": "2026-09", "paid_period": "2026-10", "current_month_fee": 1000.0}
+    assert rollover_fields(member, GYM["monthly_fee"], "2026-10") == {"billing_period": "2026-10"}
+
+
+def test_stale_member_rolls_over_to_unpaid_full_fee():
+    member = {"billing_period": "2026-09", "paid_period": "2026-09", "current_month_fee": 450.0}
+    fields = rollover_fields(member, GYM["monthly_fee"], "2026-10")
+    assert fields["fee_status"] == "unpaid"
+    assert fields["payment_method"] is None
+    assert fields["current_month_fee"] == 1000.0
+    assert fields["billing_period"] == "2026-10"
+
+
+def test_current_member_needs_no_rollover():
+    member = {"billing_period": "2026-10", "paid_period": None, "current_month_fee": 450.0}
+    assert rollover_fields(member, GYM["monthly_fee"], "2026-10") == {}
+
+
+def test_fee_due_uses_monthly_fee_until_rolled_over():
+    prorated = {"billing_period": "2026-09", "current_month_fee": 450.0}
+    assert fee_due(prorated, GYM, "2026-09") == 450.0
+    assert fee_due(prorated, GYM, "2026-10") == 1000.0
+
+
+def test_unpaid_filter_derives_status_from_paid_period():
+    query = unpaid_filter("2026-10")
+    assert query["is_active"] is True
+    assert {"billing_period": {"$exists": True}, "paid_period": {"$ne": "2026-10"}} in query["$or"]
+
+
+def test_shift_period_crosses_year_boundaries():
+    assert shift_period("2026-01", -1) == "2025-12"
+    assert shift_period("2026-11", 3) == "2027-02"
+    assert shift_period("2026-10", -12) == "2025-10"
+
+
+def test_legacy_member_unpaid_at_migration_records_when_arrears_start():
+    member = {"fee_status": "unpaid", "current_month_fee": 1000.0, "month_reset_at": datetime(2026, 8, 1, 2, 0)}
+    assert rollover_fields(member, GYM["monthly_fee"], "2026-10")["unpaid_since"] == "2026-08"
+    assert "unpaid_since" not in rollover_fields({**member, "fee_status": "paid"}, GYM["monthly_fee"], "2026-10")
+
+
+def test_members_read_in_the_new_period_before_the_rollover_reaches_them():
+    member = {"billing_period": "2026-09", "paid_period": "2026-09", "fee_status": "paid",
+              "payment_method": "cash", "current_month_fee": 450.0}
+    current = member_for_period(member, GYM["monthly_fee"], "2026-10")
+    assert (current["fee_status"], current["current_month_fee"], current["payment_method"]) == ("unpaid", 1000.0, None)
+    assert member_for_period({**member, "billing_period": "2026-10"}, GYM["monthly_fee"], "2026-10")["fee_status"] == "paid"
+
+
+def test_only_the_first_caller_rolls_a_gym_over():
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+
+    async def scenario():
+        db = mongomock_motor.AsyncMongoMockClient()["gym_saas_test"]
+        await db.gym_owners.insert_one({"id": "g1", "monthly_fee": 1000.0, "billing_period": "2026-09"})
+        await db.gym_g1_members.insert_one(
+            {"id": "m1", "is_active": True, "billing_period": "2026-09", "paid_period": "2026-09", "current_month_fee": 450.0}
+        )
+        # Both callers hold the owner as it was cached before the month changed
+        stale = await db.gym_owners.find_one({"id": "g1"})
+        return await roll_over_gym(db, stale, "2026-10"), await roll_over_gym(db, stale, "2026-10")
+
+    assert asyncio.run(scenario()) == (1, None)
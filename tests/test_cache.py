@@ -0,0 +1,130 @@
+import asyncio
+import time
+from datetime import date, datetime
+
+import pytest
+
+from cache import Cache, LocalCache, decode, encode, gym_key
+
+
+def test_local_cache_evicts_least_recently_used():
+    local = LocalCache(max_entries=2)
+    local.set("a", 1, ttl=60)
+    local.set("b", 2, ttl=60)
+    assert local.get("a") == 1
+    local.set("c", 3, ttl=60)
+    assert local.get("b", None) is None
+    assert local.get("a") == 1 and local.get("c") == 3
+
+
+def test_local_cache_expires_entries():
+    local = LocalCache()
+    local.set("a", 1, ttl=0)
+    assert local.get("a", None) is None
+    assert len(local) == 0
+
+
+def test_shared_tier_values_round_trip_as_json():
+    owner = {"id": "g1", "created_at": datetime(2026, 10, 1, 4, 30, 15, 120000), "as_of": date(2026, 10, 19),
+             "senders": ["9000000001"], "fee": 1000.5, "timezone": None}
+    raw = encode(owner)
+    assert raw.startswith(b"{")
+    assert decode(raw) == owner
+
+
+def test_local_only_entries_are_capped_unless_nothing_invalidates_them():
+    async def scenario():
+        cache = Cache(backend="local", default_ttl=300, local_ttl=30)
+        await cache.set("gym:g1:owner", {"id": "g1"})
+        await cache.set("gym:g1:analytics", {"members": 3}, ttl=3600, invalidated=False)
+        return {key: expires_at - time.monotonic() for key, (expires_at, _) in cache.local._entries.items()}
+
+    remaining = asyncio.run(scenario())
+    assert remaining["gym:g1:owner"] <= 30
+    assert remaining["gym:g1:analytics"] > 3000
+
+
+def test_invalidate_gym_drops_only_that_gyms_keys():
+    async def scenario():
+        cache = Cache(backend="local")
+        await cache.set(gym_key("g1", "owner"), {"id": "g1"})
+        await cache.set(gym_key("g1", "stats"), {"members": 3})
+        await cache.set(gym_key("g10", "owner"), {"id": "g10"})
+        await cache.invalidate_gym("g1")
+        return [await cache.get(gym_key(g, name)) for g, name in (("g1", "owner"), ("g1", "stats"), ("g10", "owner"))]
+
+    assert asyncio.run(scenario()) == [None, None, {"id": "g10"}]
+
+
+def test_concurrent_misses_run_loader_once():
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"id": "g1"}
+
+    async def scenario():
+        cache = Cache(backend="local")
+        return await asyncio.gather(*(cache.get_or_load("gym:g1:owner", loader) for _ in range(20)))
+
+    results = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert all(result == {"id": "g1"} for result in results)
+
+
+def test_missing_records_are_not_cached():
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        return None
+
+    async def scenario():
+        cache = Cache(backend="local")
+        await cache.get_or_load("gym:missing:owner", loader)
+        await cache.get_or_load("gym:missing:owner", loader)
+
+    asyncio.run(scenario())
+    assert len(calls) == 2
+
+
+def test_loader_errors_reach_every_waiter():
+    async def loader():
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    async def scenario():
+        cache = Cache(backend="local")
+        return await asyncio.gather(
+            *(cache.get_or_load("gym:g1:owner", loader) for _ in range(3)), return_exceptions=True
+        )
+
+    assert all(isinstance(result, ValueError) for result in asyncio.run(scenario()))
+
+
+def test_redis_invalidation_reaches_other_workers():
+    fakeredis = pytest.importorskip("fakeredis")
+
+    async def scenario():
+        server = fakeredis.FakeServer()
+        worker_a, worker_b = Cache(backend="redis"), Cache(backend="redis")
+        await worker_a.start(fakeredis.FakeAsyncRedis(server=server))
+        await worker_b.start(fakeredis.FakeAsyncRedis(server=server))
+        try:
+            key = gym_key("g1", "owner")
+            await worker_a.set(key, {"id": "g1", "version": 1})
+            # Worker B reads through the shared tier into its local LRU
+            assert await worker_b.get(key) == {"id": "g1", "version": 1}
+
+            await worker_a.invalidate(key)
+            for _ in range(50):
+                if worker_b.local.get(key, None) is None:
+                    break
+                await asyncio.sleep(0.01)
+            return await worker_b.get(key)
+        finally:
+            await worker_a.close()
+            await worker_b.close()
+
+    assert asyncio.run(scenario()) is None
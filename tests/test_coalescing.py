@@ -0,0 +1,90 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from coalescing import coalesce, coalesce_report, find_covering
+
+NOW = datetime(2024, 5, 2, 9, 0)
+
+
+def manual(notification_id, gym_id="g1", phone="9876543210", minutes=0, message=None, priority=0):
+    notification = {
+        "id": notification_id, "gym_id": gym_id, "phone": phone, "type": "manual",
+        "created_at": NOW + timedelta(minutes=minutes), "priority": priority,
+    }
+    if message:
+        notification["message"] = message
+    else:
+        notification["template"] = "manual"
+    return notification
+
+
+def reminder(notification_id, gym_id="g1", phone="9876543210", minutes=0):
+    return {
+        "id": notification_id, "gym_id": gym_id, "phone": phone, "type": "monthly_reminder",
+        "template": "monthly_reminder", "month": "2024-05", "params": {"amount": "1000"},
+        "created_at": NOW + timedelta(minutes=minutes), "priority": 1,
+    }
+
+
+def test_repeated_manual_sends_within_the_window_go_out_once():
+    queued = [manual("n1"), manual("n2", minutes=5), manual("n3", minutes=60 * 30)]
+    merges, priorities = coalesce(queued, timedelta(hours=24))
+
+    assert merges == [{"id": "n2", "into": "n1", "reason": "duplicate"}]
+    assert priorities == {}
+
+
+def test_custom_messages_only_merge_with_the_same_text():
+    queued = [manual("n1", message="Gym closed Sunday"), manual("n2", message="Gym closed Sunday", minutes=1),
+              manual("n3", message="New batch timings")]
+    merges, _ = coalesce(queued)
+
+    assert [merge["id"] for merge in merges] == ["n2"]
+
+
+def test_generic_manual_reminder_is_covered_by_the_pending_monthly_reminder():
+    queued = [manual("n1", priority=5), reminder("r1", minutes=10), manual("n2", message="Bring your ID")]
+    merges, priorities = coalesce(queued)
+
+    assert merges == [{"id": "n1", "into": "r1", "reason": "covered_by_reminder"}]
+    # The reminder inherits the urgency of what it replaced
+    assert priorities == {"r1": 5}
+
+
+def test_reminders_from_different_gyms_are_kept():
+    queued = [reminder("r1", gym_id="g1"), reminder("r2", gym_id="g2"), manual("n1", gym_id="g2", minutes=1)]
+    merges, _ = coalesce(queued)
+    report = coalesce_report(queued, merges)
+
+    assert merges == [{"id": "n1", "into": "r2", "reason": "covered_by_reminder"}]
+    assert report == {
+        "budget_saved": 1,
+        "by_reason": {"covered_by_reminder": 1},
+        "gyms": {"g2": 1},
+    }
+
+
+def test_enqueue_finds_the_pending_notification_that_covers_a_new_one():
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+
+    async def scenario():
+        db = mongomock_motor.AsyncMongoMockClient()["gym_saas_test"]
+        await db.notification_queue.insert_many([
+            {**reminder("r1"), "status": "pending"},
+            {**manual("n1", gym_id="g2", message="Hi"), "status": "pending"},
+            {**manual("n2", gym_id="g2", message="Hello"), "status": "sent"},
+        ])
+        return (
+            await find_covering(db, manual("new1", minutes=30), now=NOW),
+            await find_covering(db, manual("new2", gym_id="g2", message="Hi"), now=NOW),
+            await find_covering(db, manual("new3", gym_id="g2", message="Hello"), now=NOW),
+            await find_covering(db, manual("new4", gym_id="g2", message="Hi"), now=NOW + timedelta(days=2)),
+        )
+
+    by_reminder, same_text, already_sent, expired = asyncio.run(scenario())
+    assert by_reminder["id"] == "r1"
+    assert same_text["id"] == "n1"
+    assert already_sent is None
+    assert expired is None
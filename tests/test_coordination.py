@@ -0,0 +1,60 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from coordination import LeaseLock, LeaseLost, run_exclusive
+
+
+def test_a_job_whose_lease_is_taken_over_is_cancelled_and_not_recorded():
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+
+    async def scenario():
+        db = mongomock_motor.AsyncMongoMockClient()["gym_saas_test"]
+        finished = []
+
+        async def job():
+            # Another replica takes the lease while the job is still running
+            await db.leases.update_one({"_id": "monthly"}, {"$set": {"owner": "other"}, "$inc": {"token": 1}})
+            await asyncio.sleep(1)
+            finished.append(True)
+
+        with pytest.raises(LeaseLost):
+            await run_exclusive(db, "monthly", job, run_key="2024-05", ttl_seconds=0.15)
+        return finished, await db.job_runs.count_documents({}), await db.leases.find_one({"_id": "monthly"})
+
+    finished, runs, lease = asyncio.run(scenario())
+    assert finished == []
+    assert runs == 0
+    # The new holder's lease is left alone
+    assert lease["owner"] == "other"
+
+
+def test_locks_in_the_same_process_exclude_each_other():
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+
+    async def scenario():
+        db = mongomock_motor.AsyncMongoMockClient()["gym_saas_test"]
+        scheduled = LeaseLock(db, "job:reset")
+        manual = LeaseLock(db, "job:reset")
+        return await scheduled.acquire(), await manual.acquire(), await scheduled.renew()
+
+    assert asyncio.run(scenario()) == (True, False, True)
+
+
+def test_a_stale_holder_can_neither_renew_nor_release_the_new_lease():
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+
+    async def scenario():
+        db = mongomock_motor.AsyncMongoMockClient()["gym_saas_test"]
+        stale = LeaseLock(db, "scheduler", ttl_seconds=60)
+        current = LeaseLock(db, "scheduler", ttl_seconds=60)
+        await stale.acquire()
+        # The stale holder's lease expires and is taken over
+        await db.leases.update_one({"_id": "scheduler"}, {"$set": {"expires_at": datetime(2000, 1, 1)}})
+        acquired = await current.acquire()
+        renewed = await stale.renew()
+        await stale.release()
+        return acquired, renewed, await current.is_held()
+
+    assert asyncio.run(scenario()) == (True, False, True)
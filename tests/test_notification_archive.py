@@ -0,0 +1,67 @@
+import asyncio
+from datetime import datetime, time, timedelta
+
+import pytest
+
+from billing import current_period
+from notification_archive import archive_collection_names, archive_notifications, in_send_window
+
+# 02:00 in Asia/Kolkata, outside the default windows
+NOW = datetime(2024, 5, 1, 20, 30)
+NEVER = [(time(0, 0), time(0, 1))]
+
+
+def test_send_windows_are_checked_in_local_time():
+    windows = [(time(10, 0), time(13, 0))]
+    # 04:30 UTC is 10:00 in Asia/Kolkata
+    assert in_send_window(datetime(2024, 5, 2, 4, 30), windows)
+    assert not in_send_window(datetime(2024, 5, 2, 7, 30), windows)
+
+
+def test_partitions_cover_each_month_in_the_range():
+    assert archive_collection_names(datetime(2023, 12, 20), datetime(2024, 2, 1)) == [
+        "notification_archive_2023_12", "notification_archive_2024_01", "notification_archive_2024_02",
+    ]
+
+
+def test_completed_notifications_move_to_monthly_archives_in_batches():
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+
+    async def scenario():
+        db = mongomock_motor.AsyncMongoMockClient()["gym_saas_test"]
+        await db.notification_queue.insert_many([
+            {"_id": "a", "status": "sent", "created_at": datetime(2024, 4, 10)},
+            {"_id": "b", "status": "coalesced", "created_at": datetime(2024, 4, 28)},
+            {"_id": "c", "status": "suppressed", "created_at": datetime(2024, 3, 31)},
+            {"_id": "pending", "status": "pending", "created_at": datetime(2024, 3, 1)},
+            {"_id": "recent", "status": "sent", "created_at": NOW - timedelta(hours=1)},
+            # The month of `now`, not of the wall clock, keeps its reminders
+            {"_id": "reminder", "status": "sent", "type": "monthly_reminder", "month": "2024-05",
+             "created_at": datetime(2024, 4, 1)},
+            {"_id": "old_reminder", "status": "sent", "type": "monthly_reminder", "month": current_period(),
+             "created_at": datetime(2024, 4, 2)},
+        ])
+        await db.notification_archive_2022_01.insert_one({"_id": "old"})
+
+        during_window = await archive_notifications(db, now=NOW, pause_seconds=0, windows=[(time(0, 0), time(23, 59))])
+        capped = await archive_notifications(db, now=NOW, batch_size=2, max_documents=2, pause_seconds=0, windows=NEVER)
+        rest = await archive_notifications(db, now=NOW, batch_size=2, pause_seconds=0, windows=NEVER)
+        again = await archive_notifications(db, now=NOW, pause_seconds=0, windows=NEVER)
+
+        queue = sorted([n["_id"] async for n in db.notification_queue.find()])
+        april = sorted([n["_id"] async for n in db.notification_archive_2024_04.find()])
+        march = sorted([n["_id"] async for n in db.notification_archive_2024_03.find()])
+        return during_window, capped, rest, again, queue, april, march
+
+    during_window, capped, rest, again, queue, april, march = asyncio.run(scenario())
+
+    assert during_window["archived"] == 0 and during_window["stopped"] == "send_window"
+    # Dropping a whole partition is cheap, so it is not held back by the window
+    assert during_window["dropped_partitions"] == ["notification_archive_2022_01"]
+    assert capped["archived"] == 2 and capped["stopped"] == "max_documents"
+    assert capped["partitions"] == {"notification_archive_2024_03": 1, "notification_archive_2024_04": 1}
+    assert rest["archived"] == 2 and rest["stopped"] is None
+    assert again["archived"] == 0 and again["batches"] == 0
+    assert queue == ["pending", "recent", "reminder"]
+    assert april == ["a", "b", "old_reminder"]
+    assert march == ["c"]
@@ -0,0 +1,139 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+import notification_queue
+from notification_queue import ack_notifications, claimable_filter, rate_counter_ids, retry_delay, sent_counts
+
+
+def test_rate_counters_are_keyed_by_hour_and_day():
+    assert rate_counter_ids(datetime(2026, 10, 19, 9, 45)) == ("hour:2026-10-19T09", "day:2026-10-19")
+
+
+def test_batch_ack_reports_each_result_and_counts_sends_once():
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+
+    async def scenario():
+        db = mongomock_motor.AsyncMongoMockClient()["gym_saas_test"]
+        await db.notification_queue.insert_many([
+            {"id": "n1", "status": "pending"},
+            {"id": "n2", "status": "pending"},
+            {"id": "n3", "status": "sent"},
+        ])
+        response = await ack_notifications(db, [
+            {"id": "n1", "status": "sent", "sent_at": datetime.utcnow() + timedelta(hours=1)},
+            {"id": "n2", "status": "failed", "error": "Number not on WhatsApp"},
+            {"id": "n3", "status": "sent"},
+            {"id": "missing", "status": "sent"},
+        ])
+        n1 = await db.notification_queue.find_one({"id": "n1"})
+        n2 = await db.notification_queue.find_one({"id": "n2"})
+        return response, n1, n2, await sent_counts(db)
+
+    response, n1, n2, counts = asyncio.run(scenario())
+    assert [result["result"] for result in response["results"]] == ["sent", "retrying", "unchanged", "not_found"]
+    assert response["summary"] == {"sent": 1, "retrying": 1, "unchanged": 1, "not_found": 1}
+    assert n1["status"] == "sent" and n1["sent_at"] <= datetime.utcnow()
+    assert n2["status"] == "pending" and n2["attempts"] == 1 and n2["error"] == "Number not on WhatsApp"
+    assert n2["next_attempt_at"] > datetime.utcnow()
+    assert counts == (1, 1)
+
+
+def test_retry_delay_doubles_with_jitter_up_to_the_cap(monkeypatch):
+    monkeypatch.setattr(notification_queue, "NOTIFICATION_RETRY_BASE_SECONDS", 60)
+    monkeypatch.setattr(notification_queue, "NOTIFICATION_RETRY_MAX_SECONDS", 600)
+    for attempt, full in [(1, 60), (2, 120), (3, 240), (5, 600), (9, 600)]:
+        seconds = retry_delay(attempt).total_seconds()
+        assert full / 2 <= seconds <= full
+
+
+def test_failures_wait_for_their_retry_then_move_to_dead_letters(monkeypatch):
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    monkeypatch.setattr(notification_queue, "NOTIFICATION_MAX_ATTEMPTS", 2)
+
+    async def scenario():
+        db = mongomock_motor.AsyncMongoMockClient()["gym_saas_test"]
+        slot = datetime.utcnow() - timedelta(minutes=1)
+        await db.notification_queue.insert_many([
+            {"id": "n1", "gym_id": "g1", "status": "pending", "next_attempt_at": slot},
+            {"id": "n2", "gym_id": "g1", "status": "pending", "next_attempt_at": slot},
+            # Not paced yet
+            {"id": "n3", "gym_id": "g1", "status": "pending", "type": "monthly_reminder"},
+        ])
+        first = await ack_notifications(db, [{"id": "n1", "status": "failed", "error": "timeout"}])
+        claimable = [n["id"] async for n in db.notification_queue.find(claimable_filter())]
+        tomorrow = datetime.utcnow() + timedelta(days=1)
+        later = [n["id"] async for n in db.notification_queue.find(claimable_filter(tomorrow))]
+        second = await ack_notifications(db, [{"id": "n1", "status": "failed", "error": "timeout again"}])
+        return (
+            first, claimable, later, second,
+            await db.notification_queue.find_one({"id": "n1"}),
+            await db.notification_dead_letters.find_one({"id": "n1"}),
+        )
+
+    first, claimable, later, second, queued, dead = asyncio.run(scenario())
+    assert first["results"][0] == {"id": "n1", "result": "retrying", "attempts": 1}
+    assert claimable == ["n2"]
+    assert sorted(later) == ["n1", "n2"]
+    assert second["results"][0] == {"id": "n1", "result": "dead_lettered", "attempts": 2}
+    assert queued["status"] == "dead_lettered" and queued["attempts"] == 2
+    assert dead["status"] == "failed" and dead["attempts"] == 2 and dead["error"] == "timeout again"
+
+
+def test_one_off_notifications_are_claimable_without_a_send_slot():
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+
+    async def scenario():
+        db = mongomock_motor.AsyncMongoMockClient()["gym_saas_test"]
+        later = datetime.utcnow() + timedelta(hours=4)
+        await db.notification_queue.insert_many([
+            {"id": "manual", "gym_id": "g1", "status": "pending", "type": "manual"},
+            {"id": "reminder", "gym_id": "g1", "status": "pending", "type": "monthly_reminder"},
+            {"id": "retrying", "gym_id": "g1", "status": "pending", "type": "manual",
+             "retry_at": later, "next_attempt_at": later},
+        ])
+        return [n["id"] async for n in db.notification_queue.find(claimable_filter())]
+
+    assert asyncio.run(scenario()) == ["manual"]
+
+
+def test_dead_lettered_reminder_is_not_queued_again(monkeypatch):
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    from billing import current_period
+    from whatsapp_automation import WhatsAppAutomation
+
+    monkeypatch.setattr(notification_queue, "NOTIFICATION_MAX_ATTEMPTS", 1)
+
+    async def scenario():
+        db = mongomock_motor.AsyncMongoMockClient()["gym_saas_test"]
+        period = current_period()
+        await db.gym_owners.insert_one(
+            {"id": "g1", "gym_name": "Iron", "phone": "9000000000", "address": "Main St", "monthly_fee": 1000}
+        )
+        await db.gym_g1_members.insert_one({
+            "id": "m1", "name": "Asha", "phone": "9876543210", "is_active": True,
+            "billing_period": period, "paid_period": None, "current_month_fee": 1000,
+        })
+        automation = WhatsAppAutomation()
+        automation.db = automation.read_db = db
+
+        first = await automation.generate_monthly_reminders_loop()
+        queued = await db.notification_queue.find_one({})
+        dead = await ack_notifications(db, [{"id": queued["id"], "status": "failed", "error": "blocked"}])
+        rerun = await automation.generate_monthly_reminders_loop()
+        late_ack = await ack_notifications(db, [{"id": queued["id"], "status": "failed"}])
+        return (
+            first, dead, rerun, late_ack,
+            await db.notification_queue.find({}).to_list(length=None),
+            [n["id"] async for n in db.notification_queue.find(claimable_filter())],
+        )
+
+    first, dead, rerun, late_ack, queue, claimable = asyncio.run(scenario())
+    assert first == 1
+    assert dead["summary"] == {"dead_lettered": 1}
+    # The tombstone keeps the reminder's _id, so the next run adds nothing
+    assert rerun == 0
+    assert late_ack["summary"] == {"unchanged": 1}
+    assert len(queue) == 1 and queue[0]["status"] == "dead_lettered" and queue[0]["attempts"] == 1
+    assert claimable == []
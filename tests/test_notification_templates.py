@@ -0,0 +1,53 @@
+import asyncio
+
+import pytest
+
+from cache import cache, gym_key
+from notification_templates import DEFAULT_TEMPLATES, render, render_notification, validate_template
+
+
+def test_render_fills_fields_and_blanks_missing_ones():
+    assert render("Hi {member_name}, pay {amount} to {gym_name}", {"member_name": "Asha", "amount": "1500"}) == (
+        "Hi Asha, pay 1500 to "
+    )
+
+
+def test_override_may_only_use_the_default_templates_fields():
+    validate_template("monthly_reminder", "{member_name}: ₹{amount} due for {month}")
+    with pytest.raises(ValueError):
+        validate_template("monthly_reminder", "Hi {nickname}")
+    with pytest.raises(ValueError):
+        validate_template("monthly_reminder", "Due: {amount:>10}")
+    with pytest.raises(ValueError):
+        validate_template("birthday", "Happy birthday {member_name}")
+
+
+def test_notification_is_rendered_from_the_gyms_current_template():
+    notification = {
+        "_id": "monthly_reminder:g-tpl:m1:2026-10",
+        "gym_id": "g-tpl",
+        "member_name": "Asha",
+        "gym_name": "Iron Paradise",
+        "template": "monthly_reminder",
+        "params": {"month": "October 2026", "amount": "1500"},
+    }
+
+    async def scenario():
+        body = "{gym_name}: {member_name} owes ₹{amount} for {month}"
+        await cache.set(gym_key("g-tpl", "template", "monthly_reminder"), {"version": 3, "body": body})
+        return await render_notification(None, notification)
+
+    rendered = asyncio.run(scenario())
+    assert rendered["message"] == "Iron Paradise: Asha owes ₹1500 for October 2026"
+    assert rendered["template_version"] == 3
+    assert "_id" not in rendered and "params" not in rendered
+
+
+def test_notifications_without_a_template_keep_their_message():
+    rendered = asyncio.run(render_notification(None, {"gym_id": "g1", "message": "Custom text"}))
+    assert rendered["message"] == "Custom text"
+
+
+def test_default_templates_compile():
+    for template_id, body in DEFAULT_TEMPLATES.items():
+        validate_template(template_id, body)
@@ -0,0 +1,49 @@
+from datetime import datetime
+
+import pytest
+
+from scheduler import CronTrigger
+
+
+def test_monthly_reset_fires_on_first_in_local_time():
+    trigger = CronTrigger("0 1 1 * *", tz="Asia/Kolkata")
+    # 1:00 AM IST on Nov 1st is 19:30 UTC on Oct 31st
+    assert trigger.next_fire_time(datetime(2026, 10, 19, 12, 0)) == datetime(2026, 10, 31, 19, 30)
+
+
+def test_next_fire_time_is_strictly_after():
+    trigger = CronTrigger("0 10 * * *", tz="UTC")
+    assert trigger.next_fire_time(datetime(2026, 10, 19, 10, 0)) == datetime(2026, 10, 20, 10, 0)
+    assert trigger.next_fire_time(datetime(2026, 10, 19, 9, 59, 30)) == datetime(2026, 10, 19, 10, 0)
+
+
+def test_steps_ranges_and_weekdays():
+    trigger = CronTrigger("*/15 9-17 * * 1-5", tz="UTC")
+    # Saturday evening rolls over to Monday 09:00
+    assert trigger.next_fire_time(datetime(2026, 10, 17, 18, 0)) == datetime(2026, 10, 19, 9, 0)
+    assert trigger.next_fire_time(datetime(2026, 10, 19, 9, 1)) == datetime(2026, 10, 19, 9, 15)
+
+
+def test_day_of_month_or_weekday_when_both_restricted():
+    trigger = CronTrigger("0 0 1 * 0", tz="UTC")
+    # Sunday Oct 25th comes before Nov 1st
+    assert trigger.next_fire_time(datetime(2026, 10, 20, 0, 0)) == datetime(2026, 10, 25, 0, 0)
+
+
+def test_leap_day():
+    trigger = CronTrigger("0 0 29 2 *", tz="UTC")
+    assert trigger.next_fire_time(datetime(2026, 3, 1)) == datetime(2028, 2, 29)
+
+
+@pytest.mark.parametrize("expression", ["* * * *", "60 * * * *", "0 24 * * *", "5-1 * * * *"])
+def test_invalid_expressions(expression):
+    with pytest.raises(ValueError):
+        CronTrigger(expression)
+
+
+@pytest.mark.parametrize("weekdays, next_day", [("7", 25), ("0", 25), ("7/7", 25), ("5-7", 23)])
+def test_seven_is_sunday(weekdays, next_day):
+    trigger = CronTrigger(f"0 0 * * {weekdays}", tz="UTC")
+    assert 7 not in trigger.weekdays
+    # From Monday Oct 19th: Sunday is the 25th, Friday the 23rd
+    assert trigger.next_fire_time(datetime(2026, 10, 19, 12, 0)) == datetime(2026, 10, next_day, 0, 0)
@@ -0,0 +1,174 @@
+import asyncio
+from collections import Counter
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import pytest
+
+import send_pacing
+from notification_queue import claimable_filter, record_sent
+from send_pacing import pace_queue, parse_windows, plan_sender, plan_sends
+
+IST = ZoneInfo("Asia/Kolkata")
+WINDOWS = parse_windows("10:00-13:00,18:00-21:00")
+
+
+def queue(count, gym_id="g1", sender="9000000001", **fields):
+    created = datetime(2026, 11, 1, 4, 0)
+    return [
+        {"id": f"{gym_id}-n{i}", "gym_id": gym_id, "sender_number": sender, "priority": 1,
+         "created_at": created + timedelta(seconds=i), **fields}
+        for i in range(count)
+    ]
+
+
+def local(slot):
+    return slot.replace(tzinfo=ZoneInfo("UTC")).astimezone(IST)
+
+
+def test_sends_are_spread_over_the_local_windows_within_the_hourly_cap():
+    # 09:00 IST on Nov 1st: the whole day's windows are ahead
+    now = datetime(2026, 11, 1, 3, 30)
+    slots = plan_sender(queue(120), now, IST, WINDOWS, per_hour=40, per_day=250)
+
+    assert len(slots) == 120
+    times = sorted(local(slot) for slot in slots.values())
+    assert all((10 <= t.hour < 13) or (18 <= t.hour < 21) for t in times)
+    # Evenly spaced: 6 open hours / 120 sends = one every 3 minutes
+    gaps = {(b - a).total_seconds() for a, b in zip(times, times[1:]) if b.hour == a.hour}
+    assert gaps == {180.0}
+    per_hour = Counter(t.replace(minute=0, second=0) for t in times)
+    assert max(per_hour.values()) <= 40
+
+
+def test_a_simulated_day_never_bursts_past_the_hourly_cap():
+    now = datetime(2026, 11, 1, 3, 30)
+    slots = plan_sender(queue(600), now, IST, WINDOWS, per_hour=40, per_day=250)
+
+    # Step a simulated clock minute by minute, claiming whatever is due
+    clock, sent = now, []
+    remaining = dict(slots)
+    while remaining and clock < now + timedelta(days=4):
+        due = [nid for nid, slot in remaining.items() if slot <= clock]
+        for nid in due:
+            sent.append(clock)
+            del remaining[nid]
+        clock += timedelta(minutes=1)
+
+    per_hour = Counter(t.replace(minute=0, second=0) for t in sent)
+    per_day = Counter(local(t).date() for t in sent)
+    assert max(per_hour.values()) <= 40
+    assert max(per_day.values()) <= 240
+    assert len(sent) == 600
+
+
+def test_daily_budget_counts_messages_already_sent_and_rolls_over():
+    # 12:00 IST: one hour of the morning window and the evening window remain
+    now = datetime(2026, 11, 1, 6, 30)
+    slots = plan_sender(queue(200), now, IST, WINDOWS, per_hour=40, per_day=250, sent_today=200)
+
+    days = Counter(local(slot).date().isoformat() for slot in slots.values())
+    assert days["2026-11-01"] == 50
+    assert days["2026-11-02"] == 150
+
+
+def test_higher_priority_goes_first_and_retries_wait_for_their_time():
+    now = datetime(2026, 11, 1, 3, 30)
+    retry_at = datetime(2026, 11, 1, 13, 0)  # 18:30 IST
+    notifications = (
+        queue(3, priority=0)
+        + [{"id": "urgent", "gym_id": "g1", "sender_number": "9000000001", "priority": 5,
+            "created_at": datetime(2026, 11, 1, 5, 0)}]
+        + [{"id": "retry", "gym_id": "g1", "sender_number": "9000000001", "priority": 5,
+            "created_at": datetime(2026, 10, 30), "retry_at": retry_at}]
+    )
+    slots = plan_sender(notifications, now, IST, WINDOWS, per_hour=40, per_day=250)
+
+    assert min(slots, key=slots.get) == "urgent"
+    assert slots["retry"] >= retry_at
+
+
+def test_report_projects_completion_per_gym_in_its_own_timezone():
+    now = datetime(2026, 11, 1, 3, 30)
+    notifications = queue(10, gym_id="g1", sender="s1") + queue(10, gym_id="g2", sender="s2")
+    slots, report = plan_sends(
+        notifications, now, {"g1": "Asia/Kolkata", "g2": "Asia/Dubai"}, {}, WINDOWS, per_hour=40, per_day=250
+    )
+
+    assert len(slots) == 20
+    g1, g2 = report["gyms"]["g1"], report["gyms"]["g2"]
+    assert g1["pending"] == 10 and g1["unscheduled"] == 0
+    # 10:00 in Kolkata is 04:30 UTC, 10:00 in Dubai is 06:00 UTC
+    assert g1["first_send_at"] == "2026-11-01T04:30:00"
+    assert g2["first_send_at"] == "2026-11-01T06:00:00"
+    assert g1["projected_completion_at"] < g2["projected_completion_at"]
+
+
+def test_pacing_pages_gyms_uses_the_rate_counters_and_rewrites_only_moved_slots(monkeypatch):
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    monkeypatch.setattr(send_pacing, "SEND_PLAN_PAGE_GYMS", 1)
+    now = datetime(2026, 11, 1, 3, 30)  # 09:00 IST
+
+    async def scenario():
+        db = mongomock_motor.AsyncMongoMockClient()["gym_saas_test"]
+        await db.gym_owners.insert_many([
+            {"id": "g1", "phone": "9000000001", "timezone": "Asia/Kolkata"},
+            {"id": "g2", "phone": "9000000002", "timezone": "Asia/Kolkata"},
+        ])
+        queued = [
+            {**notification, "member_id": f"m{i}", "phone": f"98765432{i:02d}", "status": "pending",
+             "type": "monthly_reminder", "template": "monthly_reminder"}
+            for i, notification in enumerate(queue(3, gym_id="g1", sender="9000000001"))
+        ]
+        queued.append({**queue(1, gym_id="g2", sender="9000000002")[0], "member_id": "m0", "phone": "9876543200",
+                       "status": "pending",
+                       "type": "monthly_reminder", "template": "monthly_reminder"})
+        await db.notification_queue.insert_many(queued)
+        # 249 of the sender's 250 daily messages already went out (as counted by the rate limiter)
+        await record_sent(db, {"9000000001": 249}, now)
+
+        before = [n["id"] async for n in db.notification_queue.find(claimable_filter(now))]
+        first = await pace_queue(db, now=now)
+        second = await pace_queue(db, now=now)
+        slots = {n["id"]: n["next_attempt_at"] async for n in db.notification_queue.find()}
+        return before, first, second, slots
+
+    before, first, second, slots = asyncio.run(scenario())
+
+    # Nothing is claimable before pacing has given it a slot
+    assert before == []
+    assert first["updated"] == 4 and second["updated"] == 0
+    assert set(first["gyms"]) == {"g1", "g2"}
+    assert first["coalescing"]["phones_in_several_gyms"] == 1
+    days = Counter(local(slots[f"g1-n{i}"]).date().isoformat() for i in range(3))
+    assert days == {"2026-11-01": 1, "2026-11-02": 2}
+
+
+def test_one_off_sends_get_no_slot_but_use_the_senders_budget():
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    now = datetime(2026, 11, 1, 8, 30)  # 14:00 IST, between the windows
+
+    async def scenario():
+        db = mongomock_motor.AsyncMongoMockClient()["gym_saas_test"]
+        await db.gym_owners.insert_one({"id": "g1", "phone": "9000000001", "timezone": "Asia/Kolkata"})
+        await db.notification_queue.insert_many([
+            {**notification, "member_id": f"m{i}", "phone": f"98765432{i:02d}", "status": "pending", **fields}
+            for i, (notification, fields) in enumerate(zip(queue(3), [
+                {"type": "manual", "template": "manual", "next_attempt_at": now + timedelta(hours=4)},
+                {"type": "monthly_reminder", "template": "monthly_reminder"},
+                {"type": "monthly_reminder", "template": "monthly_reminder"},
+            ]))
+        ])
+        await record_sent(db, {"9000000001": 248}, now)
+        await pace_queue(db, now=now)
+        return (
+            {n["id"]: n.get("next_attempt_at") async for n in db.notification_queue.find()},
+            [n["id"] async for n in db.notification_queue.find(claimable_filter(now))],
+        )
+
+    slots, claimable = asyncio.run(scenario())
+
+    # The manual send goes out now, not at 18:00 (its stale slot is dropped)
+    assert claimable == ["g1-n0"] and slots["g1-n0"] is None
+    # 250 - 248 - 1 leaves one reminder for today's evening window
+    assert sorted(local(slots[f"g1-n{i}"]).date().isoformat() for i in (1, 2)) == ["2026-11-01", "2026-11-02"]
@@ -0,0 +1,87 @@
+import asyncio
+from collections import Counter
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+import pytest
+
+from send_pacing import parse_windows, plan_sends
+from sender_pool import assign_senders, assignment_id, sender_numbers_in_use, sender_pool
+
+
+def notifications(gym_id, members, sender="9000000000"):
+    return [
+        {"id": f"n-{member}", "gym_id": gym_id, "member_id": member, "sender_number": sender, "priority": 1}
+        for member in members
+    ]
+
+
+def local_day(slot):
+    return slot.replace(tzinfo=ZoneInfo("UTC")).astimezone(ZoneInfo("Asia/Kolkata")).date()
+
+
+def test_pool_falls_back_to_the_single_sender_number():
+    assert sender_pool({"phone": "9000000000"}) == ["9000000000"]
+    assert sender_pool({"phone": "9000000000", "whatsapp_sender_number": "9111111111"}) == ["9111111111"]
+    assert sender_pool({"phone": "9000000000", "whatsapp_sender_numbers": ["9222222222", "9333333333"]}) == [
+        "9222222222", "9333333333"
+    ]
+
+
+def test_new_members_go_to_the_number_with_the_most_budget_left():
+    queued = notifications("g1", [f"m{i}" for i in range(6)])
+    load = {"A": 4, "B": 0}
+    new_sticky = assign_senders(queued, {"g1": ["A", "B"]}, {}, load)
+
+    assert Counter(n["sender_number"] for n in queued) == {"B": 5, "A": 1}
+    assert load == {"A": 5, "B": 5}
+    assert new_sticky[assignment_id("g1", "m0")] == "B"
+
+
+def test_members_keep_their_sender_while_it_stays_in_the_pool():
+    sticky = {assignment_id("g1", "m1"): "A", assignment_id("g1", "m2"): "removed"}
+    queued = notifications("g1", ["m1", "m2"])
+    new_sticky = assign_senders(queued, {"g1": ["A", "B"]}, sticky, {"A": 100})
+
+    assert [n["sender_number"] for n in queued] == ["A", "B"]
+    assert new_sticky == {assignment_id("g1", "m2"): "B"}
+
+
+def test_single_number_gyms_are_not_tracked():
+    queued = notifications("g1", ["m1"], sender="old-number")
+    assert assign_senders(queued, {"g1": ["9111111111"]}, {}, {}) == {}
+    assert queued[0]["sender_number"] == "9111111111"
+
+
+def test_a_pool_multiplies_a_gyms_daily_throughput():
+    now = datetime(2026, 11, 1, 3, 30)  # 09:00 IST
+    windows = parse_windows("10:00-13:00,18:00-21:00")
+
+    single = notifications("g1", [f"m{i}" for i in range(720)])
+    slots, _ = plan_sends(single, now, {"g1": "Asia/Kolkata"}, {}, windows, per_hour=40, per_day=250)
+    assert len({local_day(slot) for slot in slots.values()}) == 3
+
+    pooled = notifications("g1", [f"m{i}" for i in range(720)])
+    assign_senders(pooled, {"g1": ["A", "B", "C"]}, {}, {})
+    slots, report = plan_sends(pooled, now, {"g1": "Asia/Kolkata"}, {}, windows, per_hour=40, per_day=250)
+    assert len({local_day(slot) for slot in slots.values()}) == 1
+    assert set(report["senders"]) == {"A", "B", "C"}
+
+
+def test_numbers_another_gym_sends_from_are_reported_as_taken():
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+
+    async def scenario():
+        db = mongomock_motor.AsyncMongoMockClient()["gym_saas_test"]
+        await db.gym_owners.insert_many([
+            {"id": "g1", "phone": "9000000001", "whatsapp_sender_number": "9000000001"},
+            {"id": "g2", "phone": "9000000002", "whatsapp_sender_number": "9000000003",
+             "whatsapp_sender_numbers": ["9000000003", "9000000004"]},
+        ])
+        return (
+            await sender_numbers_in_use(db, ["9000000001", "9000000004", "9000000005"], "g3"),
+            # A gym's own numbers are not a conflict
+            await sender_numbers_in_use(db, ["9000000003", "9000000004"], "g2"),
+        )
+
+    assert asyncio.run(scenario()) == (["9000000001", "9000000004"], [])
@@ -0,0 +1,81 @@
+import asyncio
+
+import pytest
+
+import suppression
+from suppression import ALL_GYMS, SuppressionList, handle_inbound, normalize_phone, parse_keyword
+from whatsapp_automation import reminder_pipeline
+
+
+def test_only_bare_keywords_change_the_subscription():
+    assert parse_keyword("STOP") == "opt_out"
+    assert parse_keyword(" stop. ") == "opt_out"
+    assert parse_keyword("Unsubscribe") == "opt_out"
+    assert parse_keyword("start") == "opt_in"
+    assert parse_keyword("Please stop by the desk") is None
+    assert parse_keyword("") is None
+
+
+def test_inbound_numbers_match_stored_member_phones():
+    assert normalize_phone("+91 98765-43210") == "9876543210"
+    assert normalize_phone("919876543210") == "9876543210"
+    assert normalize_phone("9876543210") == "9876543210"
+
+
+def test_suppressed_phones_are_left_out_of_the_reminder_pipeline():
+    _, stages = reminder_pipeline(["g1", "g2"], "2024-05", suppressed={"g1": ["9000000001"]})
+    assert stages[0]["$match"]["phone"] == {"$nin": ["9000000001"]}
+    assert "phone" not in stages[2]["$unionWith"]["pipeline"][0]["$match"]
+
+    _, stages = reminder_pipeline(["g1", "g2"], "2024-05", shared=True, suppressed={"g1": ["9000000001"]})
+    assert stages[0]["$match"]["$nor"] == [{"gym_id": "g1", "phone": {"$in": ["9000000001"]}}]
+
+
+def test_stop_reply_suppresses_the_gym_and_cancels_its_queue(monkeypatch):
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    monkeypatch.setattr(suppression, "suppression_list", SuppressionList())
+
+    async def scenario():
+        db = mongomock_motor.AsyncMongoMockClient()["gym_saas_test"]
+        await db.gym_owners.insert_many([
+            {"id": "g1", "phone": "9000000000", "whatsapp_sender_numbers": ["9111111111", "9222222222"]},
+            {"id": "g2", "phone": "9333333333"},
+        ])
+        await db.notification_queue.insert_many([
+            {"id": "n1", "gym_id": "g1", "phone": "9876543210", "status": "pending"},
+            {"id": "n2", "gym_id": "g2", "phone": "9876543210", "status": "pending"},
+            {"id": "n3", "gym_id": "g1", "phone": "9876543210", "status": "sent"},
+        ])
+
+        # Another process loads the list before the reply arrives
+        other = SuppressionList()
+        await other.refresh(db)
+
+        # The automation client may report the sender number with its country code
+        stop = await handle_inbound(db, "+91 98765 43210", "+91 92222 22222", "STOP")
+        statuses = {n["id"]: n["status"] async for n in db.notification_queue.find()}
+        current = suppression.suppression_list
+        local = current.is_suppressed("g1", "9876543210"), current.is_suppressed("g2", "9876543210")
+        await other.refresh(db, force=True)
+        seen_by_other = other.is_suppressed("g1", "9876543210")
+
+        unknown = await handle_inbound(db, "9876543210", "+919444444444", "stop")
+        anywhere = await handle_inbound(db, "9876543210", None, "stop")
+        ignored = await handle_inbound(db, "9876543210", "9222222222", "Is the gym open on Sunday?")
+        start = await handle_inbound(db, "9876543210", "9222222222", "START")
+        await other.refresh(db, force=True)
+        return stop, statuses, local, seen_by_other, unknown, anywhere, ignored, start, other
+
+    stop, statuses, local, seen_by_other, unknown, anywhere, ignored, start, other = asyncio.run(scenario())
+
+    assert stop == {"phone": "9876543210", "scope": "g1", "suppressed": True, "cancelled": 1, "action": "opt_out"}
+    assert statuses == {"n1": "suppressed", "n2": "pending", "n3": "sent"}
+    assert local == (True, False)
+    assert seen_by_other
+    # A reply to a number no gym owns is not widened to every gym
+    assert unknown["action"] == "unmatched"
+    # One that names no sender number suppresses the phone everywhere
+    assert anywhere["scope"] == ALL_GYMS and anywhere["cancelled"] == 1
+    assert ignored["action"] == "ignored"
+    assert start["suppressed"] is False and start["scope"] == "g1"
+    assert other.phones == {"g1": set(), ALL_GYMS: {"9876543210"}}
@@ -0,0 +1,85 @@
+import asyncio
+
+import pytest
+
+import whatsapp_automation
+from billing import current_period
+from whatsapp_automation import WhatsAppAutomation, reminder_key, reminder_pipeline
+
+PERIOD = "2024-05"
+
+
+def evaluate(expression, document):
+    """Just enough of MongoDB's expression language for the pipeline's _id"""
+    if isinstance(expression, str):
+        return document[expression[1:]] if expression.startswith("$") else expression
+    if "$literal" in expression:
+        return expression["$literal"]
+    if "$concat" in expression:
+        return "".join(evaluate(part, document) for part in expression["$concat"])
+    raise ValueError(expression)
+
+
+async def seed(db, period):
+    await db.gym_owners.insert_one(
+        {"id": "g1", "gym_name": "Iron", "phone": "9000000000", "address": "Main St", "monthly_fee": 1000}
+    )
+    await db.gym_g1_members.insert_one({
+        "id": "m1", "name": "Asha", "phone": "9876543210", "is_active": True,
+        "billing_period": period, "paid_period": None, "current_month_fee": 1000,
+    })
+
+
+def test_pipeline_unions_gyms_joins_owners_and_merges_on_the_reminder_key():
+    collection, stages = reminder_pipeline(["g1", "g2"], PERIOD)
+
+    assert collection == "gym_g1_members"
+    assert [next(iter(stage)) for stage in stages] == [
+        "$match", "$project", "$unionWith", "$lookup", "$unwind", "$project", "$merge",
+    ]
+    assert stages[2]["$unionWith"]["coll"] == "gym_g2_members"
+    assert stages[2]["$unionWith"]["pipeline"][1]["$project"]["gym_id"] == {"$literal": "g2"}
+    assert stages[3]["$lookup"]["from"] == "gym_owners"
+    assert stages[-1]["$merge"] == {
+        "into": "notification_queue", "on": "_id", "whenMatched": "keepExisting", "whenNotMatched": "insert",
+    }
+    # The _id must match the loop's, or the two paths would queue a reminder twice
+    output = stages[-2]["$project"]
+    assert evaluate(output["_id"], {"gym_id": "g1", "id": "m1"}) == reminder_key("g1", "m1", PERIOD)
+
+
+def test_pipeline_writes_the_same_fields_as_the_loop():
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+
+    async def scenario():
+        db = mongomock_motor.AsyncMongoMockClient()["gym_saas_test"]
+        await seed(db, current_period())
+        automation = WhatsAppAutomation()
+        automation.db = automation.read_db = db
+        await automation.generate_monthly_reminders_loop()
+        return await db.notification_queue.find_one({})
+
+    queued = asyncio.run(scenario())
+    _, stages = reminder_pipeline(["g1"], current_period())
+
+    assert set(stages[-2]["$project"]) == set(queued)
+    assert set(stages[-2]["$project"]["params"]) == set(queued["params"])
+    assert queued["_id"] == reminder_key("g1", "m1", current_period())
+
+
+def test_a_failing_pipeline_falls_back_to_the_loop(monkeypatch):
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    monkeypatch.setattr(whatsapp_automation, "REMINDER_GENERATION", "pipeline")
+
+    async def scenario():
+        db = mongomock_motor.AsyncMongoMockClient()["gym_saas_test"]
+        await seed(db, current_period())
+        automation = WhatsAppAutomation()
+        automation.db = automation.read_db = db
+        # mongomock has no $merge, much like a MongoDB older than 5.0
+        with pytest.raises(NotImplementedError):
+            await automation.generate_monthly_reminders_pipeline()
+        return await automation.generate_monthly_reminders(), await db.notification_queue.count_documents({})
+
+    added, queued = asyncio.run(scenario())
+    assert added == 1 and queued == 1